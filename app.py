@@ -1,309 +1,1013 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify
 import numpy as np
-from scipy.linalg import eigvals
-from sklearn.manifold import TSNE
-try:
-    import umap
-    UMAP_AVAILABLE = True
-except ImportError:
-    umap = None
-    UMAP_AVAILABLE = False
-import random
-import itertools
+import functools
+import gzip
 import json
 import logging
+import os
+import queue
+import time
+import zlib
 from datetime import datetime
+from constraints import compile_constraints
+from eigen import build_feature_vectors, complex_to_json, eigenvectors_for
+from binary_format import encode_arrays, CONTENT_TYPE as BINARY_CONTENT_TYPE
+from counting import count_feasible_matrices, feasible_upper_bound
+from enumeration import FeasibleSpace, should_enumerate
+from parallel import sample_in_chunks, eigen_in_chunks
+from jobs import JobManager, QueueFull
+from cache import ResultCache, cache_key, canonical_constraints
+from embedding import Embedding, EmbeddingStore
+from dedup import deduplicate
+from store import ResultStore
+from metrics import Metrics, Timings
+from cost import CostModel, COST_SYNC_SECONDS, COST_MAX_SECONDS, COST_MAX_MEMORY_MB
+from tiles import TilePyramid, TILE_BINS, PLOT_MODES, spectral_radius, use_tiles
+from reducers import (REDUCERS, REDUCTION_LATENCY_BUDGET, DEFAULT_RANDOM_STATE, ALGORITHM_ALIASES, fit_reducer,
+                      min_points, select_reducer, unfitted_model, axis_labels, start_warm_up)
 
 app = Flask(__name__)
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging; DEBUG adds the full cell ranges and constraints of every request
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Upper limit on request bodies in megabytes; larger requests are refused with 413
+MAX_REQUEST_MB = float(os.environ.get('MAX_REQUEST_MB', 1))
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_REQUEST_MB * 1024 * 1024)
+
 def check_constraints(matrix, constraints):
     """Check if a matrix satisfies all constraints"""
-    logger.info(f"Checking {len(constraints)} constraints for matrix of size {matrix.shape}")
-    for i, constraint in enumerate(constraints):
-        cells = constraint['cells']
-        constraint_type = constraint['type']
-        value = constraint['value']
-        
-        # Calculate sum of specified cells
-        cell_sum = sum(matrix[int(cell.split(',')[0])][int(cell.split(',')[1])] for cell in cells)
-        
-        logger.debug(f"Constraint {i}: type={constraint_type}, cells={cells}, value={value}, sum={cell_sum}")
-        
-        # Check constraint based on type
-        if constraint_type == 'sum_greater' and cell_sum < value:
-            logger.debug(f"Constraint {i} failed: sum {cell_sum} < {value}")
-            return False
-        elif constraint_type == 'sum_less' and cell_sum > value:
-            logger.debug(f"Constraint {i} failed: sum {cell_sum} > {value}")
-            return False
-        elif constraint_type == 'sum_equal' and abs(cell_sum - value) > 1e-6:
-            logger.debug(f"Constraint {i} failed: sum {cell_sum} != {value}")
-            return False
-    
-    logger.info("All constraints satisfied")
-    return True
+    matrix = np.asarray(matrix, dtype=float)
+    compiled = compile_constraints(constraints, matrix.shape[0])
+    return bool(compiled.evaluate(matrix[np.newaxis])[0])
+
+def generate_valid_matrices(size, cell_ranges, constraints, num_matrices, sampler_type, seed, space, progress=None,
+                            on_matrices=None, timings=None):
+    """Draw up to num_matrices matrices satisfying the constraints, returning (matrices, attempts)
+
+    on_matrices, if given, is called with batches of accepted matrices as they are drawn.
+    timings, if given, collects the time spent evaluating constraints.
+    """
+    if sampler_type == 'auto':
+        if should_enumerate(space, num_matrices):
+            sampler_type = 'enumerate'
+        elif space['exact'] and 0 < space['acceptance_rate'] and num_matrices / space['acceptance_rate'] > MAX_ATTEMPTS:
+            # Rejection would need more attempts than allowed, so draw straight from the constrained lattice
+            logger.info(f"Acceptance rate {space['acceptance_rate']:.3g} too low for rejection, sampling directly")
+            sampler_type = 'direct'
+        else:
+            sampler_type = 'rejection'
+
+    if sampler_type == 'enumerate':
+        # Small spaces are enumerated: all feasible matrices, or a uniform sample without replacement
+        feasible_space = FeasibleSpace(size, cell_ranges, constraints)
+        logger.info(f"Enumerating feasible space of {len(feasible_space)} matrices")
+        if len(feasible_space) == 0:
+            valid_matrices = np.empty((0, size, size))
+        elif num_matrices >= len(feasible_space):
+            valid_matrices = np.concatenate(list(feasible_space.iterate()))
+        else:
+            valid_matrices = feasible_space.sample(num_matrices, np.random.default_rng(seed))
+        if on_matrices is not None and len(valid_matrices):
+            on_matrices(valid_matrices)
+        return valid_matrices, len(valid_matrices)
+    
+    max_attempts = num_matrices * 10  # Limit attempts to prevent infinite loop
+    # Allow enough attempts for the pessimistic end of the expected acceptance rate
+    low_rate = space['acceptance_interval'][0]
+    if low_rate > 0:
+        max_attempts = max(max_attempts, min(int(np.ceil(num_matrices / low_rate * 2)), MAX_ATTEMPTS))
+    
+    # Candidates are drawn in deterministic seeded chunks, spread over the process pool for large requests
+    if sampler_type == 'direct':
+        # Draw straight from the constrained lattice, so nearly every candidate is accepted
+        prior_rate = 1.0
+    else:
+        prior_rate = space['acceptance_rate']
+    return sample_in_chunks(size, cell_ranges, constraints, num_matrices, sampler_type, seed, prior_rate, max_attempts,
+                            progress, on_matrices, timings)
+
+# Stage durations, generated matrices and HTTP traffic, served by /metrics
+metrics = Metrics()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def limit_request_size():
+    """Refuse oversized bodies before they are read, with the JSON errors the endpoints use"""
+    if request.content_length is not None and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': f'Request body exceeds the limit of {MAX_REQUEST_MB:g} MB'}), 413
+
+@app.after_request
+def record_request(response):
+    """Count the request with its duration and, unless streamed, its size as sent
+
+    Registered before compress_response, so it runs after it and sees the compressed size.
+    """
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    size = None if response.is_streamed else response.content_length
+    metrics.record_request(endpoint, request.method, response.status_code,
+                           time.perf_counter() - g.get('request_started', time.perf_counter()), size)
+    return response
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESSED_BYTES = 1024
+# Low levels compress large JSON nearly as well as the default at a fraction of the time
+COMPRESSION_LEVEL = 3
+
+@app.after_request
+def compress_response(response):
+    """Compress large responses with gzip or deflate when the client accepts it"""
+    if (response.direct_passthrough or response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.content_length is None or response.content_length < MIN_COMPRESSED_BYTES):
+        return response
+    encoding = request.accept_encodings.best_match(['gzip', 'deflate'])
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if encoding == 'gzip':
+        response.set_data(gzip.compress(data, COMPRESSION_LEVEL))
+    else:
+        response.set_data(zlib.compress(data, COMPRESSION_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-def calculate_max_matrices(size, cell_ranges):
-    """Calculate the maximum possible number of matrices based on cell ranges"""
-    total_combinations = 1
-    
-    for i in range(size):
-        for j in range(size):
-            cell_range = cell_ranges[f"{i},{j}"]
-            min_val = cell_range['min']
-            max_val = cell_range['max']
-            step = cell_range['step']
-            
-            # Calculate possible values for this cell
-            if step <= 0:
-                step = 1  # Default to 1 if step is invalid
-            values = len([x for x in np.arange(min_val, max_val + step/2, step)])
-            if values == 0:
-                # If no values in range, just use 1 possibility
-                values = 1
-            total_combinations *= values
-            
-            # Limit to prevent extremely large numbers
-            if total_combinations > 10**10:  # 10 billion max
-                return 10**6  # Return 1 million as a reasonable max
-    
-    # If total combinations is too large, return a reasonable maximum
-    if total_combinations > 10**6:
-        return 10**6
-    return total_combinations
+# Upper limit on the number of matrices a single request may ask for
+MAX_MATRICES = 10**6
+# Upper limit on candidates drawn by rejection sampling in a single request
+MAX_ATTEMPTS = 2 * 10**7
+# Matrix samplers selectable with the 'sampler' field of /generate
+SAMPLERS = ('auto', 'rejection', 'direct', 'enumerate')
+# 'lazy' sends only coordinates; details are then fetched per point from /results/<result_id>/details
+DETAILS_MODES = ('inline', 'lazy')
+# Upper limit on the points a single details request may ask for
+MAX_DETAILS_PAGE = 1000
+
+# Sampled matrices with their eigen data, and reduced coordinates, cached by request parameters
+eigen_cache = ResultCache('eigen')
+coords_cache = ResultCache('coordinates')
+# Fitted embeddings that new matrices can be projected into
+embeddings = EmbeddingStore()
+# Runs kept on disk for reopening
+result_store = ResultStore()
+# Run time and memory predictions, calibrated by every finished analysis
+cost_model = CostModel()
+
+@functools.lru_cache(maxsize=64)
+def _count_space(key):
+    size, cell_ranges, constraints = json.loads(key)
+    return count_feasible_matrices(size, cell_ranges, constraints)
+
+def feasible_space(size, cell_ranges, constraints):
+    """count_feasible_matrices, memoized so estimating and then running a request counts its space once
+
+    The returned dict is shared between callers and must not be modified.
+    """
+    return _count_space(json.dumps([size, cell_ranges, canonical_constraints(constraints)], sort_keys=True))
+
+def calculate_max_matrices(size, cell_ranges, constraints=None):
+    """Calculate the maximum possible number of matrices based on cell ranges and constraints"""
+    space = feasible_space(size, cell_ranges, constraints or [])
+    return min(feasible_upper_bound(space), MAX_MATRICES)
 
 @app.route('/calculate_max_matrices', methods=['POST'])
 def calculate_max_matrices_endpoint():
     try:
         data = request.json
         logger.info(f"Calculate max matrices request received with parameters: size={data['size']}")
-        logger.debug(f"Calculate max matrices request cell_ranges: {data['cell_ranges']}")
-        logger.debug(f"Calculate max matrices request constraints: {data.get('constraints', [])}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Calculate max matrices request cell_ranges: {data['cell_ranges']}")
+            logger.debug(f"Calculate max matrices request constraints: {data.get('constraints', [])}")
         
         size = data['size']
         cell_ranges = data['cell_ranges']
         constraints = data.get('constraints', [])
         
-        max_possible = calculate_max_matrices(size, cell_ranges)
-        
-        # Apply additional constraints to reduce the maximum
-        # This is a simplified calculation - in a real implementation, 
-        # we would need to account for constraint restrictions
-        # For now, we'll just return the raw maximum from cell ranges
-        # since calculating the exact maximum with constraints is complex
+        # Count matrices satisfying the constraints exactly, or estimate them when the space is too large
+        space = feasible_space(size, cell_ranges, constraints)
+        max_possible = min(feasible_upper_bound(space), MAX_MATRICES)
         
         return jsonify({
-            'max_possible': max_possible
+            'max_possible': max_possible,
+            'total_combinations': space['total'],
+            'feasible_count': space['feasible'],
+            'exact': space['exact'],
+            'acceptance_rate': space['acceptance_rate'],
+            'acceptance_rate_interval': list(space['acceptance_interval'])
         })
     except Exception as e:
         logger.error(f"Error in calculate_max_matrices: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/generate', methods=['POST'])
-def generate_matrices():
+class AnalysisError(Exception):
+    """Invalid analysis request, reported to the client with a 400 status"""
+
+class CostExceeded(AnalysisError):
+    """Analysis predicted to exceed the run time or memory budget, carrying the estimate"""
+
+    def __init__(self, message, estimate):
+        super().__init__(message)
+        self.estimate = estimate
+
+def no_progress(stage, done, total):
+    """Progress callback that ignores all reports"""
+
+def sample_and_decompose(size, cell_ranges, constraints, num_matrices, sampler_type, seed, transpose_matrix, progress,
+                         on_eigenvalues=None, vectors=True, timings=None):
+    """Validate the request against the search space, draw the matrices and eigen-decompose them
+
+    on_eigenvalues, if given, is called with the eigenvalues of all matrices
+    as soon as the eigen stage has computed them. With vectors=False
+    only eigenvalues are computed and the eigenvectors returned are None.
+    timings, if given, collects the 'counting', 'sampling', 'constraints'
+    and 'eigen' stages and the numbers of matrices and candidates.
+    """
+    timings = timings or Timings()
+    # Validate that num_matrices doesn't exceed maximum possible
+    with timings.stage('counting'):
+        space = feasible_space(size, cell_ranges, constraints)
+    max_possible = min(feasible_upper_bound(space), MAX_MATRICES)
+    if num_matrices > max_possible:
+        error_msg = f'Requested {num_matrices} matrices but maximum possible with current ranges and constraints is {max_possible}. Please reduce the number of matrices or expand cell ranges.'
+        raise AnalysisError(error_msg)
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Starting matrix generation with cell_ranges: {cell_ranges}")
+        logger.debug(f"Applying constraints: {constraints}")
+    
+    # Generate matrices based on cell ranges and constraints
+    progress('sampling', 0, num_matrices)
     try:
-        data = request.json
-        logger.info(f"Analysis request received with parameters: size={data['size']}, num_matrices={data['num_matrices']}, dimensionality={data['dimensionality']}, eigenvector_selection={data.get('eigenvector_selection', 'all')}, algorithm={data.get('algorithm', 'tsne')}, input_type={data.get('input_type', 'eigenvalues')}, use_imaginary={data.get('use_imaginary', False)}, transpose_matrix={data.get('transpose_matrix', False)}")
+        with timings.stage('sampling'):
+            valid_matrices, attempts = generate_valid_matrices(size, cell_ranges, constraints, num_matrices, sampler_type, seed, space,
+                                                               progress=lambda done, total: progress('sampling', done, total),
+                                                               timings=timings)
+    except ValueError as e:
+        raise AnalysisError(str(e)) from e
+    progress('sampling', len(valid_matrices), num_matrices)
+    timings.count('matrices', len(valid_matrices))
+    timings.count('candidates', attempts)
+    
+    logger.info(f"Generated {len(valid_matrices)} valid matrices out of {attempts} attempts")
+    
+    if len(valid_matrices) < num_matrices:
+        error_msg = f'Could only generate {len(valid_matrices)} out of {num_matrices} requested matrices. Try adjusting constraints or ranges.'
+        raise AnalysisError(error_msg)
+    
+    # Transpose the matrices if requested
+    if transpose_matrix:
+        valid_matrices = valid_matrices.transpose(0, 2, 1)  # Transpose the matrices for analysis
+    
+    # Calculate eigenvalues, and eigenvectors when needed, of all (possibly transposed) matrices at once
+    progress('eigen', 0, len(valid_matrices))
+    with timings.stage('eigen'):
+        all_eigenvalues, all_eigenvectors = eigen_in_chunks(valid_matrices, vectors)
+    progress('eigen', len(valid_matrices), len(valid_matrices))
+    if on_eigenvalues is not None:
+        on_eigenvalues(all_eigenvalues)
+    return valid_matrices, all_eigenvalues, all_eigenvectors
+
+def reduce_dimensions(feature_vectors, algorithm, dimensionality, random_state=None, **options):
+    """Embed feature vectors with the selected backend, returning (coordinates, fitted model or None)
+
+    The model is returned only when it can project new points itself.
+    options are passed on to the backend.
+    """
+    if len(feature_vectors) == 1 and algorithm != 'spectrum':
+        # If there's only one matrix, create coordinates manually
+        logger.info("Only one matrix generated, using origin coordinates")
+        return np.array([[0] * dimensionality]), None  # Single point at origin
+    if len(feature_vectors) < min_points(algorithm, dimensionality):
+        error_msg = f"{algorithm} needs at least {min_points(algorithm, dimensionality)} points for {dimensionality} components, got {len(feature_vectors)}. Please request more matrices or use PCA."
+        raise AnalysisError(error_msg)
+    logger.info(f"Applying {algorithm} dimensionality reduction to {len(feature_vectors)} points with {dimensionality} components")
+    try:
+        return fit_reducer(algorithm, feature_vectors, dimensionality, random_state, **options)
+    except ValueError as e:
+        raise AnalysisError(str(e)) from e
+
+def check_request(algorithm, input_type, sampler_type, details_mode, plot_mode='points', dimensionality=2):
+    """Raise AnalysisError for settings of an analysis request that the server does not support"""
+    if algorithm != 'auto' and algorithm not in REDUCERS:
+        error_msg = f"Unknown algorithm '{algorithm}'. Expected 'auto' or one of: {', '.join(REDUCERS)}."
+        raise AnalysisError(error_msg)
+    if algorithm != 'auto' and not REDUCERS[algorithm]['available']:
+        error_msg = f"Algorithm '{algorithm}' is not available in this installation."
+        raise AnalysisError(error_msg)
+    if algorithm == 'spectrum' and input_type != 'eigenvalues':
+        error_msg = "The spectrum algorithm plots eigenvalues directly and needs input_type 'eigenvalues'. Please use PCA for eigenvectors."
+        raise AnalysisError(error_msg)
+    if sampler_type not in SAMPLERS:
+        error_msg = f"Unknown sampler '{sampler_type}'. Expected one of: {', '.join(SAMPLERS)}."
+        raise AnalysisError(error_msg)
+    if details_mode not in DETAILS_MODES:
+        error_msg = f"Unknown details mode '{details_mode}'. Expected one of: {', '.join(DETAILS_MODES)}."
+        raise AnalysisError(error_msg)
+    check_plot_mode(plot_mode, dimensionality)
+
+def check_plot_mode(plot_mode, dimensionality):
+    """Raise AnalysisError for an unknown plot mode, or for tiles of coordinates that cannot be tiled"""
+    if plot_mode not in PLOT_MODES:
+        error_msg = f"Unknown plot mode '{plot_mode}'. Expected one of: {', '.join(PLOT_MODES)}."
+        raise AnalysisError(error_msg)
+    if plot_mode == 'tiles' and dimensionality not in TILE_BINS:
+        error_msg = f"Density tiles need 2D or 3D coordinates. Please use 'plot': 'points' for {dimensionality}D results."
+        raise AnalysisError(error_msg)
+
+def estimate_analysis(data, sampled=False):
+    """Predicted cost of a /generate payload and whether it would run, be downgraded or be refused
+
+    sampled means its matrices and eigen data are cached, leaving only the reduction to run.
+    """
+    algorithm = data.get('algorithm', 'tsne')
+    algorithm = ALGORITHM_ALIASES.get(algorithm, algorithm)
+    input_type = data.get('input_type', 'eigenvalues')
+    details_mode = data.get('details', 'inline')
+    check_request(algorithm, input_type, data.get('sampler', 'auto'), details_mode, data.get('plot', 'points'),
+                  data['dimensionality'])
+    space = None if sampled else feasible_space(data['size'], data['cell_ranges'], data['constraints'])
+    return cost_model.admit(
+        downgrade=data.get('downgrade', True),  # Default to switching to a faster reducer over budget
+        size=data['size'], num_matrices=data['num_matrices'], dimensionality=data['dimensionality'],
+        input_type=input_type, use_imaginary=data.get('use_imaginary', False), algorithm=algorithm,
+        acceptance_rate=space['acceptance_rate'] if space else 1.0, feasible=space['feasible'] if space else None,
+        details=details_mode, include_vectors=data.get('eigenvectors', False), sampled=sampled,
+        latency_budget=data.get('latency_budget', REDUCTION_LATENCY_BUDGET))
+
+def run_analysis(data, progress=no_progress, on_eigenvalues=None):
+    """Run the sampling, eigen and reduction pipeline for a request and return the response data
+
+    progress is called as progress(stage, done, total) for the 'sampling',
+    'eigen' and 'reduction' stages; an exception it raises aborts the run.
+    on_eigenvalues, if given, is called with the eigenvalues of the result's
+    matrices once they are known, before the reduction has started.
+    Matrices with their eigen data, and reduced coordinates, are cached
+    separately, so changing only the reduction settings skips sampling.
+    Payloads with 'extend_from' add matrices to an existing embedding instead.
+    Stage durations are added to the /metrics registry, and returned in a
+    'timings' field when the payload sets 'timings'.
+    """
+    timings = Timings()
+    if data.get('extend_from'):
+        return extend_analysis(data, progress, on_eigenvalues, timings)
+    
+    logger.info(f"Analysis request received with parameters: size={data['size']}, num_matrices={data['num_matrices']}, dimensionality={data['dimensionality']}, eigenvector_selection={data.get('eigenvector_selection', 'all')}, algorithm={data.get('algorithm', 'tsne')}, input_type={data.get('input_type', 'eigenvalues')}, use_imaginary={data.get('use_imaginary', False)}, transpose_matrix={data.get('transpose_matrix', False)}, sampler={data.get('sampler', 'auto')}")
+    if logger.isEnabledFor(logging.DEBUG):
         logger.debug(f"Analysis request cell_ranges: {data['cell_ranges']}")
         logger.debug(f"Analysis request constraints: {data['constraints']}")
-        
-        size = data['size']
-        num_matrices = data['num_matrices']
-        dimensionality = data['dimensionality']
-        cell_ranges = data['cell_ranges']
-        constraints = data['constraints']
-        eigenvector_selection = data.get('eigenvector_selection', 'all')  # Default to 'all'
-        algorithm = data.get('algorithm', 'tsne')  # Default to 'tsne'
-        input_type = data.get('input_type', 'eigenvalues')  # Default to 'eigenvalues'
-        use_imaginary = data.get('use_imaginary', False)  # Default to False
-        transpose_matrix = data.get('transpose_matrix', False)  # Default to False
-        
-        # Validate that num_matrices doesn't exceed maximum possible
-        max_possible = calculate_max_matrices(size, cell_ranges)
-        if num_matrices > max_possible:
-            error_msg = f'Requested {num_matrices} matrices but maximum possible with current ranges is {max_possible}. Please reduce the number of matrices or expand cell ranges.'
-            logger.warning(error_msg)
-            return jsonify({'error': error_msg}), 400
-        
-        logger.info(f"Generating {num_matrices} matrices of size {size}x{size} with {len(constraints)} constraints, eigenvector selection: {eigenvector_selection}, algorithm: {algorithm}, input_type: {input_type}")
-        
-        # Generate matrices based on cell ranges and constraints
-        valid_matrices = []
-        eigenvalues_list = []
-        eigenvectors_list = []
-        
-        attempts = 0
-        max_attempts = num_matrices * 10  # Limit attempts to prevent infinite loop
-        
-        logger.info(f"Starting matrix generation with cell_ranges: {cell_ranges}")
-        logger.info(f"Applying constraints: {constraints}")
-        
-        while len(valid_matrices) < num_matrices and attempts < max_attempts:
-            # Create a new matrix
-            matrix = np.zeros((size, size))
-            
-            # Fill each cell with a random value within its range
-            for i in range(size):
-                for j in range(size):
-                    cell_range = cell_ranges[f"{i},{j}"]
-                    min_val = cell_range['min']
-                    max_val = cell_range['max']
-                    step = cell_range['step']
-                    
-                    # Calculate possible values
-                    values = np.arange(min_val, max_val + step/2, step)
-                    if len(values) == 0:
-                        # If no values in range, use the min value
-                        matrix[i][j] = min_val
-                    else:
-                        matrix[i][j] = random.choice(values)
-            
-            # Check if matrix satisfies all constraints (on original matrix before transposition)
-            if check_constraints(matrix, constraints):
-                # Transpose the matrix if requested
-                if transpose_matrix:
-                    matrix = matrix.T  # Transpose the matrix for analysis
-                
-                valid_matrices.append(matrix.copy())  # Store a copy of the (possibly transposed) matrix
-                
-                # Calculate eigenvalues and eigenvectors using the (possibly transposed) matrix
-                eigenvalues = eigvals(matrix)
-                # Extract real parts of eigenvalues and handle complex numbers
-                processed_eigenvalues = []
-                for ev in eigenvalues:
-                    if isinstance(ev, complex):
-                        if ev.imag == 0:
-                            processed_eigenvalues.append(float(ev.real))
-                        else:
-                            processed_eigenvalues.append({'real': float(ev.real), 'imag': float(ev.imag)})
-                    else:
-                        processed_eigenvalues.append(float(ev))
-                eigenvalues_list.append(processed_eigenvalues)
-                
-                # Calculate eigenvectors using the (possibly transposed) matrix
-                eigenvals, eigenvecs = np.linalg.eig(matrix)
-                # Convert eigenvectors to lists for JSON serialization and handle complex numbers
-                processed_eigenvectors = []
-                for col in eigenvecs.T:  # Transpose to get column vectors
-                    processed_col = []
-                    for component in col:
-                        if isinstance(component, complex):
-                            if component.imag == 0:
-                                processed_col.append(float(component.real))
-                            else:
-                                processed_col.append({'real': float(component.real), 'imag': float(component.imag)})
-                        else:
-                            processed_col.append(float(component))
-                    processed_eigenvectors.append(processed_col)
-                eigenvectors_list.append(processed_eigenvectors)
-            
-            attempts += 1
-        
-        logger.info(f"Generated {len(valid_matrices)} valid matrices out of {attempts} attempts")
-        
-        if len(valid_matrices) < num_matrices:
-            error_msg = f'Could only generate {len(valid_matrices)} out of {num_matrices} requested matrices. Try adjusting constraints or ranges.'
-            logger.warning(error_msg)
-            return jsonify({'error': error_msg}), 400
-        
-        # Prepare data for dimensionality reduction based on input_type
-        feature_vectors = []
-        
-        if input_type == 'eigenvectors':
-            # Use eigenvectors as input
-            for eigvec_list in eigenvectors_list:
-                # Flatten eigenvectors into a single feature vector
-                vector = []
-                for eigvec in eigvec_list:  # Each eigenvector in the list
-                    for component in eigvec:  # Each component of the eigenvector
-                        if isinstance(component, dict):  # Complex number represented as dict
-                            if use_imaginary:
-                                # Include both real and imaginary parts
-                                vector.extend([component['real'], component['imag']])
-                            else:
-                                # Use only real part
-                                vector.append(component['real'])
-                        else:
-                            vector.append(component)
-                # Pad or truncate to consistent size
-                target_size = size * size * (2 if use_imaginary else 1)  # Account for complex components
-                if len(vector) < target_size:
-                    vector.extend([0] * (target_size - len(vector)))
-                else:
-                    vector = vector[:target_size]
-                feature_vectors.append(vector)
-        else:  # input_type == 'eigenvalues' (default)
-            # Use eigenvalues as input
-            for ev_list in eigenvalues_list:
-                # Pad or truncate eigenvalue lists to fixed size for consistent features
-                vector = []
-                for ev in ev_list:
-                    if isinstance(ev, dict):  # Complex number represented as dict
-                        if use_imaginary:
-                            # Include both real and imaginary parts
-                            vector.extend([ev['real'], ev['imag']])
-                        else:
-                            # Use only real part
-                            vector.append(ev['real'])
-                    else:
-                        vector.append(ev)
-                
-                # Pad with zeros if needed
-                target_size = size * (2 if use_imaginary else 1)  # Account for complex components
-                if len(vector) < target_size:
-                    vector.extend([0] * (target_size - len(vector)))
-                else:
-                    vector = vector[:target_size]
-                feature_vectors.append(vector)
-        
-        feature_vectors = np.array(feature_vectors)
-        
+    
+    size = data['size']
+    num_matrices = data['num_matrices']
+    dimensionality = data['dimensionality']
+    cell_ranges = data['cell_ranges']
+    constraints = data['constraints']
+    eigenvector_selection = data.get('eigenvector_selection', 'all')  # Default to 'all'
+    algorithm = data.get('algorithm', 'tsne')  # Default to 'tsne'
+    algorithm = ALGORITHM_ALIASES.get(algorithm, algorithm)
+    input_type = data.get('input_type', 'eigenvalues')  # Default to 'eigenvalues'
+    use_imaginary = data.get('use_imaginary', False)  # Default to False
+    transpose_matrix = data.get('transpose_matrix', False)  # Default to False
+    seed = data.get('seed')  # Default to fresh entropy
+    sampler_type = data.get('sampler', 'auto')  # Default to 'auto'
+    use_cache = data.get('cache', True)  # Default to reusing cached results
+    details_mode = data.get('details', 'inline')  # Default to sending per-point details with the coordinates
+    latency_budget = data.get('latency_budget', REDUCTION_LATENCY_BUDGET)  # Default to the server's budget in seconds
+    deduplicate_points = data.get('deduplicate', True)  # Default to reducing each distinct feature vector once
+    store_run = data.get('store', True)  # Default to keeping the run in the result store
+    include_vectors = data.get('eigenvectors', False)  # Default to eigenvalues only; details compute vectors per point
+    reproducible = data.get('reproducible', seed is not None)  # Default to a fixed reduction seed for seeded requests
+    plot_mode = data.get('plot', 'points')  # Default to sending the coordinates of every point
+    
+    check_request(algorithm, input_type, sampler_type, details_mode, plot_mode, dimensionality)
+    
+    logger.info(f"Generating {num_matrices} matrices of size {size}x{size} with {len(constraints)} constraints, eigenvector selection: {eigenvector_selection}, algorithm: {algorithm}, input_type: {input_type}")
+    
+    # Eigenvectors roughly double the eigen cost, so they are only computed when the features or the response need them
+    need_vectors = include_vectors or input_type == 'eigenvectors'
+    
+    # Matrices and eigen data depend only on the search space, the sampler and the seed
+    eigen_key = cache_key(size, cell_ranges, canonical_constraints(constraints), num_matrices, sampler_type, transpose_matrix, seed)
+    cached = eigen_cache.get(eigen_key) if use_cache else None
+    
+    # Requests over the run time or memory budget are moved to a faster reducer, or refused
+    estimate = estimate_analysis(data, sampled=cached is not None)
+    if estimate['admission'] == 'reject':
+        error_msg = f"This analysis {estimate['reason']}. Please request fewer matrices, a faster algorithm or 'details': 'lazy'."
+        raise CostExceeded(error_msg, estimate)
+    if estimate['admission'] == 'downgrade':
+        logger.warning(f"Downgrading {estimate['downgraded_from']} to {estimate['algorithm']}: the request {estimate['reason']}")
+        algorithm = estimate['algorithm']
+    
+    if cached is not None:
+        logger.info(f"Reusing cached matrices and eigen data {eigen_key[:12]}")
+        valid_matrices, all_eigenvalues, all_eigenvectors = cached['matrices'], cached['eigenvalues'], cached.get('eigenvectors')
+        if need_vectors and all_eigenvectors is None:
+            progress('eigen', 0, len(valid_matrices))
+            with timings.stage('eigen'):
+                _, all_eigenvectors = eigen_in_chunks(valid_matrices)
+            eigen_cache.put(eigen_key, dict(cached, eigenvectors=all_eigenvectors))
+        progress('eigen', len(valid_matrices), len(valid_matrices))
+        if on_eigenvalues is not None:
+            on_eigenvalues(all_eigenvalues)
+    else:
+        valid_matrices, all_eigenvalues, all_eigenvectors = sample_and_decompose(
+            size, cell_ranges, constraints, num_matrices, sampler_type, seed, transpose_matrix, progress, on_eigenvalues,
+            vectors=need_vectors, timings=timings)
+        entry = {'matrices': valid_matrices, 'eigenvalues': all_eigenvalues}
+        if all_eigenvectors is not None:
+            entry['eigenvectors'] = all_eigenvectors
+        eigen_cache.put(eigen_key, entry)
+    
+    # Apply dimensionality reduction algorithm based on selection, or on the data size and latency budget
+    progress('reduction', 0, len(valid_matrices))
+    # Prepare data for dimensionality reduction based on input_type
+    with timings.stage('features'):
+        feature_vectors = build_feature_vectors(all_eigenvalues, all_eigenvectors, input_type, use_imaginary)
+    
+    # Points with identical features are reduced once and share their coordinates
+    if deduplicate_points:
+        with timings.stage('dedup'):
+            unique_index, inverse, counts = deduplicate(feature_vectors)
+    else:
+        unique_index = inverse = np.arange(len(valid_matrices))
+        counts = np.ones(len(valid_matrices), dtype=int)
+    logger.info(f"{len(unique_index)} unique feature vectors among {len(valid_matrices)} points")
+    
+    if algorithm == 'auto':
+        algorithm = select_reducer(len(unique_index), dimensionality, latency_budget)
+        logger.info(f"Selected {algorithm} for {len(unique_index)} points within a {latency_budget}s budget")
+    if deduplicate_points and len(unique_index) < min_points(algorithm, dimensionality) <= len(valid_matrices):
+        # Too few distinct points for the backend, so every point is reduced instead
+        logger.info(f"{len(unique_index)} unique points are too few for {algorithm}, reducing all {len(valid_matrices)}")
+        unique_index = inverse = np.arange(len(valid_matrices))
+        counts = np.ones(len(valid_matrices), dtype=int)
+    # Without a fixed seed UMAP can run in parallel
+    random_state = DEFAULT_RANDOM_STATE if reproducible else None
+    coords_key = cache_key(eigen_key, algorithm, dimensionality, input_type, use_imaginary, random_state, deduplicate_points)
+    cached = coords_cache.get(coords_key) if use_cache else None
+    if cached is not None:
+        logger.info(f"Reusing cached coordinates {coords_key[:12]}")
+        coords, model = cached['coordinates'], None
+        existing = embeddings.get(coords_key)
+        if existing is not None:
+            model = existing.model
+        else:
+            model = unfitted_model(algorithm, dimensionality, use_imaginary)
+    else:
         logger.info(f"Feature vectors shape: {feature_vectors.shape}, ready for dimensionality reduction using {algorithm}")
+        # The spectrum backend needs to know whether the features hold an imaginary plane
+        options = {'use_imaginary': use_imaginary} if algorithm == 'spectrum' else {}
+        with timings.stage('reduction'):
+            unique_coords, model = reduce_dimensions(feature_vectors[unique_index], algorithm, dimensionality, random_state, **options)
+        coords = unique_coords[inverse]
+        coords_cache.put(coords_key, {'coordinates': coords})
+    
+    # Keep the embedding so later batches can be projected into it
+    params = {'result_id': eigen_key, 'size': size, 'cell_ranges': cell_ranges, 'constraints': constraints,
+              'sampler': sampler_type, 'transpose_matrix': transpose_matrix, 'algorithm': algorithm,
+              'dimensionality': dimensionality, 'input_type': input_type, 'use_imaginary': use_imaginary}
+    embeddings.put(coords_key, Embedding(params, feature_vectors, coords, model))
+    
+    logger.info(f"Dimensionality reduction completed. Output coordinates shape: {coords.shape}")
+    progress('reduction', len(valid_matrices), len(valid_matrices))
+    
+    # Keep the run on disk so it can be reopened without regenerating it
+    if store_run and (cached is None or not result_store.exists(coords_key)):
+        save_run(coords_key, dict(params, num_matrices=num_matrices, seed=seed),
+                 {'algorithm': algorithm, 'points': len(coords), 'unique_points': len(unique_index)},
+                 {'matrices': valid_matrices, 'eigenvalues': all_eigenvalues, 'eigenvectors': all_eigenvectors,
+                  'features': feature_vectors, 'coordinates': coords, 'multiplicity': counts[inverse]})
+    
+    logger.info(f"Analysis completed successfully. Generated {len(coords)} coordinate points, {len(all_eigenvalues)} eigenvalue sets and {len(valid_matrices)} matrices, {'with' if all_eigenvectors is not None else 'without'} eigenvectors")
+    
+    result = {
+        'result_id': eigen_key,  # Handle for fetching per-point details later
+        'embedding_id': coords_key,  # Handle for adding matrices to this embedding later
+        'algorithm': algorithm,  # Backend actually used, after automatic selection
+        'axes': axis_labels(algorithm, dimensionality, use_imaginary),  # Axis titles, or None for unnamed components
+        'unique_points': len(unique_index),  # Number of distinct feature vectors that were reduced
+        'coordinates': coords,
+        'multiplicity': counts[inverse]  # Number of points sharing each point's features
+    }
+    if estimate['admission'] == 'downgrade':
+        result['downgraded_from'] = estimate['downgraded_from']  # Backend requested before the budget check
+    if use_tiles(plot_mode, len(coords), dimensionality):
+        send_tiles(result)
+    if details_mode == 'inline':
+        result.update(point_details(valid_matrices, all_eigenvalues, all_eigenvectors, include_vectors))
+    return finish_timings(result, data, timings, estimate)
+
+def finish_timings(result, data, timings, estimate=None):
+    """Record an analysis's timings in the metrics registry, adding them to the result when requested
+
+    The cost estimate the analysis was admitted with, if any, is calibrated
+    against the measured stages and returned alongside them.
+    """
+    metrics.record_analysis(timings)
+    if estimate is not None:
+        cost_model.observe(estimate, timings.stages)
+    if data.get('timings', False):  # Default to leaving timings out of the response
+        result['timings'] = timings.to_dict()
+        if estimate is not None:
+            result['timings']['estimate'] = estimate['seconds']
+    return result
+
+def extend_analysis(data, progress=no_progress, on_eigenvalues=None, timings=None):
+    """Sample more matrices from the space of an existing embedding and project them into it
+
+    Existing points keep their coordinates. The combined matrices and
+    coordinates are stored as a new result and embedding, so extensions
+    can be chained. on_eigenvalues receives only those of the new matrices.
+    """
+    timings = timings or Timings()
+    embedding_id = data['extend_from']
+    num_matrices = data['num_matrices']
+    details_mode = data.get('details', 'inline')  # Default to sending per-point details with the coordinates
+    include_vectors = data.get('eigenvectors', False)  # Default to eigenvalues only; details compute vectors per point
+    plot_mode = data.get('plot', 'points')  # Default to sending the coordinates of every point
+    # A fresh seed is drawn when none is given, so every extension gets its own result id
+    seed = data.get('seed')
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    
+    if details_mode not in DETAILS_MODES:
+        error_msg = f"Unknown details mode '{details_mode}'. Expected one of: {', '.join(DETAILS_MODES)}."
+        raise AnalysisError(error_msg)
+    embedding = embeddings.get(embedding_id) or stored_embedding(embedding_id)
+    base = load_point_arrays(embedding.params['result_id']) if embedding is not None else None
+    if base is None:
+        raise AnalysisError(f'Unknown or expired embedding {embedding_id}. Please generate the matrices again.')
+    params = embedding.params
+    check_plot_mode(plot_mode, params['dimensionality'])
+    if len(base['matrices']) + num_matrices > MAX_MATRICES:
+        raise AnalysisError(f'Extending by {num_matrices} matrices would exceed the limit of {MAX_MATRICES} matrices per result.')
+    
+    logger.info(f"Extending embedding {embedding_id[:12]} of {len(base['matrices'])} matrices by {num_matrices} matrices")
+    # Eigenvectors are kept for the combined result only when the base result has them
+    keep_vectors = 'eigenvectors' in base
+    new_matrices, new_eigenvalues, new_eigenvectors = sample_and_decompose(
+        params['size'], params['cell_ranges'], params['constraints'], num_matrices, params['sampler'], seed,
+        params['transpose_matrix'], progress, on_eigenvalues, vectors=keep_vectors or params['input_type'] == 'eigenvectors',
+        timings=timings)
+    
+    # Project the new points without refitting
+    progress('reduction', 0, num_matrices)
+    with timings.stage('features'):
+        new_features = build_feature_vectors(new_eigenvalues, new_eigenvectors, params['input_type'], params['use_imaginary'])
+    with timings.stage('reduction'):
+        new_coords = embedding.transform(new_features)
+    progress('reduction', num_matrices, num_matrices)
+    
+    valid_matrices = np.concatenate([base['matrices'], new_matrices])
+    all_eigenvalues = np.concatenate([base['eigenvalues'], new_eigenvalues])
+    all_eigenvectors = np.concatenate([base['eigenvectors'], new_eigenvectors]) if keep_vectors else None
+    coords = np.concatenate([embedding.coordinates, new_coords])
+    
+    eigen_key = cache_key(params['result_id'], 'extend', num_matrices, seed)
+    coords_key = cache_key(eigen_key, params['algorithm'], params['dimensionality'], params['input_type'], params['use_imaginary'], 'extend')
+    entry = {'matrices': valid_matrices, 'eigenvalues': all_eigenvalues}
+    if keep_vectors:
+        entry['eigenvectors'] = all_eigenvectors
+    eigen_cache.put(eigen_key, entry)
+    coords_cache.put(coords_key, {'coordinates': coords})
+    extended = embedding.extended(dict(params, result_id=eigen_key), new_features, new_coords)
+    embeddings.put(coords_key, extended)
+    if data.get('store', True):
+        save_run(coords_key, dict(extended.params, num_matrices=len(coords), extended_from=embedding_id),
+                 {'algorithm': params['algorithm'], 'points': len(coords), 'unique_points': len(coords)},
+                 {'matrices': valid_matrices, 'eigenvalues': all_eigenvalues, 'eigenvectors': all_eigenvectors,
+                  'features': extended.features, 'coordinates': coords})
+    
+    logger.info(f"Extension completed. Result now has {len(coords)} points")
+    
+    result = {
+        'result_id': eigen_key,
+        'embedding_id': coords_key,
+        'algorithm': params['algorithm'],
+        'axes': axis_labels(params['algorithm'], params['dimensionality'], params['use_imaginary']),
+        'coordinates': coords
+    }
+    if use_tiles(plot_mode, len(coords), params['dimensionality']):
+        send_tiles(result)
+    if details_mode == 'inline':
+        result.update(point_details(valid_matrices, all_eigenvalues, all_eigenvectors, include_vectors))
+    return finish_timings(result, data, timings)
+
+def save_run(run_id, params, summary, arrays):
+    """Write a run to the result store, logging rather than failing when the disk is unavailable
+
+    Arrays that are None, such as eigenvectors that were never computed, are left out.
+    """
+    if not result_store.enabled:
+        return
+    try:
+        result_store.save(run_id, dict(summary, request=params), {name: array for name, array in arrays.items() if array is not None})
+    except OSError as e:
+        logger.warning(f"Could not store run {run_id[:12]}: {str(e)}")
+
+def stored_embedding(run_id):
+    """Rebuild the embedding of a stored run, such as one made by another server process, or None
+
+    Reducers that need fitting are not stored, so new points are placed by interpolation.
+    """
+    try:
+        manifest = result_store.manifest(run_id)
+    except KeyError:
+        return None
+    if manifest is None:
+        return None
+    arrays = result_store.load(run_id, ['features', 'coordinates'])
+    params = dict(manifest['request'], result_id=run_id)
+    model = unfitted_model(params['algorithm'], params['dimensionality'], params['use_imaginary'])
+    embedding = Embedding(params, arrays['features'], arrays['coordinates'], model)
+    embeddings.put(run_id, embedding)
+    return embedding
+
+def tile_pyramid(embedding_id):
+    """Density tiles of an embedding, built on first use, or None when the embedding or its eigenvalues are gone"""
+    embedding = embeddings.get(embedding_id) or stored_embedding(embedding_id)
+    if embedding is None:
+        return None
+    if embedding.pyramid is None:
+        arrays = load_point_arrays(embedding.params['result_id'])
+        if arrays is None:
+            return None
+        embedding.pyramid = TilePyramid(embedding.coordinates, spectral_radius(arrays['eigenvalues']))
+    return embedding.pyramid
+
+def send_tiles(result):
+    """Replace the per-point coordinates of a result with the summary of its density tiles
+
+    The client then fetches the tiles in view from /embeddings/<embedding_id>/tiles.
+    """
+    result['tiles'] = tile_pyramid(result['embedding_id']).summary()
+    del result['coordinates']
+    result.pop('multiplicity', None)  # Bins report how many points they hold instead
+
+def load_point_arrays(result_id):
+    """Matrices and eigen data of a result, from the cache or memory-mapped from the result store
+
+    'eigenvectors' is missing when only eigenvalues were computed.
+    """
+    cached = eigen_cache.get(result_id)
+    if cached is not None:
+        return cached
+    try:
+        # Reopened runs use their run id as result id; other results are found through their run's manifest
+        run_id = result_id if result_store.exists(result_id) else result_store.run_for_result(result_id)
+    except KeyError:
+        return None
+    if run_id is None:
+        return None
+    return result_store.load(run_id, ['matrices', 'eigenvalues', 'eigenvectors'])
+
+def point_details(matrices, eigenvalues, eigenvectors=None, include_vectors=True):
+    """Per-point matrices and eigen data as returned to the client
+
+    Eigenvectors that were not kept are computed here, for just these points.
+    """
+    details = {
+        'eigenvalues': eigenvalues,
+        'matrices': matrices  # Include the original matrices
+    }
+    if include_vectors:
+        if eigenvectors is None:
+            eigenvectors = eigenvectors_for(matrices, eigenvalues)
+        details['eigenvectors'] = eigenvectors.transpose(0, 2, 1)  # One row per eigenvector
+    return details
+
+# Coordinates only feed the plot, so the binary format sends them in single precision
+BINARY_DTYPES = {'coordinates': 'float32'}
+
+def result_to_json(result):
+    """Convert analysis result arrays to lists for JSON serialization"""
+    return {name: complex_to_json(value) if isinstance(value, np.ndarray) else value for name, value in result.items()}
+
+def wants_binary(data=None):
+    """Check if the client asked for the binary result format, in the payload, query string or Accept header"""
+    if (data or {}).get('format', request.args.get('format')) == 'binary':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', BINARY_CONTENT_TYPE]) == BINARY_CONTENT_TYPE
+
+def analysis_response(result, binary):
+    """Encode an analysis result as JSON, or in the compact binary format
+
+    The encoding time is recorded as the 'serialization' stage and sent, with
+    the pipeline stages of results carrying timings, in a Server-Timing header.
+    """
+    start = time.perf_counter()
+    if binary:
+        arrays = {name: value for name, value in result.items() if isinstance(value, np.ndarray)}
+        metadata = {name: value for name, value in result.items() if name not in arrays}
+        response = Response(encode_arrays(arrays, BINARY_DTYPES, metadata), mimetype=BINARY_CONTENT_TYPE)
+    else:
+        response = jsonify(result_to_json(result))
+    seconds = time.perf_counter() - start
+    metrics.record_stage('serialization', seconds)
+    stages = dict(result.get('timings', {}).get('stages', {}), serialization=seconds)
+    response.headers['Server-Timing'] = ', '.join(f'{name};dur={value * 1000:.1f}' for name, value in stages.items())
+    return response
+
+@app.route('/generate', methods=['POST'])
+def generate_matrices():
+    try:
+        data = request.json
+        # Long analyses are queued as jobs rather than holding the request open, unless the client opts out
+        if not data.get('extend_from') and data.get('queue', True):
+            estimate = estimate_analysis(data)
+            if estimate['admission'] != 'reject' and estimate['total_seconds'] > COST_SYNC_SECONDS:
+                job = jobs.submit(data)
+                logger.info(f"Queued analysis job {job.id}, estimated at {estimate['total_seconds']:.0f}s")
+                return jsonify(dict(job.to_dict(), estimate=estimate)), 202
+        return analysis_response(run_analysis(data), wants_binary(data))
+    except QueueFull as e:
+        logger.warning(str(e))
+        return jsonify({'error': str(e)}), 429
+    except CostExceeded as e:
+        logger.warning(str(e))
+        return jsonify({'error': str(e), 'estimate': e.estimate}), 400
+    except AnalysisError as e:
+        logger.warning(str(e))
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in generate_matrices: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+# Long analyses run as background jobs that the client polls for progress
+jobs = JobManager(run_analysis, client_errors=(AnalysisError,))
+
+@app.route('/estimate', methods=['POST'])
+def estimate_endpoint():
+    """Predicted run time and memory of a /generate payload, without running it"""
+    try:
+        estimate = estimate_analysis(request.json)
+        # Only admitted analyses are queued; refused ones never run
+        queued = estimate['admission'] != 'reject' and estimate['total_seconds'] > COST_SYNC_SECONDS
+        return jsonify(dict(estimate, queued=queued,
+                            limits={'seconds': COST_MAX_SECONDS, 'memory_mb': COST_MAX_MEMORY_MB, 'sync_seconds': COST_SYNC_SECONDS}))
+    except AnalysisError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in estimate: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/results/<result_id>/details', methods=['GET', 'POST'])
+def result_details(result_id):
+    try:
+        cached = load_point_arrays(result_id)
+        if cached is None:
+            return jsonify({'error': f'Unknown or expired result {result_id}. Please generate the matrices again.'}), 404
+        count = len(cached['matrices'])
         
-        # Apply dimensionality reduction algorithm based on selection
-        if len(valid_matrices) == 1:
-            # If there's only one matrix, create coordinates manually
-            coords = np.array([[0] * dimensionality])  # Single point at origin
-            logger.info("Only one matrix generated, using origin coordinates")
+        # Points are selected by an index list (query string or JSON body) or by a start/stop page range
+        data = request.get_json(silent=True) or {}
+        if 'indices' in data or 'indices' in request.args:
+            if 'indices' in data:
+                indices = [int(i) for i in data['indices']]
+            else:
+                indices = [int(i) for i in request.args['indices'].split(',') if i]
         else:
-            if algorithm == 'umap':
-                logger.info(f"Applying UMAP dimensionality reduction with {dimensionality} components")
-                reducer = umap.UMAP(n_components=dimensionality, random_state=42)
-                coords = reducer.fit_transform(feature_vectors)
-            else:  # algorithm == 'tsne' (default)
-                perplexity_val = min(30, max(1, len(valid_matrices)-1))  # Ensure perplexity is at least 1 and less than n_samples
-                logger.info(f"Applying t-SNE dimensionality reduction with {dimensionality} components and perplexity {perplexity_val}")
-                tsne = TSNE(n_components=dimensionality, random_state=42, perplexity=perplexity_val)
-                coords = tsne.fit_transform(feature_vectors)
-        
-        logger.info(f"Dimensionality reduction completed. Output coordinates shape: {coords.shape}")
-        
-        # Convert to list for JSON serialization
-        coords_list = coords.tolist()
+            start = int(request.args.get('start', data.get('start', 0)))
+            stop = min(int(request.args.get('stop', data.get('stop', start + MAX_DETAILS_PAGE))), count)
+            indices = list(range(start, stop))
+        if len(indices) > MAX_DETAILS_PAGE:
+            return jsonify({'error': f'At most {MAX_DETAILS_PAGE} points can be requested at once'}), 400
+        if any(i < 0 or i >= count for i in indices):
+            return jsonify({'error': f'Point indices must be between 0 and {count - 1}'}), 400
         
-        # Convert matrices to lists for JSON serialization
-        matrices_list = [matrix.tolist() for matrix in valid_matrices]
+        eigenvectors = cached['eigenvectors'][indices] if 'eigenvectors' in cached else None
+        details = point_details(cached['matrices'][indices], cached['eigenvalues'][indices], eigenvectors)
+        return analysis_response(dict(details, indices=np.array(indices, dtype=int), count=count), wants_binary(data))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid point selection: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error in result_details: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/embeddings/<embedding_id>/tiles', methods=['GET'])
+def embedding_tiles(embedding_id):
+    """Bounds and grid sizes of an embedding's density tiles"""
+    pyramid = tile_pyramid(embedding_id)
+    if pyramid is None:
+        return jsonify({'error': f'Unknown or expired embedding {embedding_id}. Please generate the matrices again.'}), 404
+    return jsonify(pyramid.summary())
+
+@app.route('/embeddings/<embedding_id>/tiles/<int:level>/<int:x>/<int:y>', methods=['GET'])
+@app.route('/embeddings/<embedding_id>/tiles/<int:level>/<int:x>/<int:y>/<int:z>', methods=['GET'])
+def embedding_tile(embedding_id, level, x, y, z=None):
+    """Points, or per-bin counts, centroids and mean spectral radius, of one tile"""
+    try:
+        pyramid = tile_pyramid(embedding_id)
+        if pyramid is None:
+            return jsonify({'error': f'Unknown or expired embedding {embedding_id}. Please generate the matrices again.'}), 404
+        index = [x, y] if z is None else [x, y, z]
+        return analysis_response(pyramid.tile(level, index), wants_binary())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in embedding_tile: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/runs', methods=['GET'])
+def list_runs():
+    try:
+        runs = result_store.list()
+        return jsonify({'runs': [{name: value for name, value in run.items() if name != 'arrays'} for run in runs]})
+    except Exception as e:
+        logger.error(f"Error in list_runs: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/runs/<run_id>', methods=['GET'])
+def open_run(run_id):
+    try:
+        manifest = result_store.manifest(run_id)
+    except KeyError:
+        manifest = None
+    if manifest is None:
+        return jsonify({'error': f'Unknown run {run_id}'}), 404
+    try:
+        details_mode = request.args.get('details', 'inline')
+        include_vectors = request.args.get('eigenvectors') == 'true'
+        plot_mode = request.args.get('plot', 'points')
+        arrays = result_store.load(run_id)
         
-        logger.info(f"Analysis completed successfully. Generated {len(coords_list)} coordinate points, {len(eigenvalues_list)} eigenvalue sets, {len(matrices_list)} matrices, and {len(eigenvectors_list)} eigenvector sets")
+        # Reopened runs can be extended again, by interpolation when the fitted reducer is gone
+        params = dict(manifest['request'], result_id=run_id)
+        if embeddings.get(run_id) is None:
+            stored_embedding(run_id)
         
-        return jsonify({
-            'coordinates': coords_list,
-            'eigenvalues': eigenvalues_list,
-            'matrices': matrices_list,  # Include the original matrices
-            'eigenvectors': eigenvectors_list  # Include the eigenvectors
-        })
+        result = {
+            'result_id': run_id,  # Details are served from the stored arrays
+            'embedding_id': run_id,
+            'algorithm': manifest['algorithm'],
+            'axes': axis_labels(params['algorithm'], params['dimensionality'], params['use_imaginary']),
+            'unique_points': manifest['unique_points'],
+            'coordinates': np.asarray(arrays['coordinates'])
+        }
+        if 'multiplicity' in arrays:
+            result['multiplicity'] = np.asarray(arrays['multiplicity'])
+        if use_tiles(plot_mode, manifest['points'], params['dimensionality']):
+            send_tiles(result)
+        if details_mode == 'inline':
+            result.update(point_details(arrays['matrices'], arrays['eigenvalues'], arrays.get('eigenvectors'), include_vectors))
+        logger.info(f"Reopened stored run {run_id[:12]} with {manifest['points']} points")
+        return analysis_response(result, wants_binary())
     except Exception as e:
-        logger.error(f"Error in generate_matrices: {str(e)}", exc_info=True)
+        logger.error(f"Error in open_run: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/runs/<run_id>', methods=['DELETE'])
+def delete_run(run_id):
+    try:
+        deleted = result_store.delete(run_id)
+    except KeyError:
+        deleted = False
+    if not deleted:
+        return jsonify({'error': f'Unknown run {run_id}'}), 404
+    return jsonify({'deleted': run_id})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'eigen': eigen_cache.stats(),
+        'coordinates': coords_cache.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage durations, counters and cache and job gauges in the Prometheus text format"""
+    caches = {'eigen': eigen_cache.stats(), 'coordinates': coords_cache.stats()}
+    extra = {
+        'cache_entries': ('gauge', 'Entries held in memory by each result cache',
+                          {f'cache="{name}"': stats['entries'] for name, stats in caches.items()}),
+        'cache_bytes': ('gauge', 'Bytes held in memory by each result cache',
+                        {f'cache="{name}"': stats['bytes'] for name, stats in caches.items()}),
+        'cache_hits_total': ('counter', 'Lookups served by each result cache, from memory or disk',
+                             {f'cache="{name}"': stats['hits'] + stats['disk_hits'] for name, stats in caches.items()}),
+        'cache_misses_total': ('counter', 'Lookups each result cache could not serve',
+                               {f'cache="{name}"': stats['misses'] for name, stats in caches.items()}),
+        'jobs': ('gauge', 'Known analysis jobs by status',
+                 {f'status="{status}"': count for status, count in jobs.status_counts().items()})
+    }
+    return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        job = jobs.submit(request.json)
+    except QueueFull as e:
+        logger.warning(str(e))
+        return jsonify({'error': str(e)}), 429
+    logger.info(f"Queued analysis job {job.id}")
+    return jsonify(job.to_dict()), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown or expired job {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown or expired job {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = jobs.get(job_id, with_result=True)
+    if job is None:
+        return jsonify({'error': f'Unknown or expired job {job_id}'}), 404
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 400 if job.client_error else 500
+    if job.status != 'done':
+        return jsonify(dict(job.to_dict(), error=f'Job is {job.status}, no result available')), 409
+    return analysis_response(job.result, wants_binary())
+
+# Matrices per 'eigenvalues' line of a stream
+STREAM_CHUNK = 2000
+# Eigenvalues streamed for the live preview; the spectra of larger results are only sent in part
+STREAM_PREVIEW_EIGENVALUES = 200000
+# Seconds between progress lines of a stream
+STREAM_PROGRESS_INTERVAL = 0.5
+# Seconds a stream waits for new lines before checking whether its job has finished
+STREAM_POLL_INTERVAL = 0.05
+
+def stream_line(event, **fields):
+    """Encode one stream event as a line of JSON"""
+    return json.dumps(dict(fields, event=event)) + '\n'
+
+def stream_events(job, events):
+    """Yield a job's eigenvalues, progress and final result as NDJSON lines
+
+    Closing the stream early, as when the client disconnects, cancels the job.
+    """
+    try:
+        yield stream_line('job', **job.to_dict())
+        last_progress = time.time()
+        while True:
+            try:
+                yield events.get(timeout=STREAM_POLL_INTERVAL)
+                continue
+            except queue.Empty:
+                pass
+            # Lines are queued before the job finishes, so none are left once it has
+            if job.finished is not None and events.empty():
+                break
+            if time.time() - last_progress >= STREAM_PROGRESS_INTERVAL:
+                yield stream_line('progress', **job.to_dict())
+                last_progress = time.time()
+        
+        if job.status == 'done':
+            yield stream_line('result', **result_to_json(job.result))
+        elif job.status == 'failed':
+            yield stream_line('error', error=job.error, status=400 if job.client_error else 500)
+        else:
+            yield stream_line('cancelled', **job.to_dict())
+    finally:
+        if job.finished is None:
+            jobs.cancel(job.id)
+
+@app.route('/stream', methods=['POST'])
+def stream_analysis():
+    """Run an analysis as a job, streaming the eigenvalues of its matrices before the reduction finishes"""
+    data = dict(request.json)
+    # The client plots the streamed spectra and fetches details of points on demand, so the result defaults to coordinates only
+    data.setdefault('details', 'lazy')
+    # Holds at most STREAM_PREVIEW_EIGENVALUES eigenvalues in lines of STREAM_CHUNK matrices
+    events = queue.Queue()
+    
+    def on_eigenvalues(eigenvalues):
+        preview = eigenvalues[:STREAM_PREVIEW_EIGENVALUES // eigenvalues.shape[1]]
+        for start in range(0, len(preview), STREAM_CHUNK):
+            events.put(stream_line('eigenvalues', offset=start, total=len(eigenvalues),
+                                   eigenvalues=complex_to_json(preview[start:start + STREAM_CHUNK])))
+    
+    try:
+        job = jobs.submit(data, on_eigenvalues=on_eigenvalues)
+    except QueueFull as e:
+        logger.warning(str(e))
+        return jsonify({'error': str(e)}), 429
+    logger.info(f"Streaming analysis job {job.id}")
+    response = Response(stream_events(job, events), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop reverse proxies from holding back lines
+    return response
+
 if __name__ == '__main__':
     logger.info("Starting Radiation Protection Shield Analyzer server on port 5000")
+    # The reloader runs this twice; only its child process, which serves requests, warms up
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warm_up()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the stages of the /generate pipeline
+
+Every case times counting, sampling, constraint checking, eigen-decomposition
+(with and without eigenvectors), feature building, deduplication, each
+reduction backend and JSON and binary serialization separately, taking the
+best of several repeats. Cases cover a grid of matrix sizes, matrix counts
+and constraint tightness levels, plus the presets of the web interface.
+Results are written as JSON so runs can be compared between commits:
+
+    python benchmark.py --quick --output before.json
+    python benchmark.py --quick --output after.json --compare before.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import generate_valid_matrices, result_to_json, BINARY_DTYPES
+from binary_format import encode_arrays
+from constraints import compile_constraints
+from counting import count_feasible_matrices
+from dedup import deduplicate
+from eigen import build_feature_vectors
+from parallel import WORKERS, eigen_in_chunks
+from reducers import REDUCERS, fit_reducer
+from sampling import MatrixSampler
+
+SIZES = (2, 3, 4, 6, 8, 10)
+COUNTS = (100, 1000, 10000, 100000)
+# Approximate share of uniformly drawn candidates that satisfy the constraint
+TIGHTNESS = {'none': None, 'loose': 0.5, 'tight': 0.05, 'very_tight': 0.005}
+QUICK_SIZES = (2, 3, 5)
+QUICK_COUNTS = (100, 1000)
+QUICK_TIGHTNESS = ('none', 'tight')
+# Cell grid of the size/count/tightness cases
+GRID_RANGE = {'min': -5, 'max': 5, 'step': 0.5}
+PRESET_SIZE = 3
+# Reducers are skipped above these numbers of distinct points; the rest scale to any count
+REDUCTION_LIMITS = {'tsne': 5000, 'fft_tsne': 50000, 'umap': 20000}
+DEFAULT_REDUCERS = ('spectrum', 'randomized_pca', 'pca', 'tsne', 'umap')
+# Constraint checking is timed on at most this many candidates
+MAX_CONSTRAINT_CANDIDATES = 10**6
+# Stages faster than this are too noisy to flag as regressions
+MIN_COMPARED_SECONDS = 0.01
+REGRESSION_THRESHOLD = 1.25
+BENCHMARK_SEED = 0
+
+# (min, max, step) of each layer row, as set by the presets in index.html; rows beyond the layers are fixed at 0
+PRESETS = {
+    'aluminum': [(1, 5, 0.5), (2, 8, 0.5), (1, 5, 0.5)],
+    'leadconcrete': [(2, 10, 0.5), (5, 20, 0.5), (10, 50, 1)],
+    'multilayer': [(1, 10, 0.5), (2, 15, 0.5), (1, 10, 0.5), (0.5, 5, 0.5)],
+    'threeLayerShield': [(1, 10, 0.5), (2, 15, 0.5), (1, 10, 0.5)],
+    'spacecraft': [(0.5, 3, 0.1), (1, 5, 0.1), (0.5, 2, 0.1)],
+    'reactor': [(5, 20, 1), (10, 30, 1), (20, 50, 1)],
+}
+
+
+def preset_ranges(name, size):
+    """Cell ranges a preset sets for a matrix size"""
+    layers = PRESETS[name]
+    cell_ranges = {}
+    for i in range(size):
+        low, high, step = layers[i] if i < len(layers) else (0, 0, 1)
+        for j in range(size):
+            cell_ranges[f"{i},{j}"] = {'min': low, 'max': high, 'step': step}
+    return cell_ranges
+
+
+def preset_constraints(name, size):
+    """Constraints a preset adds, as the 3-layer shield does"""
+    if name != 'threeLayerShield' or size < 3:
+        return []
+    row = lambda i: [f"{i},{j}" for j in range(size)]
+    return [
+        {'cells': row(0) + row(1) + row(2), 'type': 'sum_less', 'value': 30},  # Max 30 cm total thickness
+        {'cells': row(1), 'type': 'sum_greater', 'value': 2},  # At least 2 cm for the heavy layer
+        {'cells': row(0), 'type': 'sum_greater', 'value': 0.5},
+        {'cells': row(2), 'type': 'sum_greater', 'value': 0.5}
+    ]
+
+
+def tightness_constraints(size, cell_ranges, acceptance):
+    """A lower bound on the trace that roughly the given share of candidates satisfies"""
+    if acceptance is None:
+        return []
+    diagonal = [f"{i},{i}" for i in range(size)]
+    candidates = MatrixSampler(size, cell_ranges, seed=BENCHMARK_SEED).sample(100000)
+    traces = np.trace(candidates, axis1=1, axis2=2)
+    return [{'cells': diagonal, 'type': 'sum_greater', 'value': float(np.quantile(traces, 1 - acceptance))}]
+
+
+def best_time(function, repeat):
+    """Best wall time of several calls, with the result of the last one"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_case(name, size, cell_ranges, constraints, count, reducers=DEFAULT_REDUCERS, repeat=3):
+    """Time every pipeline stage for one case, returning a JSON-ready dict
+
+    Reducers above their point limit are recorded as None, and cases that
+    cannot produce count matrices are marked 'skipped' after the sampling.
+    """
+    stages = {}
+    case = {'case': name, 'size': size, 'count': count, 'constraints': len(constraints), 'stages': stages}
+
+    stages['counting'], space = best_time(lambda: count_feasible_matrices(size, cell_ranges, constraints), repeat)
+    case['acceptance_rate'] = space['acceptance_rate']
+    if count > space['feasible']:
+        case['skipped'] = f"only {space['feasible']} feasible matrices"
+        return case
+
+    seconds, (matrices, attempts) = best_time(
+        lambda: generate_valid_matrices(size, cell_ranges, constraints, count, 'auto', BENCHMARK_SEED, space), repeat)
+    stages['sampling'] = seconds
+    case['accepted'], case['attempts'] = len(matrices), attempts
+    if len(matrices) < count:
+        case['skipped'] = f'sampling accepted only {len(matrices)} matrices'
+        return case
+
+    compiled = compile_constraints(constraints, size)
+    candidates = MatrixSampler(size, cell_ranges, seed=BENCHMARK_SEED).sample(min(max(attempts, count), MAX_CONSTRAINT_CANDIDATES))
+    stages['constraints'], _ = best_time(lambda: compiled.evaluate(candidates), repeat)
+    case['constraint_candidates'] = len(candidates)
+
+    stages['eigen'], (eigenvalues, _) = best_time(lambda: eigen_in_chunks(matrices, vectors=False), repeat)
+    stages['eigenvectors'], (_, eigenvectors) = best_time(lambda: eigen_in_chunks(matrices), repeat)
+    stages['features'], features = best_time(lambda: build_feature_vectors(eigenvalues, None, 'eigenvalues', True), repeat)
+    stages['dedup'], (unique_index, inverse, _) = best_time(lambda: deduplicate(features), repeat)
+    case['unique_points'] = len(unique_index)
+
+    coords = np.zeros((len(matrices), 2))
+    for reducer in reducers:
+        if not REDUCERS[reducer]['available'] or len(unique_index) > REDUCTION_LIMITS.get(reducer, float('inf')):
+            stages[f'reduction.{reducer}'] = None
+            continue
+        # Nonlinear reducers are too slow to repeat
+        runs = repeat if REDUCERS[reducer]['per_point'] < 1e-4 else 1
+        options = {'use_imaginary': True} if reducer == 'spectrum' else {}
+        seconds, (unique_coords, _) = best_time(
+            lambda: fit_reducer(reducer, features[unique_index], 2, BENCHMARK_SEED, **options), runs)
+        stages[f'reduction.{reducer}'] = seconds
+        coords = unique_coords[inverse]
+
+    result = {'coordinates': coords, 'eigenvalues': eigenvalues, 'matrices': matrices,
+              'eigenvectors': eigenvectors.transpose(0, 2, 1)}
+    stages['serialize_json'], body = best_time(lambda: json.dumps(result_to_json(result)), repeat)
+    case['json_bytes'] = len(body)
+    stages['serialize_binary'], body = best_time(lambda: encode_arrays(result, BINARY_DTYPES), repeat)
+    case['binary_bytes'] = len(body)
+    return case
+
+
+def build_cases(sizes, counts, tightness, presets):
+    """(name, size, cell_ranges, constraints, count) of every case to run"""
+    cases = []
+    for size in sizes:
+        cell_ranges = {f"{i},{j}": dict(GRID_RANGE) for i in range(size) for j in range(size)}
+        for level in tightness:
+            constraints = tightness_constraints(size, cell_ranges, TIGHTNESS[level])
+            for count in counts:
+                cases.append((f'grid/{size}x{size}/{level}/{count}', size, cell_ranges, constraints, count))
+    for preset in presets:
+        for count in counts:
+            cases.append((f'preset/{preset}/{count}', PRESET_SIZE, preset_ranges(preset, PRESET_SIZE),
+                          preset_constraints(preset, PRESET_SIZE), count))
+    return cases
+
+
+def environment():
+    """Versions and hardware the results were measured with"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'matrix_workers': WORKERS
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Stage timings that got slower than the baseline by more than threshold, as (case, stage, old, new)"""
+    old_cases = {case['case']: case for case in baseline['results']}
+    regressions = []
+    for case in results['results']:
+        old = old_cases.get(case['case'])
+        if old is None:
+            continue
+        for stage, seconds in case['stages'].items():
+            previous = old['stages'].get(stage)
+            if seconds is None or previous is None or max(seconds, previous) < MIN_COMPARED_SECONDS:
+                continue
+            if seconds > previous * threshold:
+                regressions.append((case['case'], stage, previous, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the /generate pipeline')
+    parser.add_argument('--quick', action='store_true', help='small grid of sizes, counts and tightness levels')
+    parser.add_argument('--sizes', type=int, nargs='+', help=f'matrix sizes (default: {SIZES})')
+    parser.add_argument('--counts', type=int, nargs='+', help=f'matrix counts (default: {COUNTS})')
+    parser.add_argument('--tightness', nargs='+', choices=list(TIGHTNESS), help='constraint tightness levels (default: all)')
+    parser.add_argument('--presets', nargs='*', choices=list(PRESETS), help='web interface presets (default: all)')
+    parser.add_argument('--reducers', nargs='*', choices=list(REDUCERS), default=list(DEFAULT_REDUCERS))
+    parser.add_argument('--repeat', type=int, default=3, help='repeats per stage, the best is kept (default: 3)')
+    parser.add_argument('--output', default='benchmark_results.json', help='file for the JSON results')
+    parser.add_argument('--compare', help='earlier results to check for regressions')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help=f'slowdown ratio reported as a regression (default: {REGRESSION_THRESHOLD})')
+    args = parser.parse_args()
+
+    # The app logs every request at DEBUG level, which would swamp the report
+    logging.getLogger().setLevel(logging.WARNING)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    counts = args.counts or (QUICK_COUNTS if args.quick else COUNTS)
+    tightness = args.tightness or (QUICK_TIGHTNESS if args.quick else list(TIGHTNESS))
+    presets = list(PRESETS) if args.presets is None else args.presets
+    cases = build_cases(sizes, counts, tightness, presets)
+
+    results = {'environment': environment(), 'results': []}
+    for k, (name, size, cell_ranges, constraints, count) in enumerate(cases):
+        case = run_case(name, size, cell_ranges, constraints, count, args.reducers, args.repeat)
+        results['results'].append(case)
+        timings = ', '.join(f'{stage} {seconds * 1000:.1f}ms' for stage, seconds in case['stages'].items() if seconds is not None)
+        print(f"[{k + 1}/{len(cases)}] {name}: {case.get('skipped', timings)}")
+        # Written after every case so an interrupted run keeps what it measured
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, stage, previous, seconds in regressions:
+            print(f"REGRESSION {name} {stage}: {previous:.4f}s -> {seconds:.4f}s ({seconds / previous:.2f}x)")
+        print(f"{len(regressions)} regressions against {baseline['environment'].get('commit') or args.compare}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
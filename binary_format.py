@@ -0,0 +1,85 @@
+"""
+Compact binary encoding of analysis results
+
+Layout, all integers little-endian:
+
+    magic      4 bytes  b'CMVB'
+    version    uint32
+    length     uint32   byte length of the JSON header
+    header     JSON     {"arrays": [{"name", "dtype", "shape", "complex", "offset", "nbytes"}, ...],
+                         "metadata": {...}}
+    padding    to a multiple of 8 bytes
+    data       one little-endian plane per array, each starting on an 8-byte boundary
+
+Offsets are relative to the start of the data section. A complex array is
+stored as two planes of nbytes each: its real part at offset, followed by
+its imaginary part at the next 8-byte boundary. Complex arrays without
+imaginary parts are stored as real arrays, as in the JSON encoding.
+"""
+import json
+import struct
+import numpy as np
+
+MAGIC = b'CMVB'
+VERSION = 1
+CONTENT_TYPE = 'application/octet-stream'
+DTYPES = {'float32': '<f4', 'float64': '<f8'}
+
+
+def _padding(length):
+    return -length % 8
+
+
+def encode_arrays(arrays, dtypes=None, metadata=None):
+    """Encode a dictionary of numeric arrays as bytes
+
+    dtypes maps array names to 'float32' or 'float64' (the default);
+    metadata is a JSON-serializable dictionary stored in the header.
+    """
+    dtypes = dtypes or {}
+    entries = []
+    planes = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        dtype = dtypes.get(name, 'float64')
+        is_complex = bool(np.iscomplexobj(array) and array.imag.any())
+        parts = [array.real, array.imag] if is_complex else [array.real]
+        nbytes = array.size * np.dtype(DTYPES[dtype]).itemsize
+        entries.append({'name': name, 'dtype': dtype, 'shape': list(array.shape), 'complex': is_complex,
+                        'offset': offset, 'nbytes': nbytes})
+        for part in parts:
+            planes.append(np.ascontiguousarray(part, dtype=DTYPES[dtype]).tobytes())
+            planes.append(b'\0' * _padding(nbytes))
+            offset += nbytes + _padding(nbytes)
+
+    header = json.dumps({'arrays': entries, 'metadata': metadata or {}}, separators=(',', ':')).encode()
+    prefix = MAGIC + struct.pack('<II', VERSION, len(header)) + header
+    return prefix + b'\0' * _padding(len(prefix)) + b''.join(planes)
+
+
+def read_header(data):
+    """Return the parsed header of bytes produced by encode_arrays and the offset of their data section"""
+    if data[:4] != MAGIC:
+        raise ValueError('Not a binary analysis result')
+    version, length = struct.unpack('<II', data[4:12])
+    if version != VERSION:
+        raise ValueError(f'Unsupported binary format version {version}')
+    return json.loads(data[12:12 + length]), 12 + length + _padding(12 + length)
+
+
+def decode_arrays(data):
+    """Decode bytes produced by encode_arrays back into a dictionary of arrays"""
+    header, start = read_header(data)
+
+    arrays = {}
+    for entry in header['arrays']:
+        dtype = np.dtype(DTYPES[entry['dtype']])
+        count = entry['nbytes'] // dtype.itemsize
+        offset = start + entry['offset']
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=offset).astype(float)
+        if entry['complex']:
+            imag_offset = offset + entry['nbytes'] + _padding(entry['nbytes'])
+            array = array + 1j * np.frombuffer(data, dtype=dtype, count=count, offset=imag_offset)
+        arrays[entry['name']] = array.reshape(entry['shape'])
+    return arrays
@@ -0,0 +1,158 @@
+"""
+Content-addressed cache of intermediate analysis results
+
+Entries are dictionaries of NumPy arrays stored under a hash of the request
+parameters that produced them. Each cache keeps its most recently used
+entries within a memory budget and can spill to an optional directory of
+.npz files, so results survive eviction and server restarts.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_BYTES = int(float(os.environ.get('RESULT_CACHE_MB', 512)) * 2**20)
+# Directory of the on-disk tier; unset keeps the cache in memory only
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR')
+RESULT_CACHE_DISK_BYTES = int(float(os.environ.get('RESULT_CACHE_DISK_MB', 4096)) * 2**20)
+
+
+def _canonical(value):
+    """Normalize a JSON-like value so that equivalent requests serialize identically"""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        # 2 and 2.0 describe the same range, so integral floats hash as integers
+        return int(value) if float(value).is_integer() else float(value)
+    return str(value)
+
+
+def canonical_constraints(constraints):
+    """Constraints with their cell lists sorted, since the order of cells in a sum does not matter"""
+    return [dict(c, cells=sorted(c['cells'])) for c in constraints]
+
+
+def cache_key(*parts):
+    """Stable hash of JSON-like parts"""
+    text = json.dumps(_canonical(list(parts)), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    """LRU cache of array dictionaries with a memory budget and an optional disk tier"""
+
+    def __init__(self, name, max_bytes=RESULT_CACHE_BYTES, directory=RESULT_CACHE_DIR, max_disk_bytes=RESULT_CACHE_DISK_BYTES):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.directory = os.path.join(directory, name) if directory else None
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key):
+        """Return the entry stored under key, or None"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        entry = self._load(key)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """Store a dictionary of arrays under key"""
+        entry = {name: np.asarray(array) for name, array in entry.items()}
+        with self.lock:
+            self._insert(key, entry)
+        self._save(key, entry)
+
+    def clear(self):
+        """Drop every in-memory entry"""
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Hit and miss counts and current usage"""
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk': self.directory is not None
+            }
+
+    def _insert(self, key, entry):
+        """Add an entry in memory and evict least recently used ones beyond the budget"""
+        nbytes = sum(array.nbytes for array in entry.values())
+        if nbytes > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= sum(array.nbytes for array in self.entries.pop(key).values())
+        self.entries[key] = entry
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= sum(array.nbytes for array in evicted.values())
+            self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def _load(self, key):
+        """Read an entry from the disk tier, or None"""
+        if not self.directory or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with np.load(self._path(key)) as data:
+                return {name: data[name] for name in data.files}
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache file {self._path(key)}: {str(e)}")
+            os.remove(self._path(key))
+            return None
+
+    def _save(self, key, entry):
+        """Write an entry to the disk tier and trim the oldest files beyond its budget"""
+        if not self.directory:
+            return
+        temporary = self._path(key) + '.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(f, **entry)
+        os.replace(temporary, self._path(key))
+
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.npz')]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+        for path in files:
+            if total <= self.max_disk_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
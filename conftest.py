@@ -0,0 +1,14 @@
+"""
+Test setup shared by the pytest run
+
+Runs stored by the endpoint tests go to a temporary directory, so the suite
+never trims or deletes the runs kept in the default results/ directory.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+RESULT_STORE_DIR = tempfile.mkdtemp(prefix='cmv-test-results-')
+os.environ['RESULT_STORE_DIR'] = RESULT_STORE_DIR
+atexit.register(shutil.rmtree, RESULT_STORE_DIR, ignore_errors=True)
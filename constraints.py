@@ -0,0 +1,71 @@
+"""
+Linear sum constraints compiled into a coefficient matrix for batch evaluation
+"""
+import numpy as np
+
+CONSTRAINT_TYPES = ('sum_greater', 'sum_less', 'sum_equal')
+EQUALITY_TOLERANCE = 1e-6
+# Sums are taken in a different order than a plain Python sum, so inequalities
+# allow for floating point round-off on grid values such as 0.1 steps
+INEQUALITY_TOLERANCE = 1e-9
+
+
+def parse_cell(cell):
+    """Convert an "i,j" cell key into a (row, column) tuple"""
+    i, j = cell.split(',')
+    return int(i), int(j)
+
+
+class CompiledConstraints:
+    """Constraints as a (constraints, cells) coefficient matrix plus bounds"""
+
+    def __init__(self, constraints, size):
+        self.size = size
+        self.constraints = list(constraints)
+        count = len(self.constraints)
+
+        self.coefficients = np.zeros((count, size * size))
+        self.values = np.zeros(count)
+        self.types = []
+        for k, constraint in enumerate(self.constraints):
+            # Cell strings are parsed once here instead of once per matrix
+            flat = [i * size + j for i, j in map(parse_cell, constraint['cells'])]
+            np.add.at(self.coefficients[k], flat, 1.0)
+            self.values[k] = constraint['value']
+            self.types.append(constraint['type'])
+
+        types = np.array(self.types, dtype=object)
+        self.is_lower = types == 'sum_greater'
+        self.is_upper = types == 'sum_less'
+        self.is_equal = types == 'sum_equal'
+
+    def __len__(self):
+        return len(self.constraints)
+
+    def cells_of(self, k):
+        """Return the flat indices of the cells used by constraint k"""
+        return np.flatnonzero(self.coefficients[k])
+
+    def sums(self, matrices):
+        """Return the (batch, constraints) cell sums for a stack of matrices"""
+        matrices = np.asarray(matrices, dtype=float)
+        flat = matrices.reshape(len(matrices), -1)
+        return flat @ self.coefficients.T
+
+    def evaluate(self, matrices):
+        """Return a boolean mask of the matrices that satisfy every constraint"""
+        matrices = np.asarray(matrices, dtype=float)
+        if len(self) == 0:
+            return np.ones(len(matrices), dtype=bool)
+
+        sums = self.sums(matrices)
+        ok = np.ones(sums.shape, dtype=bool)
+        ok[:, self.is_lower] = sums[:, self.is_lower] >= self.values[self.is_lower] - INEQUALITY_TOLERANCE
+        ok[:, self.is_upper] = sums[:, self.is_upper] <= self.values[self.is_upper] + INEQUALITY_TOLERANCE
+        ok[:, self.is_equal] = np.abs(sums[:, self.is_equal] - self.values[self.is_equal]) <= EQUALITY_TOLERANCE
+        return ok.all(axis=1)
+
+
+def compile_constraints(constraints, size):
+    """Compile a list of constraint dicts once per request"""
+    return CompiledConstraints(constraints, size)
@@ -0,0 +1,217 @@
+"""
+Run time and memory estimates of analyses, and admission control against budgets
+
+Each stage is predicted from per-unit costs: candidates drawn for sampling,
+matrix cells for the eigen stage, points for features, the reducer's own
+cost model for the reduction, and numbers sent for the serialization. The
+built-in costs were measured on one core; every stage then has a correction
+factor, fitted from benchmark.py results at startup (COST_CALIBRATION) and
+updated from the stage timings of every finished analysis, so estimates
+converge on the machine actually serving requests.
+"""
+import json
+import logging
+import os
+import threading
+import numpy as np
+from parallel import WORKERS, PARALLEL_EIGEN_THRESHOLD, PARALLEL_SAMPLING_THRESHOLD
+from reducers import AUTO_PREFERENCE, REDUCTION_LATENCY_BUDGET, estimate_seconds, select_reducer, supports
+
+logger = logging.getLogger(__name__)
+
+# Predicted seconds above which an analysis is downgraded to a faster reducer or refused
+COST_MAX_SECONDS = float(os.environ.get('COST_MAX_SECONDS', 900))
+# Predicted peak memory above which an analysis is downgraded or refused
+COST_MAX_MEMORY_MB = float(os.environ.get('COST_MAX_MEMORY_MB', 4096))
+# /generate requests predicted to take longer run as background jobs instead of holding the request open
+COST_SYNC_SECONDS = float(os.environ.get('COST_SYNC_SECONDS', 60))
+# benchmark.py results to calibrate the estimates with; empty for the built-in costs
+COST_CALIBRATION = os.environ.get('COST_CALIBRATION', '')
+
+# Single-core seconds per unit of work
+SAMPLING_PER_CELL = 4e-8  # per cell of each drawn candidate
+SAMPLING_PER_CANDIDATE = 1e-7
+EIGENVALUES_PER_CELL = 3e-7  # per matrix cell, eigenvalues only
+EIGENVECTORS_PER_CELL = 4.5e-7  # per matrix cell, eigenvalues and eigenvectors
+EIGEN_PER_MATRIX = 1e-6
+FEATURES_PER_POINT = 1.5e-6  # feature building and deduplication
+SERIALIZATION_PER_NUMBER = 1e-6
+# Sizes of the encoded response and of the reducers' working memory
+JSON_BYTES_PER_NUMBER = 16
+REDUCER_BYTES_PER_POINT = {'tsne': 3000, 'fft_tsne': 2000, 'umap': 2500, 'pca': 0, 'randomized_pca': 0, 'spectrum': 0}
+# Exact t-SNE, used above 3 components, keeps a few dense n x n matrices
+EXACT_TSNE_MATRICES = 3
+# Weight of each new measurement in the correction factors, and the bounds on a single measurement's ratio
+CALIBRATION_WEIGHT = 0.2
+CALIBRATION_RATIO_BOUNDS = (0.1, 10.0)
+# Stages shorter than this are too noisy to calibrate from
+MIN_CALIBRATION_SECONDS = 0.05
+# Backends tried, fastest last, when a request is over budget
+DOWNGRADE_ORDER = AUTO_PREFERENCE + ('pca',)
+
+
+class CostModel:
+    """Per-stage cost predictions with correction factors learned from measured timings"""
+
+    def __init__(self, calibration=COST_CALIBRATION):
+        self.factors = {}
+        self.lock = threading.Lock()
+        if calibration:
+            try:
+                with open(calibration) as f:
+                    self.calibrate(json.load(f)['results'])
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not calibrate cost estimates from {calibration}: {str(e)}")
+
+    def factor(self, stage):
+        with self.lock:
+            return self.factors.get(stage, 1.0)
+
+    def raw_seconds(self, size, num_matrices, candidates, input_type, use_imaginary, algorithm, dimensionality,
+                    unique_points, numbers_sent, vectors):
+        """Uncorrected seconds per stage, keyed by the names the correction factors use"""
+        sampling_share = WORKERS if candidates >= PARALLEL_SAMPLING_THRESHOLD else 1
+        eigen_share = WORKERS if num_matrices >= PARALLEL_EIGEN_THRESHOLD else 1
+        per_cell = EIGENVECTORS_PER_CELL if vectors else EIGENVALUES_PER_CELL
+        return {
+            'sampling': candidates * (SAMPLING_PER_CELL * size * size + SAMPLING_PER_CANDIDATE) / sampling_share,
+            'eigen': num_matrices * (per_cell * size * size + EIGEN_PER_MATRIX) / eigen_share,
+            'features': num_matrices * FEATURES_PER_POINT,
+            f'reduction.{algorithm}': estimate_seconds(algorithm, unique_points),
+            'serialization': numbers_sent * SERIALIZATION_PER_NUMBER
+        }
+
+    def estimate(self, size, num_matrices, dimensionality, input_type='eigenvalues', use_imaginary=False,
+                 algorithm='tsne', acceptance_rate=1.0, feasible=None, details='inline', include_vectors=False,
+                 sampled=False, latency_budget=REDUCTION_LATENCY_BUDGET):
+        """Predicted seconds per stage, total seconds and peak memory of an analysis
+
+        feasible bounds the number of distinct points; sampled means the
+        matrices and eigen data are already cached, so only the reduction
+        and serialization remain. 'auto' is resolved the way the analysis
+        will resolve it.
+        """
+        unique_points = min(num_matrices, feasible) if feasible else num_matrices
+        if algorithm == 'auto':
+            algorithm = select_reducer(unique_points, dimensionality, latency_budget)
+        vectors = include_vectors or input_type == 'eigenvectors'
+        candidates = 0 if sampled else int(np.ceil(num_matrices / max(acceptance_rate, 1e-9)))
+        numbers_sent = num_matrices * dimensionality
+        if details == 'inline':
+            # Matrices, eigenvalues as real and imaginary parts, and eigenvectors when included
+            numbers_sent += num_matrices * (size * size + 2 * size + (2 * size * size if include_vectors else 0))
+
+        raw = self.raw_seconds(size, num_matrices, candidates, input_type, use_imaginary, algorithm, dimensionality,
+                               unique_points, numbers_sent, vectors)
+        if sampled:
+            raw['sampling'] = raw['eigen'] = 0.0
+        seconds = {stage.split('.')[0]: value * self.factor(stage) for stage, value in raw.items()}
+        return {
+            'algorithm': algorithm,
+            'seconds': {stage: round(value, 3) for stage, value in seconds.items()},
+            'total_seconds': round(sum(seconds.values()), 3),
+            'memory_bytes': int(self.memory_bytes(size, num_matrices, input_type, use_imaginary, algorithm,
+                                                  dimensionality, unique_points, numbers_sent, vectors)),
+            'candidates': candidates,
+            'acceptance_rate': acceptance_rate
+        }
+
+    @staticmethod
+    def memory_bytes(size, num_matrices, input_type, use_imaginary, algorithm, dimensionality, unique_points,
+                     numbers_sent, vectors):
+        """Peak bytes held by an analysis: its arrays, the reducer's working memory and the encoded response"""
+        cells = size * size
+        arrays = num_matrices * cells * 8 * 2  # matrices, plus the accepted blocks while they are joined
+        arrays += num_matrices * size * 16  # complex eigenvalues
+        if vectors:
+            arrays += num_matrices * cells * 16
+        width = cells if input_type == 'eigenvectors' else size
+        arrays += num_matrices * width * 8 * (2 if use_imaginary else 1)
+        arrays += num_matrices * dimensionality * 8
+        reducer = unique_points * REDUCER_BYTES_PER_POINT.get(algorithm, 0)
+        if algorithm == 'tsne' and dimensionality > 3:
+            reducer += EXACT_TSNE_MATRICES * unique_points ** 2 * 8
+        if algorithm in ('pca', 'randomized_pca'):
+            reducer += unique_points * width * 8 * (2 if use_imaginary else 1) * 2
+        # The response is built as Python objects and then encoded, so it is held about twice
+        response = numbers_sent * JSON_BYTES_PER_NUMBER * 2
+        return arrays + reducer + response
+
+    def admit(self, downgrade=True, max_seconds=COST_MAX_SECONDS, max_memory_mb=COST_MAX_MEMORY_MB, **request):
+        """Decide whether an analysis may run, returning its estimate with 'admission' and 'reason' added
+
+        request holds the arguments of estimate. Over either budget, the first
+        faster backend that fits is chosen when downgrade is allowed, and the
+        estimate is marked 'downgrade' with 'downgraded_from'; otherwise it is
+        marked 'reject'.
+        """
+        estimate = self.estimate(**request)
+        reason = over_budget(estimate, max_seconds, max_memory_mb)
+        if reason is None:
+            return dict(estimate, admission='run', reason=None)
+        requested = estimate['algorithm']
+        if downgrade and requested in DOWNGRADE_ORDER:
+            unique_points = min(request['num_matrices'], request.get('feasible') or request['num_matrices'])
+            for name in DOWNGRADE_ORDER[DOWNGRADE_ORDER.index(requested) + 1:]:
+                if not supports(name, unique_points, request['dimensionality']):
+                    continue
+                candidate = self.estimate(**dict(request, algorithm=name))
+                if over_budget(candidate, max_seconds, max_memory_mb) is None:
+                    return dict(candidate, admission='downgrade', reason=reason, downgraded_from=requested)
+        return dict(estimate, admission='reject', reason=reason)
+
+    def observe(self, estimate, stages):
+        """Move the correction factors towards the ratios of measured to predicted stage times
+
+        stages holds measured seconds as recorded by metrics.Timings; feature
+        building and deduplication are compared together, as they are predicted.
+        """
+        measured = {
+            'sampling': stages.get('sampling'),
+            'eigen': stages.get('eigen'),
+            'features': (stages['features'] + stages.get('dedup', 0.0)) if 'features' in stages else None,
+            f"reduction.{estimate['algorithm']}": stages.get('reduction')
+        }
+        with self.lock:
+            for stage, seconds in measured.items():
+                predicted = estimate['seconds'].get(stage.split('.')[0], 0.0)
+                if seconds is None or max(seconds, predicted) < MIN_CALIBRATION_SECONDS or predicted <= 0:
+                    continue
+                factor = self.factors.get(stage, 1.0)
+                # Predictions already include the current factor, so the ratio rescales it
+                ratio = float(np.clip(seconds / predicted, *CALIBRATION_RATIO_BOUNDS))
+                self.factors[stage] = (1 - CALIBRATION_WEIGHT) * factor + CALIBRATION_WEIGHT * factor * ratio
+
+    def calibrate(self, cases):
+        """Set the correction factors to the median ratio of measured to predicted times over benchmark cases"""
+        ratios = {}
+        for case in cases:
+            if case.get('skipped'):
+                continue
+            stages = case['stages']
+            size, count = case['size'], case['count']
+            numbers_sent = count * (2 + 3 * size * size + 2 * size)  # benchmark results include eigenvectors
+            measured = {'sampling': stages.get('sampling'), 'eigen': stages.get('eigen'),
+                        'features': (stages['features'] + stages['dedup']) if 'features' in stages else None,
+                        'serialization': stages.get('serialize_json')}
+            measured.update({stage: seconds for stage, seconds in stages.items() if stage.startswith('reduction.')})
+            for stage, seconds in measured.items():
+                algorithm = stage.split('.')[1] if stage.startswith('reduction.') else 'pca'
+                raw = self.raw_seconds(size, count, case.get('attempts', count), 'eigenvalues', True, algorithm, 2,
+                                       case.get('unique_points', count), numbers_sent, False)
+                predicted = raw.get(stage)
+                if seconds is not None and predicted and max(seconds, predicted) >= MIN_CALIBRATION_SECONDS:
+                    ratios.setdefault(stage, []).append(seconds / predicted)
+        with self.lock:
+            self.factors.update({stage: float(np.clip(np.median(values), *CALIBRATION_RATIO_BOUNDS))
+                                 for stage, values in ratios.items()})
+        logger.info(f"Calibrated cost estimates: {', '.join(f'{s} x{f:.2f}' for s, f in sorted(self.factors.items()))}")
+
+
+def over_budget(estimate, max_seconds=COST_MAX_SECONDS, max_memory_mb=COST_MAX_MEMORY_MB):
+    """Reason an estimate exceeds the budgets, or None when it fits"""
+    if estimate['memory_bytes'] > max_memory_mb * 1024 * 1024:
+        return f"needs about {estimate['memory_bytes'] / 2**20:.0f} MB, over the {max_memory_mb:g} MB limit"
+    if estimate['total_seconds'] > max_seconds:
+        return f"would take about {estimate['total_seconds']:.0f}s, over the {max_seconds:g}s limit"
+    return None
@@ -0,0 +1,76 @@
+"""
+Counting of the matrices allowed by cell grids and linear sum constraints
+"""
+import math
+from constraints import compile_constraints
+from lattice import build_group_lattice, constraint_groups
+from sampling import MatrixSampler, build_cell_grids, grid_size
+
+MONTE_CARLO_SAMPLES = 20000
+MONTE_CARLO_SEED = 0
+
+
+def total_combinations(size, cell_ranges):
+    """Exact size of the unconstrained search space"""
+    total = 1
+    for i in range(size):
+        for j in range(size):
+            total *= grid_size(cell_ranges[f"{i},{j}"])
+    return total
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """95% Wilson score interval for a binomial proportion"""
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z**2 / trials
+    centre = (p + z**2 / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def count_feasible_matrices(size, cell_ranges, constraints, samples=MONTE_CARLO_SAMPLES, seed=MONTE_CARLO_SEED):
+    """Count, or estimate, the matrices on the cell grids that satisfy all constraints
+
+    Returns a dict with the unconstrained 'total', the 'feasible' count, whether
+    it is 'exact', the 'acceptance_rate' of uniform sampling and its 95%
+    'acceptance_interval'. Constraint groups are counted exactly when the
+    dynamic programme fits its budget, otherwise the acceptance rate is
+    estimated by Monte Carlo sampling.
+    """
+    total = total_combinations(size, cell_ranges)
+    compiled = compile_constraints(constraints, size)
+    if len(compiled) == 0:
+        return {'total': total, 'feasible': total, 'exact': True,
+                'acceptance_rate': 1.0, 'acceptance_interval': (1.0, 1.0)}
+
+    grids = build_cell_grids(size, cell_ranges)
+    feasible = total
+    for cells, ids in constraint_groups(compiled):
+        group_total = 1
+        for cell in cells:
+            group_total *= len(grids[cell])
+        lattice = build_group_lattice(compiled, ids, cells, grids)
+        if lattice is None:
+            break
+        group_feasible = lattice.count
+        # Cells outside the group contribute their grid sizes unchanged
+        feasible = feasible // group_total * group_feasible
+    else:
+        rate = feasible / total
+        return {'total': total, 'feasible': feasible, 'exact': True,
+                'acceptance_rate': rate, 'acceptance_interval': (rate, rate)}
+
+    sampler = MatrixSampler(size, cell_ranges, seed=seed)
+    accepted = int(compiled.evaluate(sampler.sample(samples)).sum())
+    rate = accepted / samples
+    return {'total': total, 'feasible': int(round(total * rate)), 'exact': False,
+            'acceptance_rate': rate, 'acceptance_interval': wilson_interval(accepted, samples)}
+
+
+def feasible_upper_bound(space):
+    """Largest count consistent with a counting result"""
+    if space['exact']:
+        return space['feasible']
+    return int(math.ceil(space['total'] * space['acceptance_interval'][1]))
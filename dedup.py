@@ -0,0 +1,31 @@
+"""
+Collapse duplicate points before dimensionality reduction
+
+Matrices drawn from coarse grids repeat, and distinct matrices often share a
+spectrum. Points are grouped by the bytes of their quantized feature
+vectors, exactly as the reducer would see them, so it only gets one row per
+group and the coordinates are scattered back afterwards.
+"""
+import numpy as np
+
+# Values are rounded to this many decimals before hashing, absorbing floating-point noise
+DEDUP_DECIMALS = 9
+
+
+def quantize(array, decimals=DEDUP_DECIMALS):
+    """Round values for hashing, mapping -0.0 to 0.0"""
+    return np.round(array, decimals) + 0.0
+
+
+def unique_rows(keys):
+    """Group identical rows of a 2-D array, returning (first index of each group, group of each row, group sizes)"""
+    keys = np.ascontiguousarray(keys)
+    # Comparing rows as opaque byte strings is much faster than a lexicographic sort over columns
+    rows = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+    _, index, inverse, counts = np.unique(rows, return_index=True, return_inverse=True, return_counts=True)
+    return index, inverse.ravel(), counts
+
+
+def deduplicate(feature_vectors):
+    """Group points with identical feature vectors, returning (index, inverse, counts) as from unique_rows"""
+    return unique_rows(quantize(feature_vectors))
@@ -0,0 +1,99 @@
+"""
+Batched eigen-decomposition of stacked (n, size, size) matrices
+"""
+import numpy as np
+
+# Matrices per LAPACK call; bounds the temporary memory of a single chunk
+EIGEN_CHUNK_SIZE = 8192
+
+
+def is_symmetric_stack(matrices):
+    """Check if every matrix in the stack is exactly symmetric"""
+    return bool(np.array_equal(matrices, matrices.transpose(0, 2, 1)))
+
+
+def eigen_decomposition(matrices, chunk_size=EIGEN_CHUNK_SIZE, symmetric=None):
+    """Compute eigenvalues and eigenvectors of a stack in a single pass per chunk
+
+    Returns (values, vectors) with shapes (n, size) and (n, size, size); the
+    eigenvectors are the columns of each vectors[k]. Symmetric stacks use
+    eigh and return real arrays sorted in ascending order, otherwise the
+    arrays are complex. Pass symmetric to reuse a check made on a larger
+    stack this one was split from.
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    n, size = matrices.shape[0], matrices.shape[-1]
+    if symmetric is None:
+        symmetric = n > 0 and is_symmetric_stack(matrices)
+
+    dtype = float if symmetric else complex
+    values = np.empty((n, size), dtype=dtype)
+    vectors = np.empty((n, size, size), dtype=dtype)
+    decompose = np.linalg.eigh if symmetric else np.linalg.eig
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        values[start:stop], vectors[start:stop] = decompose(matrices[start:stop])
+    return values, vectors
+
+
+def eigenvalues_only(matrices, chunk_size=EIGEN_CHUNK_SIZE, symmetric=None):
+    """Compute eigenvalues without eigenvectors, in the layout eigen_decomposition returns them
+
+    eigvals and eigvalsh skip the back-transformation that forms the
+    eigenvectors, roughly halving the LAPACK time and avoiding the (n, size,
+    size) output. The dtype, and so the choice of eig or eigh, matches
+    eigen_decomposition, which eigenvectors_for relies on.
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    n, size = matrices.shape[0], matrices.shape[-1]
+    if symmetric is None:
+        symmetric = n > 0 and is_symmetric_stack(matrices)
+
+    values = np.empty((n, size), dtype=float if symmetric else complex)
+    decompose = np.linalg.eigvalsh if symmetric else np.linalg.eigvals
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        values[start:stop] = decompose(matrices[start:stop])
+    return values
+
+
+def eigenvectors_for(matrices, values):
+    """Eigenvectors of matrices whose eigenvalues were computed alone, in the same order as values"""
+    # Real eigenvalues come from eigh, which sorts them as eigvalsh does
+    _, vectors = eigen_decomposition(matrices, symmetric=not np.iscomplexobj(values))
+    return vectors
+
+
+def build_feature_vectors(values, vectors, input_type='eigenvalues', use_imaginary=False):
+    """Build the (n, features) input for dimensionality reduction
+
+    Eigenvalue features have size columns and eigenvector features have
+    size * size columns (eigenvectors one after another); use_imaginary
+    appends the imaginary plane after the real plane, doubling the width.
+    """
+    if input_type == 'eigenvectors':
+        # Eigenvectors are the columns of each matrix, so transpose before flattening
+        data = vectors.transpose(0, 2, 1).reshape(len(vectors), -1)
+    else:  # input_type == 'eigenvalues' (default)
+        data = values
+
+    if use_imaginary:
+        return np.concatenate([data.real, np.imag(data)], axis=1)
+    return np.ascontiguousarray(data.real, dtype=float)
+
+
+def _merge_complex(real, imag):
+    """Merge nested real/imag lists into floats and {'real','imag'} dicts"""
+    if isinstance(real, list):
+        return [_merge_complex(r, i) for r, i in zip(real, imag)]
+    if imag == 0:
+        return real
+    return {'real': real, 'imag': imag}
+
+
+def complex_to_json(array):
+    """Encode an array as nested lists with complex entries as {'real','imag'} dicts"""
+    array = np.asarray(array)
+    if not np.iscomplexobj(array) or not array.imag.any():
+        return array.real.tolist()
+    return _merge_complex(array.real.tolist(), array.imag.tolist())
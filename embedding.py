@@ -0,0 +1,76 @@
+"""
+Fitted embeddings that new matrices can be projected into without refitting
+
+UMAP embeddings keep their fitted reducer and project new points with its
+transform. t-SNE has no out-of-sample transform, so new points are placed at
+the distance-weighted mean of the coordinates of their nearest neighbours in
+feature space, the same initialization openTSNE uses before optimizing new
+points. Either way the existing points keep their coordinates.
+"""
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOURS = 10
+# Fitted reducers can be large, so only the most recently used embeddings are kept
+MAX_EMBEDDINGS = 8
+
+
+def interpolate_coordinates(features, coordinates, new_features, neighbours=NEIGHBOURS):
+    """Place new points at the inverse-distance weighted mean of their nearest neighbours' coordinates"""
+    from sklearn.neighbors import NearestNeighbors
+    k = min(neighbours, len(features))
+    distances, indices = NearestNeighbors(n_neighbors=k).fit(features).kneighbors(new_features)
+    weights = 1 / np.maximum(distances, 1e-12)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum('nk,nkd->nd', weights, coordinates[indices])
+
+
+class Embedding:
+    """Feature vectors and coordinates of an embedded result, with the parameters that produced them"""
+
+    def __init__(self, params, features, coordinates, model=None):
+        self.params = params
+        self.features = np.asarray(features, dtype=float)
+        self.coordinates = np.asarray(coordinates, dtype=float)
+        self.model = model
+        self.pyramid = None  # Density tiles of the coordinates, built when first requested
+
+    def transform(self, features):
+        """Project new feature vectors into the existing embedding"""
+        if self.model is not None:
+            return np.asarray(self.model.transform(features), dtype=float)
+        return interpolate_coordinates(self.features, self.coordinates, features)
+
+    def extended(self, params, features, coordinates):
+        """Embedding with projected points added, so later batches can land near them as well"""
+        return Embedding(params, np.concatenate([self.features, features]),
+                         np.concatenate([self.coordinates, coordinates]), self.model)
+
+
+class EmbeddingStore:
+    """In-memory LRU registry of embeddings by id"""
+
+    def __init__(self, max_entries=MAX_EMBEDDINGS):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, embedding_id):
+        """Return an embedding, or None when it is unknown or was evicted"""
+        with self.lock:
+            if embedding_id not in self.entries:
+                return None
+            self.entries.move_to_end(embedding_id)
+            return self.entries[embedding_id]
+
+    def put(self, embedding_id, embedding):
+        """Register an embedding, evicting the least recently used beyond the limit"""
+        with self.lock:
+            self.entries[embedding_id] = embedding
+            self.entries.move_to_end(embedding_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
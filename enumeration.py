@@ -0,0 +1,81 @@
+"""
+Exhaustive enumeration of the feasible matrices of small search spaces
+"""
+import numpy as np
+from constraints import compile_constraints
+from lattice import build_group_lattice, constraint_groups
+from sampling import build_cell_grids
+
+# Largest feasible space that may be indexed for enumeration
+MAX_ENUMERATION = 10**7
+# Enumerate instead of sampling when the feasible space is at most this many times the request
+ENUMERATION_FACTOR = 4
+ENUMERATION_CHUNK_SIZE = 4096
+
+
+class FeasibleSpace:
+    """Lazy index over every feasible matrix
+
+    The feasible set is the Cartesian product of independent factors: the
+    feasible assignments of each constraint group, found by a pruned walk of
+    its lattice, and the grid of every unconstrained cell. A flat index into
+    the product is decoded in mixed radix, so matrices can be produced in
+    chunks or sampled without replacement without materializing the set.
+    """
+
+    def __init__(self, size, cell_ranges, constraints):
+        self.size = size
+        grids = build_cell_grids(size, cell_ranges)
+        compiled = compile_constraints(constraints, size)
+
+        self.factors = []
+        constrained = set()
+        for cells, ids in constraint_groups(compiled):
+            lattice = build_group_lattice(compiled, ids, cells, grids)
+            if lattice is None:
+                raise ValueError('Constraint groups are too large to enumerate')
+            if lattice.count == 0:
+                values = np.empty((0, len(cells)))
+            else:
+                values = np.concatenate(list(lattice.iterate(ENUMERATION_CHUNK_SIZE)))
+            self.factors.append((cells, values))
+            constrained.update(cells)
+        for cell, values in enumerate(grids):
+            if cell not in constrained:
+                self.factors.append(([cell], values[:, np.newaxis]))
+
+        self.shape = tuple(len(values) for _, values in self.factors)
+        self.count = 1
+        for length in self.shape:
+            self.count *= length
+        if self.count > MAX_ENUMERATION:
+            raise ValueError(f'Feasible space of {self.count} matrices is too large to enumerate')
+
+    def __len__(self):
+        return self.count
+
+    def matrices(self, indices):
+        """Return the (n, size, size) matrices at the given flat indices"""
+        indices = np.asarray(indices, dtype=np.int64)
+        flat = np.empty((len(indices), self.size * self.size))
+        positions = np.unravel_index(indices, self.shape)
+        for (cells, values), position in zip(self.factors, positions):
+            flat[:, cells] = values[position]
+        return flat.reshape(len(indices), self.size, self.size)
+
+    def iterate(self, chunk_size=ENUMERATION_CHUNK_SIZE):
+        """Yield every feasible matrix as (chunk, size, size) blocks"""
+        for start in range(0, self.count, chunk_size):
+            yield self.matrices(np.arange(start, min(start + chunk_size, self.count)))
+
+    def sample(self, k, rng):
+        """Draw k distinct feasible matrices uniformly at random"""
+        if k > self.count:
+            raise ValueError(f'Requested {k} distinct matrices but only {self.count} are feasible')
+        return self.matrices(rng.choice(self.count, size=k, replace=False))
+
+
+def should_enumerate(space, num_matrices):
+    """Check if a counted search space is small enough to enumerate for a request"""
+    return (space['exact'] and space['feasible'] <= MAX_ENUMERATION
+            and space['feasible'] <= num_matrices * ENUMERATION_FACTOR)
@@ -0,0 +1,62 @@
+"""
+Production serving with gunicorn: gunicorn -c gunicorn.conf.py
+
+Several worker processes, each with a few threads, serve requests in
+parallel instead of queueing behind a single interpreter. The app is loaded
+once in the master and forked, so workers start from the same imported
+code. Each worker gets an equal share of the cores for BLAS, numba and the
+sampling pool, so concurrent eigen-decompositions do not oversubscribe them.
+
+Requests of one client land on any worker. Jobs are shared through
+JOB_STATE_DIR and finished runs through the result store, so a job started
+on one worker can be polled, collected and cancelled on another, and the
+details of its points are read from the stored run.
+"""
+import os
+import shutil
+import tempfile
+
+CPUS = os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+# Each worker keeps its own result caches (RESULT_CACHE_MB), so memory grows with the worker count
+workers = int(os.environ.get('WEB_WORKERS', min(CPUS, 4)))
+# Threads per worker; streams and synchronous analyses hold a thread until they finish
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+wsgi_app = 'app:app'
+
+# Seconds a worker may go silent before it is restarted; analyses run on threads and keep the worker alive
+timeout = int(os.environ.get('WEB_TIMEOUT', 600))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+# Limits on the request line and headers; the body limit is MAX_REQUEST_MB in app.py
+limit_request_line = 8190
+limit_request_fields = 100
+limit_request_field_size = 8190
+
+accesslog = '-'
+errorlog = '-'
+
+# Thread counts are read when NumPy, numba and the sampling pool start, so they are set before the app is loaded
+CORES_PER_WORKER = str(max(1, CPUS // workers))
+for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMBA_NUM_THREADS', 'MATRIX_WORKERS'):
+    os.environ.setdefault(variable, CORES_PER_WORKER)
+# Job status and results are written where every worker can read them: by default a private directory
+# created here in the master, which workers inherit through the environment and which is removed on exit
+CREATED_JOB_STATE_DIR = None
+if not os.environ.get('JOB_STATE_DIR'):
+    CREATED_JOB_STATE_DIR = os.environ['JOB_STATE_DIR'] = tempfile.mkdtemp(prefix='cmv-jobs-')
+
+
+def post_fork(server, worker):
+    """Compile the reducers in each worker; numba's threads cannot be started before forking"""
+    from reducers import start_warm_up
+    start_warm_up()
+
+
+def on_exit(server):
+    """Remove the job directory created for this server"""
+    if CREATED_JOB_STATE_DIR is not None:
+        shutil.rmtree(CREATED_JOB_STATE_DIR, ignore_errors=True)
@@ -0,0 +1,340 @@
+"""
+Background execution of analysis requests with progress polling and cancellation
+
+Jobs run on a small bounded thread pool; the heavy sampling and eigen stages
+fan out to the process pool from there. The pipeline reports progress through
+a callback, which is also where a cancelled job is stopped: cancellation
+takes effect at the next progress report, so a running reduction finishes
+its current stage before the job ends.
+
+With JOB_STATE_DIR set, every job's status and result are also written to
+that directory, so any server process sharing it can poll, collect or
+cancel a job that another process runs. A cancellation from another
+process is left as a marker file that the owning process checks at each
+progress report. Results are shared in the binary result format, so reading
+one never runs code, whoever wrote the file.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from binary_format import decode_arrays, encode_arrays, read_header
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Jobs allowed to wait for a worker before new submissions are refused
+JOB_QUEUE_DEPTH = int(os.environ.get('JOB_QUEUE_DEPTH', 16))
+# Finished jobs and their results are kept this many seconds for the client to collect
+JOB_TTL = 600
+MAX_FINISHED_JOBS = 32
+# Directory shared by server processes for job status and results; empty keeps jobs within this process
+JOB_STATE_DIR = os.environ.get('JOB_STATE_DIR', '')
+# Seconds between writes of a running job's progress to the shared directory
+JOB_STATE_INTERVAL = 0.5
+# Shared files untouched for this long are left over from stopped processes and deleted
+JOB_STALE_SECONDS = 86400
+# Share of the overall percentage covered by each pipeline stage
+STAGE_SPANS = {'queued': (0, 0), 'sampling': (0, 40), 'eigen': (40, 60), 'reduction': (60, 100)}
+
+
+def encode_result(result):
+    """Encode a result dictionary of arrays and JSON values in the binary result format"""
+    arrays = {name: value for name, value in result.items() if isinstance(value, np.ndarray)}
+    fields = {name: value for name, value in result.items() if name not in arrays}
+    # The format stores floats, so integer arrays are named for decode_result to restore
+    integers = [name for name, value in arrays.items() if np.issubdtype(value.dtype, np.integer)]
+    return encode_arrays(arrays, metadata={'fields': fields, 'integers': integers})
+
+
+def decode_result(data):
+    """Decode a result dictionary written by encode_result"""
+    arrays = decode_arrays(data)
+    metadata = read_header(data)[0]['metadata']
+    for name in metadata['integers']:
+        arrays[name] = arrays[name].astype(np.int64)
+    return dict(metadata['fields'], **arrays)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled"""
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are already waiting to run"""
+
+
+class Job:
+    """State and result of one submitted analysis"""
+
+    def __init__(self, payload, options=None):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.options = options or {}
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.exception = None
+        self.client_error = False  # Whether the failure was caused by the request rather than the server
+        self.created = time.time()
+        self.finished = None
+        self.cancel_event = threading.Event()
+
+    def report(self, stage, done, total):
+        """Progress callback for the pipeline, aborting the run once the job is cancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(f'Job {self.id} was cancelled')
+        self.stage, self.done, self.total = stage, done, total
+
+    @property
+    def percent(self):
+        """Overall progress from 0 to 100"""
+        if self.status == 'done':
+            return 100.0
+        low, high = STAGE_SPANS.get(self.stage, (0, 0))
+        fraction = self.done / self.total if self.total else 0
+        return round(low + (high - low) * fraction, 1)
+
+    def to_dict(self):
+        """Status summary returned by the polling endpoint"""
+        end = self.finished or time.time()
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'percent': self.percent,
+            'cancel_requested': self.cancel_event.is_set(),
+            'elapsed': round(end - self.created, 3),
+            'error': self.error
+        }
+
+    def to_state(self):
+        """Status as written to the shared directory, with what another process needs to rebuild it"""
+        return dict(self.to_dict(), created=self.created, finished=self.finished, client_error=self.client_error)
+
+    @classmethod
+    def from_state(cls, state, result=None):
+        """Rebuild a job run by another process from its shared status"""
+        job = cls(None)
+        job.id = state['job_id']
+        job.status, job.stage, job.done, job.total = state['status'], state['stage'], state['done'], state['total']
+        job.error, job.client_error = state['error'], state['client_error']
+        job.created, job.finished = state['created'], state['finished']
+        job.result = result
+        if state['cancel_requested']:
+            job.cancel_event.set()
+        return job
+
+
+class JobManager:
+    """Bounded queue of analysis jobs run by runner(payload, progress, **options)"""
+
+    def __init__(self, runner, workers=JOB_WORKERS, queue_depth=JOB_QUEUE_DEPTH, ttl=JOB_TTL, directory=JOB_STATE_DIR,
+                 client_errors=()):
+        """client_errors are the exception types reported as the request's fault rather than the server's"""
+        self.runner = runner
+        self.queue_depth = queue_depth
+        self.ttl = ttl
+        self.directory = directory or None
+        self.client_errors = tuple(client_errors)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis-job')
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def submit(self, payload, **options):
+        """Queue a job, raising QueueFull when the queue is at its depth limit
+
+        options are passed on to the runner as keyword arguments.
+        """
+        self._sweep()
+        with self.lock:
+            self._expire()
+            waiting = sum(job.status == 'queued' for job in self.jobs.values())
+            if waiting >= self.queue_depth:
+                raise QueueFull(f'{waiting} jobs are already waiting to run. Please try again later.')
+            job = Job(payload, options)
+            self.jobs[job.id] = job
+            self._publish(job)
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id, with_result=False):
+        """Return a job by id, or None when it is unknown or has expired
+
+        Jobs of other processes are read from the shared directory; their
+        result is only loaded when with_result is set.
+        """
+        with self.lock:
+            self._expire()
+            job = self.jobs.get(job_id)
+        if job is None:
+            return self._load(job_id, with_result)
+        return job
+
+    def status_counts(self):
+        """Number of known jobs in each status"""
+        with self.lock:
+            self._expire()
+            counts = {status: 0 for status in ('queued', 'running', 'done', 'failed', 'cancelled')}
+            for job in self.jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job, returning it, or None when it is unknown"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self.lock:
+            if job.status in ('queued', 'running'):
+                job.cancel_event.set()
+                if job_id not in self.jobs:
+                    # Run by another process, which stops it at its next progress report
+                    open(self._path(job_id, 'cancel'), 'w').close()
+                elif job.status == 'queued':
+                    self._finish(job, 'cancelled')
+        logger.info(f"Cancellation requested for job {job.id}")
+        return job
+
+    def _run(self, job):
+        """Run one job on a pool thread and record its outcome"""
+        with self.lock:
+            if job.cancel_event.is_set():
+                return
+            if self._cancel_requested(job):
+                self._finish(job, 'cancelled')
+                return
+            job.status = 'running'
+            self._publish(job)
+        logger.info(f"Starting job {job.id}")
+        published = time.time()
+
+        def progress(stage, done, total):
+            nonlocal published
+            self._cancel_requested(job)
+            job.report(stage, done, total)
+            if self.directory and time.time() - published >= JOB_STATE_INTERVAL:
+                published = time.time()
+                self._publish(job)
+
+        try:
+            result = self.runner(job.payload, progress, **job.options)
+        except JobCancelled:
+            logger.info(f"Job {job.id} cancelled during {job.stage}")
+            with self.lock:
+                self._finish(job, 'cancelled')
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}", exc_info=True)
+            with self.lock:
+                job.error = str(e)
+                job.exception = e
+                job.client_error = isinstance(e, self.client_errors)
+                self._finish(job, 'failed')
+        else:
+            logger.info(f"Job {job.id} completed in {time.time() - job.created:.2f}s")
+            with self.lock:
+                job.result = result
+                self._finish(job, 'done')
+
+    def _finish(self, job, status):
+        """Mark a job as finished and drop its request payload and runner options"""
+        job.status = status
+        job.finished = time.time()
+        job.payload = None
+        job.options = {}
+        self._publish(job, with_result=status == 'done')
+
+    def _expire(self):
+        """Forget finished jobs past their time to live, and the oldest beyond the retention limit"""
+        now = time.time()
+        finished = sorted((job for job in self.jobs.values() if job.finished is not None), key=lambda job: job.finished)
+        for position, job in enumerate(finished):
+            if now - job.finished > self.ttl or position < len(finished) - MAX_FINISHED_JOBS:
+                del self.jobs[job.id]
+                self._unpublish(job.id)
+
+    def _path(self, job_id, kind):
+        """Shared file of a job: its 'json' status, encoded 'result' or 'cancel' marker"""
+        if not job_id.isalnum():
+            raise KeyError(f'Invalid job id {job_id}')
+        return os.path.join(self.directory, f'{job_id}.{kind}')
+
+    def _write(self, path, data):
+        """Replace a shared file in one step, so other processes never read it half written"""
+        temporary = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+    def _publish(self, job, with_result=False):
+        """Write a job's status, and its result once done, to the shared directory"""
+        if not self.directory:
+            return
+        try:
+            if with_result:
+                self._write(self._path(job.id, 'result'), encode_result(job.result))
+            self._write(self._path(job.id, 'json'), json.dumps(job.to_state()).encode())
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not share the state of job {job.id}: {str(e)}")
+
+    def _unpublish(self, job_id):
+        if not self.directory:
+            return
+        for kind in ('json', 'result', 'cancel'):
+            try:
+                os.remove(self._path(job_id, kind))
+            except OSError:
+                pass
+
+    def _sweep(self):
+        """Delete shared files of expired jobs, including those of processes that have since stopped"""
+        if not self.directory:
+            return
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                age = now - os.path.getmtime(path)
+                if name.endswith('.json') and age > self.ttl:
+                    with open(path) as f:
+                        finished = json.load(f)['finished']
+                    if age > JOB_STALE_SECONDS or (finished is not None and now - finished > self.ttl):
+                        self._unpublish(name[:-len('.json')])
+                elif age > JOB_STALE_SECONDS:
+                    os.remove(path)
+            except (OSError, KeyError, ValueError):
+                pass
+
+    def _cancel_requested(self, job):
+        """Whether a job was cancelled here or, through its marker file, by another process"""
+        if self.directory and not job.cancel_event.is_set() and os.path.exists(self._path(job.id, 'cancel')):
+            job.cancel_event.set()
+        return job.cancel_event.is_set()
+
+    def _load(self, job_id, with_result):
+        """A job of another process from the shared directory, or None when it is unknown or has expired"""
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(job_id, 'json')) as f:
+                state = json.load(f)
+            if state['finished'] is not None and time.time() - state['finished'] > self.ttl:
+                return None
+            result = None
+            if with_result and state['status'] == 'done':
+                with open(self._path(job_id, 'result'), 'rb') as f:
+                    result = decode_result(f.read())
+        except (OSError, KeyError, ValueError):
+            return None
+        return Job.from_state(state, result)
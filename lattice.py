@@ -0,0 +1,225 @@
+"""
+Layered dynamic programme over the cell grids of a constraint group
+
+Cells of a group are assigned one at a time. A DP state holds the partial sum
+of every constraint whose outcome is still undecided; constraints that can no
+longer fail are dropped from the state and partial assignments that can no
+longer succeed are pruned. Keeping every layer's transitions lets the same
+structure count feasible assignments, sample them uniformly and enumerate
+them.
+"""
+import numpy as np
+from constraints import EQUALITY_TOLERANCE, INEQUALITY_TOLERANCE
+
+# Limits for the exact dynamic programme; callers fall back when exceeded
+MAX_DP_STATES = 200000
+MAX_DP_WORK = 5000000
+# Partial sums are rounded to this many decimals to merge equal DP states
+SUM_DECIMALS = 9
+
+
+def constraint_groups(compiled):
+    """Split constraints into groups that share cells, as (cells, constraint ids) pairs"""
+    parent = list(range(len(compiled)))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    owner = {}
+    for k in range(len(compiled)):
+        for cell in compiled.cells_of(k):
+            if cell in owner:
+                parent[find(k)] = find(owner[cell])
+            else:
+                owner[cell] = k
+
+    groups = {}
+    for k in range(len(compiled)):
+        groups.setdefault(find(k), []).append(k)
+
+    result = []
+    for ids in groups.values():
+        # Place the cells of small constraints first so they retire early
+        cells = []
+        for k in sorted(ids, key=lambda k: len(compiled.cells_of(k))):
+            cells.extend(int(c) for c in compiled.cells_of(k) if c not in cells)
+        result.append((cells, ids))
+    return result
+
+
+def constraint_status(kind, value, low, high):
+    """Classify a partial sum whose final value lies in [low, high]
+
+    Returns False when the constraint can no longer hold, True when it holds
+    whatever the remaining cells are, and None while it is still undecided.
+    """
+    if kind == 'sum_greater':
+        if high < value - INEQUALITY_TOLERANCE:
+            return False
+        return True if low >= value - INEQUALITY_TOLERANCE else None
+    if kind == 'sum_less':
+        if low > value + INEQUALITY_TOLERANCE:
+            return False
+        return True if high <= value + INEQUALITY_TOLERANCE else None
+    if kind == 'sum_equal':
+        if high < value - EQUALITY_TOLERANCE or low > value + EQUALITY_TOLERANCE:
+            return False
+        return True if high - low <= EQUALITY_TOLERANCE else None
+    return True  # Unknown constraint types are ignored, as in check_constraints
+
+
+def remaining_bounds(compiled, ids, cells, grids):
+    """Per constraint, the min and max contribution of cells[t:] for every t"""
+    bounds = {}
+    for k in ids:
+        coefficients = compiled.coefficients[k]
+        low = [0.0] * (len(cells) + 1)
+        high = [0.0] * (len(cells) + 1)
+        for t in range(len(cells) - 1, -1, -1):
+            contribution = coefficients[cells[t]] * grids[cells[t]]
+            low[t] = low[t + 1] + float(contribution.min())
+            high[t] = high[t + 1] + float(contribution.max())
+        bounds[k] = (low, high)
+    return bounds
+
+
+class GroupLattice:
+    """Layered DP of one constraint group
+
+    transitions[t] is an (states, values) array giving the next state index
+    for every grid value of cells[t], or -1 when the value is pruned.
+    completions[t] holds, per state, the exact number of feasible ways to
+    assign the remaining cells.
+    """
+
+    def __init__(self, cells, grids, transitions, completions):
+        self.cells = cells
+        self.grids = [grids[cell] for cell in cells]
+        self.transitions = transitions
+        self.completions = completions
+        self._probabilities = None
+
+    @property
+    def count(self):
+        """Number of feasible assignments of the group's cells"""
+        return int(self.completions[0][0]) if len(self.completions[0]) else 0
+
+    def probabilities(self):
+        """Per layer, the cumulative probability of each value under uniform sampling"""
+        if self._probabilities is None:
+            self._probabilities = []
+            for t, transitions in enumerate(self.transitions):
+                # Index -1 picks the appended zero, so pruned values get no weight
+                following = np.append(self.completions[t + 1], 0)[transitions]
+                totals = self.completions[t][:, np.newaxis]
+                safe_totals = np.where(totals == 0, 1, totals)
+                weights = (following / safe_totals).astype(float)
+                self._probabilities.append(np.cumsum(weights, axis=1))
+        return self._probabilities
+
+    def sample(self, batch, rng):
+        """Draw a (batch, cells) block of feasible assignments uniformly at random"""
+        if self.count == 0:
+            raise ValueError('Constraints cannot be satisfied with the current cell ranges')
+        values = np.empty((batch, len(self.cells)))
+        states = np.zeros(batch, dtype=np.intp)
+        for t, cumulative in enumerate(self.probabilities()):
+            rows = cumulative[states]
+            u = rng.random(batch) * rows[:, -1]
+            choice = np.minimum((rows <= u[:, np.newaxis]).sum(axis=1), rows.shape[1] - 1)
+            values[:, t] = self.grids[t][choice]
+            states = self.transitions[t][states, choice]
+        return values
+
+    def iterate(self, chunk_size=4096):
+        """Yield every feasible assignment, in lexicographic grid order, as (chunk, cells) blocks"""
+        if self.count == 0:
+            return
+        if not self.cells:
+            yield np.empty((1, 0))
+            return
+
+        # Depth-first walk that only follows transitions with feasible completions
+        chunk = []
+        choice = [0] * len(self.cells)
+        states = [0] * (len(self.cells) + 1)
+        t = 0
+        while t >= 0:
+            if t == len(self.cells):
+                chunk.append([self.grids[k][choice[k]] for k in range(len(self.cells))])
+                if len(chunk) == chunk_size:
+                    yield np.array(chunk)
+                    chunk = []
+                t -= 1
+                choice[t] += 1
+                continue
+            row = self.transitions[t][states[t]]
+            while choice[t] < len(row) and (row[choice[t]] < 0 or self.completions[t + 1][row[choice[t]]] == 0):
+                choice[t] += 1
+            if choice[t] == len(row):
+                choice[t] = 0
+                t -= 1
+                if t >= 0:
+                    choice[t] += 1
+                continue
+            states[t + 1] = row[choice[t]]
+            t += 1
+        if chunk:
+            yield np.array(chunk)
+
+
+def build_group_lattice(compiled, ids, cells, grids, max_states=MAX_DP_STATES, max_work=MAX_DP_WORK):
+    """Build the layered DP of a constraint group, or return None when it exceeds its budget"""
+    bounds = remaining_bounds(compiled, ids, cells, grids)
+    initial = []
+    for k in ids:
+        low, high = bounds[k]
+        status = constraint_status(compiled.types[k], compiled.values[k], low[0], high[0])
+        if status is False:
+            # No assignment can satisfy this constraint
+            return GroupLattice(cells, grids, [], [np.zeros(0, dtype=object)])
+        initial.append(None if status else 0.0)
+
+    layer = {tuple(initial): 0}
+    transitions = []
+    work = 0
+    for t, cell in enumerate(cells):
+        contributions = [(compiled.coefficients[k][cell] * grids[cell]).tolist() for k in ids]
+        work += len(layer) * len(grids[cell])
+        if work > max_work:
+            return None
+
+        next_layer = {}
+        table = np.full((len(layer), len(grids[cell])), -1, dtype=np.int32)
+        for state, index in layer.items():
+            for v in range(len(grids[cell])):
+                new_state = []
+                for position, k in enumerate(ids):
+                    partial = state[position]
+                    if partial is None:
+                        new_state.append(None)
+                        continue
+                    partial = round(partial + contributions[position][v], SUM_DECIMALS)
+                    low, high = bounds[k]
+                    status = constraint_status(compiled.types[k], compiled.values[k],
+                                               partial + low[t + 1], partial + high[t + 1])
+                    if status is False:
+                        break
+                    new_state.append(None if status else partial)
+                else:
+                    table[index, v] = next_layer.setdefault(tuple(new_state), len(next_layer))
+        transitions.append(table)
+        layer = next_layer
+        if len(layer) > max_states:
+            return None
+
+    # Every state of the last layer has all constraints decided and satisfied;
+    # counts are Python integers so they stay exact for large groups
+    completions = [np.ones(len(layer), dtype=object)]
+    for table in reversed(transitions):
+        following = np.append(completions[0], 0)[table]
+        completions.insert(0, following.sum(axis=1))
+    return GroupLattice(cells, grids, transitions, completions)
@@ -0,0 +1,146 @@
+"""
+Per-stage timing of analyses and their exposition in the Prometheus text format
+
+Each analysis collects its stage durations and counts in a Timings object,
+which is added to the process-wide registry when the analysis ends and can
+be returned to the client. The registry keeps cumulative histograms and
+counters only, so recording costs a few additions under a lock and no
+client library is needed.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Prefix of every exported metric name
+NAMESPACE = 'cmv'
+# Histogram upper bounds in seconds, covering cached lookups up to long t-SNE runs
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+class Timings:
+    """Stage durations in seconds and counts of one analysis"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block, adding to any time already spent in the stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_dict(self):
+        """Durations in seconds with the derived rates, as returned in the 'timings' response field"""
+        total = time.perf_counter() - self.started
+        timings = {'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+                   'total': round(total, 6)}
+        timings.update(self.counts)
+        matrices, candidates = self.counts.get('matrices', 0), self.counts.get('candidates', 0)
+        if candidates:
+            timings['acceptance_rate'] = matrices / candidates
+        if matrices and total > 0:
+            timings['matrices_per_second'] = round(matrices / total, 1)
+        return timings
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations, per label value"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label, value):
+        counts, total, observations = self.series.get(label, ([0] * len(self.buckets), 0.0, 0))
+        for k, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[k] += 1
+        self.series[label] = (counts, total + value, observations + 1)
+
+    def render(self, name, label_name):
+        lines = []
+        for label, (counts, total, observations) in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{name}_bucket{{{label_name}="{label}",le="{bound:g}"}} {count}')
+            lines.append(f'{name}_bucket{{{label_name}="{label}",le="+Inf"}} {observations}')
+            lines.append(f'{name}_sum{{{label_name}="{label}"}} {total:.6f}')
+            lines.append(f'{name}_count{{{label_name}="{label}"}} {observations}')
+        return lines
+
+
+class Metrics:
+    """Process-wide registry of stage durations, generated matrices and HTTP traffic"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_seconds = Histogram(SECONDS_BUCKETS)
+        self.request_seconds = Histogram(SECONDS_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+        self.requests = {}
+        self.totals = {'analyses': 0, 'matrices': 0, 'candidates': 0}
+
+    def record_analysis(self, timings):
+        """Add the stages and counts of a finished analysis"""
+        with self.lock:
+            for name, seconds in timings.stages.items():
+                self.stage_seconds.observe(name, seconds)
+            self.totals['analyses'] += 1
+            for name in ('matrices', 'candidates'):
+                self.totals[name] += timings.counts.get(name, 0)
+
+    def record_stage(self, name, seconds):
+        """Add one stage measured outside an analysis, such as the serialization of its result"""
+        with self.lock:
+            self.stage_seconds.observe(name, seconds)
+
+    def record_request(self, endpoint, method, status, seconds, size=None):
+        """Add a served HTTP request; size is None for streamed responses"""
+        with self.lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_seconds.observe(endpoint, seconds)
+            if size is not None:
+                self.response_bytes.observe(endpoint, size)
+
+    def render(self, extra=None):
+        """All metrics in the Prometheus text exposition format
+
+        extra maps further metric names to (type, help text, {label string: value}),
+        for values owned elsewhere such as cache sizes.
+        """
+        prefix = NAMESPACE
+        with self.lock:
+            lines = [f'# HELP {prefix}_stage_seconds Time spent in each analysis stage',
+                     f'# TYPE {prefix}_stage_seconds histogram']
+            lines += self.stage_seconds.render(f'{prefix}_stage_seconds', 'stage')
+            for name, help_text in (('analyses', 'Analyses completed'), ('matrices', 'Matrices generated'),
+                                    ('candidates', 'Candidate matrices drawn by rejection sampling')):
+                lines += [f'# HELP {prefix}_{name}_total {help_text}', f'# TYPE {prefix}_{name}_total counter',
+                          f'{prefix}_{name}_total {self.totals[name]}']
+            lines += [f'# HELP {prefix}_http_requests_total HTTP requests served',
+                      f'# TYPE {prefix}_http_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'{prefix}_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+            lines += [f'# HELP {prefix}_http_request_seconds Time to build each HTTP response',
+                      f'# TYPE {prefix}_http_request_seconds histogram']
+            lines += self.request_seconds.render(f'{prefix}_http_request_seconds', 'endpoint')
+            lines += [f'# HELP {prefix}_http_response_bytes Size of each HTTP response body as sent',
+                      f'# TYPE {prefix}_http_response_bytes histogram']
+            lines += self.response_bytes.render(f'{prefix}_http_response_bytes', 'endpoint')
+        for name, (kind, help_text, values) in (extra or {}).items():
+            lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} {kind}']
+            lines += [f'{prefix}_{name}{{{labels}}} {value}' if labels else f'{prefix}_{name} {value}'
+                      for labels, value in values.items()]
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,174 @@
+"""
+Chunked, process-parallel execution of the sampling and eigen stages
+
+Work is split into chunks whose size depends only on the request, never on
+the number of workers, and every chunk draws from its own seed derived from
+the request seed and the chunk index. Results are concatenated in chunk
+order, so a seeded request returns the same matrices whether the chunks run
+inline or on any number of pool workers.
+"""
+import atexit
+import json
+import logging
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from constraints import compile_constraints
+from eigen import eigen_decomposition, eigenvalues_only, is_symmetric_stack
+from sampling import MatrixSampler, ConstrainedSampler
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('MATRIX_WORKERS', os.cpu_count() or 1))
+MIN_CHUNK_CANDIDATES = 1024
+MAX_CHUNK_CANDIDATES = 65536
+# Large requests are split into about this many sampling chunks
+TARGET_CHUNKS = 64
+MAX_CHUNKS_PER_ROUND = 256
+# Below these sizes the pool's transfer overhead outweighs the parallel gain
+PARALLEL_SAMPLING_THRESHOLD = 200000
+PARALLEL_EIGEN_THRESHOLD = 20000
+MIN_EIGEN_CHUNK = 2048
+# Per-process cache of samplers, so workers reuse lattices between chunks
+MAX_CACHED_SAMPLERS = 8
+
+_pool = None
+_samplers = {}
+
+
+def _init_worker():
+    """Keep each worker's BLAS single-threaded so workers do not oversubscribe cores"""
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+
+def get_pool():
+    """Return the persistent process pool, or None when running on a single worker"""
+    global _pool
+    if _pool is None and WORKERS > 1:
+        logger.info(f"Starting process pool with {WORKERS} workers")
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_init_worker)
+        atexit.register(_pool.shutdown)
+    return _pool
+
+
+def run_chunks(function, tasks, parallel=True):
+    """Apply function to every task, on the pool when worthwhile, preserving order"""
+    pool = get_pool() if parallel and len(tasks) > 1 else None
+    if pool is None:
+        return [function(task) for task in tasks]
+    return list(pool.map(function, tasks))
+
+
+def chunk_seed(entropy, index):
+    """Seed of chunk index, independent of how chunks are scheduled"""
+    return np.random.SeedSequence(entropy, spawn_key=(index,))
+
+
+def _get_sampler(size, cell_ranges, constraints, sampler_type):
+    """Build, or reuse from this process's cache, a sampler and its compiled constraints"""
+    key = json.dumps([size, cell_ranges, constraints, sampler_type], sort_keys=True)
+    if key not in _samplers:
+        if len(_samplers) >= MAX_CACHED_SAMPLERS:
+            _samplers.clear()
+        if sampler_type == 'direct':
+            sampler = ConstrainedSampler(size, cell_ranges, constraints)
+        else:
+            sampler = MatrixSampler(size, cell_ranges)
+        _samplers[key] = (sampler, compile_constraints(constraints, size))
+    return _samplers[key]
+
+
+def _sample_chunk(task):
+    """Draw one chunk of candidates, returning the ones satisfying the constraints and the seconds spent checking them"""
+    size, cell_ranges, constraints, sampler_type, entropy, index, candidates = task
+    sampler, compiled = _get_sampler(size, cell_ranges, constraints, sampler_type)
+    sampler.reseed(chunk_seed(entropy, index))
+    block = sampler.sample(candidates)
+    start = time.perf_counter()
+    accepted = compiled.evaluate(block)
+    return block[accepted], time.perf_counter() - start
+
+
+def sample_in_chunks(size, cell_ranges, constraints, num_matrices, sampler_type, seed, prior_rate, max_attempts,
+                     progress=None, on_matrices=None, timings=None):
+    """Draw matrices in deterministic seeded chunks until num_matrices are accepted
+
+    Returns (matrices, attempts). Rounds of chunks are sized from the
+    acceptance rate seen so far, which itself depends only on earlier chunks.
+    progress, if given, is called as progress(accepted, num_matrices) after
+    every round. on_matrices, if given, is called with each round's newly
+    accepted matrices, in the order they appear in the returned stack.
+    timings, if given, gets the time spent evaluating constraints added to
+    its 'constraints' stage, summed over chunks even when they ran in parallel.
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    rate = max(prior_rate, 1e-6)
+    expected_candidates = num_matrices / rate
+    chunk_candidates = int(min(MAX_CHUNK_CANDIDATES, max(MIN_CHUNK_CANDIDATES, math.ceil(expected_candidates / TARGET_CHUNKS))))
+
+    accepted_blocks = []
+    accepted = 0
+    reported = 0
+    attempts = 0
+    index = 0
+    while accepted < num_matrices and attempts < max_attempts:
+        observed = accepted / attempts if accepted > 0 else rate
+        chunks = math.ceil((num_matrices - accepted) / observed * 1.2 / chunk_candidates)
+        chunks = max(1, min(chunks, MAX_CHUNKS_PER_ROUND, math.ceil((max_attempts - attempts) / chunk_candidates)))
+        tasks = [(size, cell_ranges, constraints, sampler_type, entropy, index + k, chunk_candidates)
+                 for k in range(chunks)]
+        parallel = chunks * chunk_candidates >= PARALLEL_SAMPLING_THRESHOLD
+        first_block = len(accepted_blocks)
+        for block, seconds in run_chunks(_sample_chunk, tasks, parallel):
+            accepted_blocks.append(block)
+            accepted += len(block)
+            if timings is not None:
+                timings.add('constraints', seconds)
+        attempts += chunks * chunk_candidates
+        index += chunks
+        if on_matrices is not None and reported < num_matrices:
+            fresh = np.concatenate(accepted_blocks[first_block:])[:num_matrices - reported]
+            if len(fresh):
+                on_matrices(fresh)
+                reported += len(fresh)
+        if progress is not None:
+            progress(min(accepted, num_matrices), num_matrices)
+
+    if accepted_blocks:
+        return np.concatenate(accepted_blocks)[:num_matrices], attempts
+    return np.empty((0, size, size)), attempts
+
+
+def _eigen_chunk(task):
+    """Eigen-decompose one chunk of a stack, returning (values, vectors or None)"""
+    matrices, symmetric, vectors = task
+    if not vectors:
+        return eigenvalues_only(matrices, symmetric=symmetric), None
+    return eigen_decomposition(matrices, symmetric=symmetric)
+
+
+def eigen_in_chunks(matrices, vectors=True):
+    """Eigen-decompose a stack, spreading large stacks over the process pool
+
+    Returns (values, vectors); with vectors=False only the eigenvalues are
+    computed and vectors is None.
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    # Decide eig vs eigh once for the whole stack so every chunk agrees
+    symmetric = len(matrices) > 0 and is_symmetric_stack(matrices)
+    if len(matrices) < PARALLEL_EIGEN_THRESHOLD or get_pool() is None:
+        return _eigen_chunk((matrices, symmetric, vectors))
+
+    chunk_size = max(MIN_EIGEN_CHUNK, math.ceil(len(matrices) / WORKERS))
+    tasks = [(matrices[start:start + chunk_size], symmetric, vectors) for start in range(0, len(matrices), chunk_size)]
+    results = run_chunks(_eigen_chunk, tasks)
+    values = np.concatenate([r[0] for r in results])
+    return values, np.concatenate([r[1] for r in results]) if vectors else None
@@ -0,0 +1,270 @@
+"""
+Dimensionality-reduction backends and their automatic selection
+
+Every backend maps (features, dimensionality, random_state) to
+(coordinates, model), where model is None unless it can project new points
+with model.transform. With algorithm 'auto' the first backend in
+AUTO_PREFERENCE whose estimated run time fits the latency budget is used.
+The 'spectrum' backend is not a reduction at all: it reads coordinates
+straight off each sorted spectrum, so it is only chosen explicitly.
+
+scikit-learn, UMAP and openTSNE are imported on first use, since importing
+UMAP alone takes seconds. UMAP's numba kernels are compiled on its first fit;
+warm_up does this on a tiny dataset, in the background with start_warm_up.
+"""
+import importlib.util
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+# Numba caches compiled kernels that allow it here, where the installed packages may be read-only
+os.environ.setdefault('NUMBA_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.numba_cache'))
+UMAP_AVAILABLE = importlib.util.find_spec('umap') is not None
+OPENTSNE_AVAILABLE = importlib.util.find_spec('openTSNE') is not None
+
+logger = logging.getLogger(__name__)
+
+# Seed used by backends that are deterministic at no cost when no seed is requested
+DEFAULT_RANDOM_STATE = 42
+REDUCTION_LATENCY_BUDGET = float(os.environ.get('REDUCTION_LATENCY_BUDGET', 60))
+# Exact t-SNE, needed above 3 components, is quadratic in the number of points
+MAX_EXACT_TSNE = 5000
+# Quality first: the first backend expected to finish within the budget is chosen
+AUTO_PREFERENCE = ('tsne', 'fft_tsne', 'umap', 'randomized_pca')
+# Alternative names accepted for backends
+ALGORITHM_ALIASES = {'none': 'spectrum'}
+CPUS = os.cpu_count() or 1
+# Set to 0 to skip compiling UMAP at startup, leaving the cost to the first UMAP request
+REDUCER_WARMUP = os.environ.get('REDUCER_WARMUP', '1') != '0'
+# Points of the warm-up fits: UMAP finds exact neighbours below 4096 points and
+# runs NN-descent above, so NN-descent is compiled separately
+WARMUP_POINTS = 64
+WARMUP_NNDESCENT_POINTS = 300
+
+
+class PaddedModel:
+    """Model whose projections are padded with zero columns up to a fixed dimensionality"""
+
+    def __init__(self, model, dimensionality):
+        self.model = model
+        self.dimensionality = dimensionality
+
+    def transform(self, features):
+        coords = self.model.transform(features)
+        return np.pad(coords, ((0, 0), (0, self.dimensionality - coords.shape[1])))
+
+
+class SpectrumProjection:
+    """Coordinates read off sorted eigenvalue features, independent of the order eig returns them in
+
+    Real features give the largest eigenvalues in descending order. Complex
+    features, the real plane followed by the imaginary plane, are sorted by
+    real then imaginary part, descending, and give the real and imaginary
+    parts of the leading eigenvalues in turn. Missing components are zero.
+    """
+
+    def __init__(self, dimensionality, use_imaginary=False):
+        self.dimensionality = dimensionality
+        self.use_imaginary = use_imaginary
+
+    def transform(self, features):
+        features = np.asarray(features, dtype=float)
+        if self.use_imaginary:
+            half = features.shape[1] // 2
+            real, imag = features[:, :half], features[:, half:]
+            # lexsort orders by its last key first
+            order = np.lexsort((-imag, -real), axis=1)
+            real = np.take_along_axis(real, order, axis=1)
+            imag = np.take_along_axis(imag, order, axis=1)
+            columns = np.stack([real, imag], axis=2).reshape(len(features), -1)
+        else:
+            columns = -np.sort(-features, axis=1)
+        columns = columns[:, :self.dimensionality]
+        return np.pad(columns, ((0, 0), (0, self.dimensionality - columns.shape[1])))
+
+
+def _spectrum(features, dimensionality, random_state, use_imaginary=False):
+    """Sorted eigenvalue components as coordinates, in linear time"""
+    model = SpectrumProjection(dimensionality, use_imaginary)
+    return model.transform(features), model
+
+
+def _pca(features, dimensionality, random_state, solver='full'):
+    """Linear projection onto the leading principal components"""
+    from sklearn.decomposition import PCA
+    components = min(dimensionality, *features.shape)
+    if solver == 'randomized' and components == min(features.shape):
+        solver = 'full'  # Randomized SVD needs fewer components than the data's rank bound
+    model = PCA(n_components=components, svd_solver=solver,
+                random_state=DEFAULT_RANDOM_STATE if random_state is None else random_state).fit(features)
+    if components < dimensionality:
+        # Fewer features than requested components, so the extra axes are flat
+        model = PaddedModel(model, dimensionality)
+    return model.transform(features), model
+
+
+def _randomized_pca(features, dimensionality, random_state):
+    return _pca(features, dimensionality, random_state, solver='randomized')
+
+
+def _tsne(features, dimensionality, random_state):
+    """sklearn t-SNE, Barnes-Hut up to 3 components and exact beyond"""
+    from sklearn.manifold import TSNE
+    method = 'barnes_hut' if dimensionality <= 3 else 'exact'
+    if method == 'exact' and len(features) > MAX_EXACT_TSNE:
+        raise ValueError(f't-SNE with more than 3 components is limited to {MAX_EXACT_TSNE} points. Please use UMAP or PCA.')
+    perplexity_val = min(30, max(1, len(features) - 1))  # Ensure perplexity is at least 1 and less than n_samples
+    # PCA initialisation cannot produce more components than there are features
+    init = 'pca' if dimensionality <= features.shape[1] else 'random'
+    tsne = TSNE(n_components=dimensionality, perplexity=perplexity_val, method=method, init=init, n_jobs=-1,
+                random_state=DEFAULT_RANDOM_STATE if random_state is None else random_state)
+    return tsne.fit_transform(features), None
+
+
+def _fft_tsne(features, dimensionality, random_state):
+    """openTSNE with FFT-accelerated gradients, which can also place new points"""
+    import openTSNE
+    perplexity_val = min(30, max(1, (len(features) - 1) / 3))
+    embedding = openTSNE.TSNE(n_components=dimensionality, perplexity=perplexity_val, negative_gradient_method='fft',
+                              n_jobs=-1, random_state=DEFAULT_RANDOM_STATE if random_state is None else random_state).fit(features)
+    return np.asarray(embedding), embedding
+
+
+def _umap(features, dimensionality, random_state):
+    """UMAP, parallel unless a fixed seed is requested"""
+    import umap
+    if random_state is None:
+        reducer = umap.UMAP(n_components=dimensionality, n_jobs=-1)
+    else:
+        # A fixed seed makes UMAP reproducible but single-threaded
+        reducer = umap.UMAP(n_components=dimensionality, random_state=random_state)
+    return reducer.fit_transform(features), reducer
+
+
+# Costs are rough single-core figures: a fixed start-up time plus seconds per point.
+# Parallel backends are assumed to scale with the number of cores.
+REDUCERS = {
+    'tsne': {'fit': _tsne, 'available': True, 'max_components': None, 'overhead': 0.5, 'per_point': 1e-2, 'parallel': False},
+    'fft_tsne': {'fit': _fft_tsne, 'available': OPENTSNE_AVAILABLE, 'max_components': 2, 'overhead': 1.0, 'per_point': 2e-3, 'parallel': True},
+    'umap': {'fit': _umap, 'available': UMAP_AVAILABLE, 'max_components': None, 'overhead': 5.0, 'per_point': 2.5e-3, 'parallel': True},
+    'pca': {'fit': _pca, 'available': True, 'max_components': None, 'overhead': 0.0, 'per_point': 1e-6, 'parallel': False},
+    'randomized_pca': {'fit': _randomized_pca, 'available': True, 'max_components': None, 'overhead': 0.0, 'per_point': 1e-6, 'parallel': False},
+    'spectrum': {'fit': _spectrum, 'available': True, 'max_components': None, 'overhead': 0.0, 'per_point': 1e-7, 'parallel': False},
+}
+
+
+def available_reducers():
+    """Names of the backends usable in this installation"""
+    return [name for name, reducer in REDUCERS.items() if reducer['available']]
+
+
+def estimate_seconds(name, n_samples):
+    """Rough run time of a backend on n_samples points"""
+    reducer = REDUCERS[name]
+    per_point = reducer['per_point'] / (CPUS if reducer['parallel'] else 1)
+    return reducer['overhead'] + per_point * n_samples
+
+
+def min_points(name, dimensionality):
+    """Fewest points a backend can embed into dimensionality components"""
+    if name == 'umap':
+        # UMAP's spectral initialisation needs more points than components plus one
+        return dimensionality + 2
+    if name in ('tsne', 'fft_tsne'):
+        return dimensionality
+    return 1
+
+
+def supports(name, n_samples, dimensionality):
+    """Check if a backend can embed n_samples points into dimensionality components"""
+    reducer = REDUCERS[name]
+    if not reducer['available']:
+        return False
+    if reducer['max_components'] is not None and dimensionality > reducer['max_components']:
+        return False
+    if n_samples < min_points(name, dimensionality):
+        return False
+    return not (name == 'tsne' and dimensionality > 3 and n_samples > MAX_EXACT_TSNE)
+
+
+def select_reducer(n_samples, dimensionality, latency_budget=REDUCTION_LATENCY_BUDGET):
+    """Pick the preferred backend expected to finish within the latency budget"""
+    for name in AUTO_PREFERENCE:
+        if supports(name, n_samples, dimensionality) and estimate_seconds(name, n_samples) <= latency_budget:
+            return name
+    return 'randomized_pca'
+
+
+def fit_reducer(name, features, dimensionality, random_state=None, **options):
+    """Embed features with a backend, returning (coordinates, model or None)
+
+    options are passed on to backends that take them, such as use_imaginary for 'spectrum'.
+    """
+    if name not in REDUCERS:
+        raise ValueError(f"Unknown algorithm '{name}'. Expected 'auto' or one of: {', '.join(REDUCERS)}.")
+    if not REDUCERS[name]['available']:
+        raise ValueError(f"Algorithm '{name}' is not available in this installation. Available: {', '.join(available_reducers())}.")
+    return REDUCERS[name]['fit'](features, dimensionality, random_state, **options)
+
+
+def unfitted_model(name, dimensionality, use_imaginary=False):
+    """Model of a backend that needs no fitting, rebuilt from the request alone, or None"""
+    if name == 'spectrum':
+        return SpectrumProjection(dimensionality, use_imaginary)
+    return None
+
+
+def axis_labels(name, dimensionality, use_imaginary=False):
+    """Axis titles for a backend's coordinates, or None when its components mean nothing on their own"""
+    if name != 'spectrum':
+        return None
+    if use_imaginary:
+        return [f"{'Im' if k % 2 else 'Re'}(λ{k // 2 + 1})" for k in range(dimensionality)]
+    return [f'λ{k + 1}' for k in range(dimensionality)]
+
+
+def warm_up():
+    """Import the reducer libraries and compile UMAP's numba kernels on tiny random data"""
+    start = time.perf_counter()
+    try:
+        import sklearn.decomposition, sklearn.manifold, sklearn.neighbors  # noqa: F401
+        if UMAP_AVAILABLE:
+            import umap
+            from pynndescent import NNDescent
+            rng = np.random.default_rng(DEFAULT_RANDOM_STATE)
+            umap.UMAP(n_components=2, n_jobs=-1).fit_transform(rng.normal(size=(WARMUP_POINTS, 4)))
+            NNDescent(rng.normal(size=(WARMUP_NNDESCENT_POINTS, 4)), n_neighbors=15).neighbor_graph
+    except Exception as e:
+        logger.warning(f"Reducer warm-up failed: {str(e)}")
+        return
+    logger.info(f"Reducers warmed up in {time.perf_counter() - start:.1f}s")
+
+
+def launch_numba_threads():
+    """Start numba's threading layer on the calling thread
+
+    UMAP runs on job threads, and numba's TBB layer, when first started from
+    a thread other than the main one, keeps the process from exiting.
+    """
+    if not UMAP_AVAILABLE:
+        return
+    try:
+        from numba.np.ufunc.parallel import _launch_threads
+        _launch_threads()
+    except Exception as e:
+        logger.warning(f"Could not start numba threads: {str(e)}")
+
+
+def start_warm_up():
+    """Start numba's threads here and run warm_up on a daemon thread unless disabled by REDUCER_WARMUP
+
+    Call from the main thread. Returns the warm-up thread, or None.
+    """
+    launch_numba_threads()
+    if not REDUCER_WARMUP:
+        return None
+    thread = threading.Thread(target=warm_up, name='reducer-warmup', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,121 @@
+"""
+Vectorized sampling of candidate matrices from per-cell value grids
+"""
+import math
+import numpy as np
+from constraints import compile_constraints
+from lattice import build_group_lattice, constraint_groups
+
+# Rounds of group-wise rejection for constraint groups too large for the lattice
+FALLBACK_REJECTION_ROUNDS = 100
+
+
+def grid_size(cell_range):
+    """Number of values on a cell's grid, computed without materializing it"""
+    step = cell_range['step']
+    if step <= 0:
+        step = 1  # Default to 1 if step is invalid
+    # Same length as np.arange(min, max + step/2, step)
+    count = math.ceil((cell_range['max'] + step/2 - cell_range['min']) / step)
+    # If no values in range, the min value is used
+    return max(count, 1)
+
+
+def cell_values(cell_range):
+    """Return the grid of values a single cell can take"""
+    step = cell_range['step']
+    if step <= 0:
+        step = 1  # Default to 1 if step is invalid
+    return cell_range['min'] + step * np.arange(grid_size(cell_range), dtype=float)
+
+
+def build_cell_grids(size, cell_ranges):
+    """Precompute the value grid of every cell in row-major order"""
+    return [cell_values(cell_ranges[f"{i},{j}"]) for i in range(size) for j in range(size)]
+
+
+class MatrixSampler:
+    """Draws blocks of candidate matrices with a seeded NumPy generator"""
+
+    def __init__(self, size, cell_ranges, seed=None, rng=None):
+        self.size = size
+        self.grids = build_cell_grids(size, cell_ranges)
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+
+        # Pad every grid into one (cells, max_len) table so a whole block of
+        # cells can be gathered with a single fancy-indexing operation
+        self.lengths = np.array([len(values) for values in self.grids])
+        self.table = np.zeros((len(self.grids), self.lengths.max()))
+        for k, values in enumerate(self.grids):
+            self.table[k, :len(values)] = values
+        self._cell_index = np.arange(len(self.grids))
+
+    def reseed(self, seed):
+        """Replace the random generator, e.g. with a per-chunk seed"""
+        self.rng = np.random.default_rng(seed)
+
+    def sample_indices(self, batch):
+        """Draw a (batch, cells) block of grid indices"""
+        # Uniform integers in [0, length) per cell, broadcast over the block
+        return self.rng.integers(0, self.lengths, size=(batch, len(self.grids)))
+
+    def values_from_indices(self, indices):
+        """Map a (batch, cells) block of grid indices to a (batch, size, size) array"""
+        values = self.table[self._cell_index, indices]
+        return values.reshape(len(indices), self.size, self.size)
+
+    def sample(self, batch):
+        """Draw a (batch, size, size) block of candidate matrices"""
+        return self.values_from_indices(self.sample_indices(batch))
+
+
+class ConstrainedSampler:
+    """Draws matrices directly from the constrained lattice instead of rejecting them
+
+    Cells outside every constraint are drawn uniformly from their grids. Each
+    group of constraints sharing cells is sampled uniformly from its layered
+    DP, so every returned matrix is feasible and all feasible matrices are
+    equally likely. Groups whose DP exceeds its budget fall back to
+    rejection sampling of their own cells only.
+    """
+
+    def __init__(self, size, cell_ranges, constraints, seed=None, rng=None):
+        self.size = size
+        self.base = MatrixSampler(size, cell_ranges, seed=seed, rng=rng)
+        self.rng = self.base.rng
+        self.compiled = compile_constraints(constraints, size)
+
+        self.lattices = []
+        self.fallback_groups = []
+        for cells, ids in constraint_groups(self.compiled):
+            lattice = build_group_lattice(self.compiled, ids, cells, self.base.grids)
+            if lattice is None:
+                group_constraints = compile_constraints([self.compiled.constraints[k] for k in ids], size)
+                self.fallback_groups.append((cells, group_constraints))
+            elif lattice.count == 0:
+                raise ValueError('Constraints cannot be satisfied with the current cell ranges')
+            else:
+                self.lattices.append(lattice)
+
+    def reseed(self, seed):
+        """Replace the random generator, e.g. with a per-chunk seed"""
+        self.base.reseed(seed)
+        self.rng = self.base.rng
+
+    def sample(self, batch):
+        """Draw a (batch, size, size) block of matrices satisfying the constraints"""
+        flat = self.base.sample(batch).reshape(batch, -1)
+        for lattice in self.lattices:
+            flat[:, lattice.cells] = lattice.sample(batch, self.rng)
+
+        for cells, group_constraints in self.fallback_groups:
+            failing = ~group_constraints.evaluate(flat.reshape(batch, self.size, self.size))
+            for _ in range(FALLBACK_REJECTION_ROUNDS):
+                if not failing.any():
+                    break
+                redraw = self.base.sample(int(failing.sum())).reshape(-1, self.size * self.size)
+                rows = np.flatnonzero(failing)
+                flat[np.ix_(rows, cells)] = redraw[:, cells]
+                failing[rows] = ~group_constraints.evaluate(flat[rows].reshape(-1, self.size, self.size))
+        # Rows of fallback groups that are still failing are removed by the caller's constraint check
+        return flat.reshape(batch, self.size, self.size)
@@ -0,0 +1,130 @@
+"""
+Persistent on-disk store of analysis runs
+
+Each run is a directory holding one .npy file per array and a manifest.json
+with the request parameters and a summary. Arrays are read back with
+np.load(mmap_mode='r'), so stored runs can be sliced without loading them
+into memory. Runs are written to a temporary directory and renamed into
+place, so readers never see a partial run.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Empty to disable the store
+RESULT_STORE_DIR = os.environ.get('RESULT_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'))
+# Oldest runs are deleted beyond this many
+RESULT_STORE_MAX_RUNS = int(os.environ.get('RESULT_STORE_MAX_RUNS', 50))
+MANIFEST = 'manifest.json'
+RUN_ID_PATTERN = re.compile(r'[0-9a-f]{8,64}')
+
+
+class ResultStore:
+    """Directory of stored runs, each addressed by its run id"""
+
+    def __init__(self, directory=RESULT_STORE_DIR, max_runs=RESULT_STORE_MAX_RUNS):
+        self.directory = directory or None
+        self.max_runs = max_runs
+        self.lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def _path(self, run_id):
+        """Directory of a run, rejecting ids that are not plain hex strings"""
+        if not RUN_ID_PATTERN.fullmatch(run_id):
+            raise KeyError(f'Invalid run id {run_id}')
+        return os.path.join(self.directory, run_id)
+
+    def exists(self, run_id):
+        return self.enabled and os.path.exists(os.path.join(self._path(run_id), MANIFEST))
+
+    def save(self, run_id, manifest, arrays):
+        """Write a run's arrays and manifest, replacing any run with the same id"""
+        if not self.enabled:
+            return
+        path = self._path(run_id)
+        temporary = os.path.join(self.directory, f'.{run_id}.{uuid.uuid4().hex[:8]}.tmp')
+        os.makedirs(temporary)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, f'{name}.npy'), np.ascontiguousarray(array))
+        manifest = dict(manifest, run_id=run_id, created=time.time(),
+                        arrays={name: {'shape': list(np.shape(array)), 'dtype': str(np.asarray(array).dtype)}
+                                for name, array in arrays.items()})
+        with open(os.path.join(temporary, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+
+        with self.lock:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.rename(temporary, path)
+            self._trim()
+        logger.info(f"Stored run {run_id[:12]} with arrays {', '.join(arrays)}")
+
+    def manifest(self, run_id):
+        """Return a run's manifest, or None when it is not stored"""
+        if not self.exists(run_id):
+            return None
+        with open(os.path.join(self._path(run_id), MANIFEST)) as f:
+            return json.load(f)
+
+    def load(self, run_id, names=None):
+        """Return a run's arrays as read-only memory maps, or None when it is not stored
+
+        Requested names the run does not hold are left out of the result.
+        """
+        manifest = self.manifest(run_id)
+        if manifest is None:
+            return None
+        names = [name for name in names or manifest['arrays'] if name in manifest['arrays']]
+        return {name: np.load(os.path.join(self._path(run_id), f'{name}.npy'), mmap_mode='r') for name in names}
+
+    def list(self):
+        """Manifests of all stored runs, newest first"""
+        if not self.enabled:
+            return []
+        manifests = []
+        for run_id in os.listdir(self.directory):
+            if RUN_ID_PATTERN.fullmatch(run_id):
+                manifest = self.manifest(run_id)
+                if manifest is not None:
+                    manifests.append(manifest)
+        return sorted(manifests, key=lambda m: m['created'], reverse=True)
+
+    def run_for_result(self, result_id):
+        """Id of the newest stored run holding the matrices of a result, or None
+
+        Runs are stored under their embedding id, so a result id is resolved
+        through the request recorded in each manifest.
+        """
+        for manifest in self.list():
+            if manifest.get('request', {}).get('result_id') == result_id:
+                return manifest['run_id']
+        return None
+
+    def delete(self, run_id):
+        """Delete a run, returning False when it was not stored"""
+        if not self.exists(run_id):
+            return False
+        with self.lock:
+            shutil.rmtree(self._path(run_id), ignore_errors=True)
+        logger.info(f"Deleted run {run_id[:12]}")
+        return True
+
+    def _trim(self):
+        """Delete the oldest runs beyond the limit"""
+        runs = [os.path.join(self.directory, r) for r in os.listdir(self.directory) if RUN_ID_PATTERN.fullmatch(r)]
+        runs.sort(key=os.path.getmtime)
+        for path in runs[:max(0, len(runs) - self.max_runs)]:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the benchmark suite measures every stage and spots regressions.
+"""
+import copy
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import build_cases, run_case, compare, preset_ranges, preset_constraints
+
+
+def test_benchmark_case():
+    """Test that a small case times every stage and reports result sizes."""
+    print("Testing benchmark cases...")
+
+    cases = build_cases([2], [50], ['none', 'tight'], ['threeLayerShield'])
+    assert [case[0] for case in cases] == ['grid/2x2/none/50', 'grid/2x2/tight/50', 'preset/threeLayerShield/50'], "Unexpected cases!"
+    assert preset_ranges('reactor', 4)['3,0'] == {'min': 0, 'max': 0, 'step': 1}, "Rows beyond the layers should be fixed!"
+    assert len(preset_constraints('threeLayerShield', 3)) == 4, "3-layer shield constraints missing!"
+
+    name, size, cell_ranges, constraints, count = cases[1]
+    case = run_case(name, size, cell_ranges, constraints, count, reducers=['spectrum', 'pca'], repeat=1)
+    expected = {'counting', 'sampling', 'constraints', 'eigen', 'eigenvectors', 'features', 'dedup',
+                'reduction.spectrum', 'reduction.pca', 'serialize_json', 'serialize_binary'}
+    assert set(case['stages']) == expected, f"Unexpected stages {set(case['stages'])}!"
+    assert all(seconds >= 0 for seconds in case['stages'].values()), "Every stage should be timed!"
+    assert case['accepted'] == 50 and case['json_bytes'] > case['binary_bytes'], "Result sizes missing!"
+    print(f"✓ {len(case['stages'])} stages timed for {name}")
+
+    baseline = {'environment': {}, 'results': [case]}
+    slower = copy.deepcopy(baseline)
+    slower['results'][0]['stages']['sampling'] = max(case['stages']['sampling'], 0.01) * 2
+    regressions = compare(slower, baseline)
+    assert [r[1] for r in regressions] == ['sampling'], f"Expected a sampling regression, got {regressions}!"
+    assert compare(baseline, baseline) == [], "Identical runs should not regress!"
+    print("✓ Regressions against a baseline are reported")
+
+
+if __name__ == "__main__":
+    test_benchmark_case()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the binary result format and response compression.
+"""
+import gzip
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from binary_format import encode_arrays, decode_arrays
+
+
+def test_binary_roundtrip():
+    """Test that arrays survive encoding, including complex and single-precision ones."""
+    print("Testing binary encoding...")
+
+    arrays = {
+        'coordinates': np.array([[0.5, -1.25], [3.0, 4.5], [1.0, 2.0]]),
+        'eigenvalues': np.array([[1 + 2j, 1 - 2j, 3], [0, 1, 2], [5j, -5j, 1]]),
+        'matrices': np.arange(27, dtype=float).reshape(3, 3, 3) / 10,
+        'real_complex': np.array([1.0 + 0j, 2.0 + 0j])
+    }
+    data = encode_arrays(arrays, {'coordinates': 'float32'})
+    decoded = decode_arrays(data)
+
+    assert np.array_equal(decoded['coordinates'], arrays['coordinates']), "Coordinates changed!"
+    assert np.array_equal(decoded['eigenvalues'], arrays['eigenvalues']), "Complex planes changed!"
+    assert np.array_equal(decoded['matrices'], arrays['matrices']), "Double precision lost!"
+    assert not np.iscomplexobj(decoded['real_complex']), "Real-valued complex arrays should be stored as real!"
+    print("✓ Real, complex and single-precision arrays round-trip")
+
+
+def test_binary_response():
+    """Test format negotiation and compression on /generate."""
+    print("Testing binary responses...")
+    from app import app
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 50,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -2, 'max': 2, 'step': 0.5} for i in range(size) for j in range(size)},
+        'constraints': [],
+        'seed': 3
+    }
+    client = app.test_client()
+
+    as_json = client.post('/generate', json=payload).get_json()
+    response = client.post('/generate', json=dict(payload, format='binary'))
+    assert response.mimetype == 'application/octet-stream', f"Unexpected type {response.mimetype}!"
+    decoded = decode_arrays(response.data)
+    assert np.allclose(decoded['coordinates'], as_json['coordinates'], atol=1e-4), "Coordinates differ from JSON!"
+    assert decoded['matrices'].tolist() == as_json['matrices'], "Matrices differ from JSON!"
+    eigenvalues = [[complex(v['real'], v['imag']) if isinstance(v, dict) else v for v in row] for row in as_json['eigenvalues']]
+    assert np.allclose(decoded['eigenvalues'], eigenvalues), "Eigenvalues differ from JSON!"
+    print("✓ Binary response carries the same data as the JSON response")
+
+    compressed = client.post('/generate', json=payload, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers.get('Content-Encoding') == 'gzip', "Response was not compressed!"
+    assert gzip.decompress(compressed.data) == client.post('/generate', json=payload).data, "Compressed body differs!"
+    print(f"✓ gzip negotiated ({len(compressed.data)} compressed bytes)")
+
+    oversized = client.post('/generate', data=b'{"padding": "' + b'x' * (2 * 1024 * 1024) + b'"}', content_type='application/json')
+    assert oversized.status_code == 413 and 'error' in oversized.get_json(), "Oversized requests should get a JSON 413!"
+    print("✓ Oversized request bodies are refused")
+
+
+if __name__ == "__main__":
+    test_binary_roundtrip()
+    test_binary_response()
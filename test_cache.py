@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the result cache.
+"""
+import tempfile
+import time
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cache import ResultCache, cache_key, canonical_constraints
+
+
+def test_result_cache():
+    """Test key canonicalization, LRU eviction and the disk tier."""
+    print("Testing result cache...")
+
+    a = cache_key(3, {'0,0': {'min': 0, 'max': 2.0, 'step': 0.5}}, canonical_constraints([{'cells': ['0,1', '0,0'], 'type': 'sum_less', 'value': 2}]))
+    b = cache_key(3, {'0,0': {'step': 0.5, 'max': 2, 'min': 0.0}}, canonical_constraints([{'cells': ['0,0', '0,1'], 'type': 'sum_less', 'value': 2.0}]))
+    assert a == b, "Equivalent requests should share a key!"
+    assert a != cache_key(3, {'0,0': {'min': 0, 'max': 2, 'step': 0.25}}, []), "Different requests should not share a key!"
+    print("✓ Equivalent requests hash to the same key")
+
+    block = np.zeros(100)  # 800 bytes
+    cache = ResultCache('test', max_bytes=2000, directory=None)
+    cache.put('a', {'x': block})
+    cache.put('b', {'x': block})
+    assert cache.get('a') is not None, "Entry missing!"
+    cache.put('c', {'x': block})  # Evicts 'b', the least recently used
+    assert cache.get('b') is None and cache.get('a') is not None, "LRU order not respected!"
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['bytes'] <= 2000, "Memory budget exceeded!"
+    assert stats['hits'] == 2 and stats['misses'] == 1, f"Unexpected stats {stats}!"
+    print("✓ Least recently used entries are evicted within the memory budget")
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache('test', max_bytes=2000, directory=directory)
+        cache.put('a', {'x': np.arange(5.0), 'y': np.array([1j, 2])})
+        fresh = ResultCache('test', max_bytes=2000, directory=directory)
+        entry = fresh.get('a')
+        assert entry is not None and np.array_equal(entry['y'], [1j, 2]), "Disk tier lost the entry!"
+        assert fresh.stats()['disk_hits'] == 1, "Disk hit not counted!"
+    print("✓ Entries survive in the disk tier")
+
+
+def test_repeat_request():
+    """Test that repeat requests reuse the eigen and coordinate layers."""
+    print("Testing cached analysis requests...")
+    from app import app, eigen_cache, coords_cache
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 300,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': 0, 'max': 4, 'step': 0.5} for i in range(size) for j in range(size)},
+        'constraints': [{'cells': ['0,0', '1,1'], 'type': 'sum_less', 'value': 5}],
+        'seed': 11
+    }
+    client = app.test_client()
+
+    first = client.post('/generate', json=payload).get_json()
+    hits = eigen_cache.hits
+    start = time.time()
+    second = client.post('/generate', json=payload).get_json()
+    elapsed = time.time() - start
+    assert first == second, "Cached response differs from the original!"
+    assert eigen_cache.hits == hits + 1 and coords_cache.hits >= 1, "Repeat request missed the cache!"
+    print(f"✓ Repeat request served from cache in {elapsed * 1000:.0f} ms")
+
+    umap_hits = coords_cache.hits
+    switched = client.post('/generate', json=dict(payload, dimensionality=3)).get_json()
+    assert switched['matrices'] == first['matrices'], "Changing the reduction should reuse the matrices!"
+    assert eigen_cache.hits == hits + 2 and coords_cache.hits == umap_hits, "Unexpected cache layer use!"
+    print("✓ Changing only the reduction reuses the eigen layer")
+
+    stats = client.get('/cache/stats').get_json()
+    assert stats['eigen']['entries'] >= 1, "Cache stats not exposed!"
+
+
+if __name__ == "__main__":
+    test_result_cache()
+    test_repeat_request()
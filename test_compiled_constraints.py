@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that compiled constraints match the per-matrix check.
+"""
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import check_constraints
+from constraints import compile_constraints
+
+
+def reference_check(matrix, constraints):
+    """Original cell-by-cell constraint check"""
+    for constraint in constraints:
+        cell_sum = sum(matrix[int(cell.split(',')[0])][int(cell.split(',')[1])] for cell in constraint['cells'])
+        if constraint['type'] == 'sum_greater' and cell_sum < constraint['value']:
+            return False
+        elif constraint['type'] == 'sum_less' and cell_sum > constraint['value']:
+            return False
+        elif constraint['type'] == 'sum_equal' and abs(cell_sum - constraint['value']) > 1e-6:
+            return False
+    return True
+
+
+def test_compiled_constraints():
+    """Test batch evaluation against the reference implementation."""
+    print("Testing compiled constraint evaluation...")
+
+    size = 3
+    constraints = [
+        {'cells': ['0,0', '0,1', '0,2'], 'type': 'sum_less', 'value': 5},
+        {'cells': ['1,1'], 'type': 'sum_greater', 'value': 1},
+        {'cells': ['2,0', '2,2'], 'type': 'sum_equal', 'value': 3},
+    ]
+    rng = np.random.default_rng(7)
+    matrices = rng.integers(0, 4, size=(2000, size, size)).astype(float)
+
+    compiled = compile_constraints(constraints, size)
+    mask = compiled.evaluate(matrices)
+    expected = np.array([reference_check(m, constraints) for m in matrices])
+    assert mask.shape == (2000,), "Mask should have one entry per matrix!"
+    assert np.array_equal(mask, expected), "Compiled constraints disagree with the reference check!"
+    assert 0 < mask.sum() < len(mask), "Test data should contain both passing and failing matrices!"
+    print(f"✓ Batch mask matches the reference check ({mask.sum()} of {len(mask)} pass)")
+
+    # The scalar API delegates to the compiled form
+    scalar = np.array([check_constraints(m, constraints) for m in matrices[:200]])
+    assert np.array_equal(scalar, expected[:200]), "check_constraints disagrees with the reference check!"
+    print("✓ check_constraints matches the reference check")
+
+    # No constraints accept everything
+    assert compile_constraints([], size).evaluate(matrices).all(), "Empty constraint list should accept all matrices!"
+    print("✓ Empty constraint list accepts every matrix")
+
+
+if __name__ == "__main__":
+    test_compiled_constraints()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test script to verify cost estimates and admission control of analyses.
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cost import CostModel
+
+
+def test_cost_model():
+    """Test that estimates grow with the request and that over-budget requests are downgraded or refused."""
+    print("Testing cost model...")
+
+    model = CostModel(calibration='')
+    small = model.estimate(3, 1000, 2, algorithm='tsne')
+    large = model.estimate(3, 100000, 2, algorithm='tsne')
+    assert large['total_seconds'] > small['total_seconds'], "Estimate should grow with the number of matrices!"
+    assert large['memory_bytes'] > small['memory_bytes'], "Memory should grow with the number of matrices!"
+    assert model.estimate(3, 1000, 2, algorithm='auto', latency_budget=0.001)['algorithm'] != 'auto', "Auto should be resolved!"
+    sparse = model.estimate(3, 1000, 2, acceptance_rate=0.01)
+    assert sparse['candidates'] == 100000 and sparse['seconds']['sampling'] > small['seconds']['sampling'], "Sampling should scale with rejections!"
+    print(f"✓ 1000 matrices estimated at {small['total_seconds']}s, 100000 at {large['total_seconds']}s")
+
+    request = dict(size=3, num_matrices=100000, dimensionality=2, algorithm='tsne')
+    admitted = model.admit(max_seconds=large['total_seconds'] / 2, **request)
+    assert admitted['admission'] == 'downgrade' and admitted['downgraded_from'] == 'tsne', "Should downgrade t-SNE!"
+    assert admitted['total_seconds'] <= large['total_seconds'] / 2, "Downgraded estimate should fit the budget!"
+    refused = model.admit(downgrade=False, max_seconds=large['total_seconds'] / 2, **request)
+    assert refused['admission'] == 'reject' and 'limit' in refused['reason'], "Should refuse without downgrading!"
+    assert model.admit(max_memory_mb=0.001, **request)['admission'] == 'reject', "Nothing fits a tiny memory budget!"
+    print(f"✓ Over-budget t-SNE downgraded to {admitted['algorithm']}, or refused")
+
+    model.observe(large, {'reduction': large['seconds']['reduction'] * 2})
+    assert model.factor('reduction.tsne') > 1, "Slower measurements should raise the correction factor!"
+    print(f"✓ Measured timings correct the estimates (t-SNE factor {model.factor('reduction.tsne'):.2f})")
+
+
+def test_cost_endpoints():
+    """Test /estimate and the admission of /generate requests."""
+    print("Testing cost endpoints...")
+    import app as app_module
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 300,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -3, 'max': 3, 'step': 0.5} for i in range(size) for j in range(size)},
+        'constraints': [{'cells': ['0,0', '1,1'], 'type': 'sum_greater', 'value': 1}],
+        'algorithm': 'tsne',
+        'seed': 3,
+        'cache': False,
+        'store': False
+    }
+    client = app_module.app.test_client()
+
+    estimate = client.post('/estimate', json=payload).get_json()
+    assert estimate['admission'] == 'run' and not estimate['queued'], "A small analysis should run synchronously!"
+    assert 0 < estimate['acceptance_rate'] < 1, "Acceptance rate should come from the counted space!"
+    assert client.post('/estimate', json=dict(payload, algorithm='nope')).status_code == 400, "Unknown algorithm should fail!"
+    print(f"✓ Estimate: {estimate['total_seconds']}s, {estimate['memory_bytes']} bytes")
+
+    budget = estimate['total_seconds'] / 2
+    original = app_module.cost_model.admit
+    sync_seconds = app_module.COST_SYNC_SECONDS
+    try:
+        app_module.cost_model.admit = lambda **request: original(max_seconds=budget, **request)
+        result = client.post('/generate', json=dict(payload, queue=False)).get_json()
+        assert result['downgraded_from'] == 'tsne' and result['algorithm'] != 'tsne', "Should run a faster reducer!"
+        response = client.post('/generate', json=dict(payload, queue=False, downgrade=False))
+        assert response.status_code == 400 and response.get_json()['estimate']['admission'] == 'reject', "Should be refused!"
+        app_module.COST_SYNC_SECONDS = 0
+        refused = client.post('/estimate', json=dict(payload, downgrade=False)).get_json()
+        assert refused['admission'] == 'reject' and not refused['queued'], "Refused analyses should not be queued!"
+    finally:
+        app_module.cost_model.admit = original
+        app_module.COST_SYNC_SECONDS = sync_seconds
+    print(f"✓ Over-budget request downgraded to {result['algorithm']}, or refused with its estimate")
+
+    try:
+        app_module.COST_SYNC_SECONDS = 0
+        assert client.post('/estimate', json=payload).get_json()['queued'], "Long analysis should be estimated as queued!"
+        response = client.post('/generate', json=payload)
+        assert response.status_code == 202 and 'estimate' in response.get_json(), "Long analysis should be queued!"
+    finally:
+        app_module.COST_SYNC_SECONDS = sync_seconds
+    job_id = response.get_json()['job_id']
+    status = response.get_json()
+    deadline = time.time() + 60
+    while status['status'] in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.1)
+        status = client.get(f'/jobs/{job_id}').get_json()
+    assert status['status'] == 'done', "Queued analysis should complete!"
+    print(f"✓ Long analysis queued as job {job_id} and completed")
+
+
+if __name__ == "__main__":
+    test_cost_model()
+    test_cost_endpoints()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test script to verify feasible-space counting against brute-force enumeration.
+"""
+import itertools
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from constraints import compile_constraints
+from counting import count_feasible_matrices, wilson_interval
+from lattice import build_group_lattice, constraint_groups
+from sampling import build_cell_grids, grid_size
+
+
+def brute_force_count(size, cell_ranges, constraints):
+    """Count feasible matrices by enumerating the whole search space"""
+    grids = build_cell_grids(size, cell_ranges)
+    matrices = np.array(list(itertools.product(*grids))).reshape(-1, size, size)
+    return int(compile_constraints(constraints, size).evaluate(matrices).sum())
+
+
+def test_counting():
+    """Test exact counting, grid sizes and the Monte Carlo interval."""
+    print("Testing feasible-space counting...")
+
+    for cell_range in [{'min': 0, 'max': 1, 'step': 0.1}, {'min': 1, 'max': 10, 'step': 0.5},
+                       {'min': 5, 'max': 1, 'step': 1}, {'min': 0, 'max': 3, 'step': 0}]:
+        assert grid_size(cell_range) == len(build_cell_grids(1, {"0,0": cell_range})[0]), f"Grid size mismatch for {cell_range}!"
+    assert grid_size({'min': 0, 'max': 1, 'step': 0.1}) == 11, "Arithmetic grid size is wrong!"
+    print("✓ Grid sizes are computed arithmetically")
+
+    size = 2
+    cell_ranges = {f"{i},{j}": {'min': 0, 'max': 2, 'step': 0.5} for i in range(size) for j in range(size)}
+    cell_ranges["1,1"] = {'min': -1, 'max': 1, 'step': 1}
+    cases = [
+        [],
+        [{'cells': ['0,0', '0,1'], 'type': 'sum_less', 'value': 2}],
+        [{'cells': ['0,0', '0,1'], 'type': 'sum_equal', 'value': 2},
+         {'cells': ['0,1', '1,1'], 'type': 'sum_greater', 'value': 1.5}],
+        [{'cells': ['1,0'], 'type': 'sum_greater', 'value': 1},
+         {'cells': ['0,0', '1,1'], 'type': 'sum_equal', 'value': 0.5}],
+        [{'cells': [], 'type': 'sum_greater', 'value': 1}],
+    ]
+    for constraints in cases:
+        space = count_feasible_matrices(size, cell_ranges, constraints)
+        expected = brute_force_count(size, cell_ranges, constraints)
+        assert space['exact'], "Small spaces should be counted exactly!"
+        assert space['total'] == 5 * 5 * 5 * 3, "Unexpected total search space!"
+        assert space['feasible'] == expected, f"Counted {space['feasible']} but expected {expected} for {constraints}!"
+        print(f"  {len(constraints)} constraint(s): {space['feasible']} of {space['total']} feasible")
+    print("✓ Exact counts match brute-force enumeration")
+
+    # Disjoint constraints form separate groups
+    compiled = compile_constraints(cases[3], size)
+    assert len(constraint_groups(compiled)) == 2, "Disjoint constraints should form two groups!"
+
+    # An exhausted budget returns None so the caller can fall back to Monte Carlo
+    grids = build_cell_grids(size, cell_ranges)
+    cells, ids = constraint_groups(compile_constraints(cases[1], size))[0]
+    assert build_group_lattice(compile_constraints(cases[1], size), ids, cells, grids, max_work=1) is None, "Budget should be enforced!"
+    print("✓ Dynamic programme respects its budget")
+
+    low, high = wilson_interval(50, 1000)
+    assert low < 0.05 < high, "Wilson interval should contain the observed rate!"
+    print("✓ Wilson interval brackets the observed rate")
+
+
+if __name__ == "__main__":
+    test_counting()
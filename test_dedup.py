@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test script to verify deduplication of points before reduction.
+"""
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dedup import deduplicate, unique_rows
+from eigen import build_feature_vectors
+
+
+def test_deduplicate():
+    """Test grouping by the feature vectors the reducer sees."""
+    print("Testing deduplication...")
+
+    index, inverse, counts = unique_rows(np.array([[1.0, 2.0], [3.0, 4.0], [1.0, 2.0], [-0.0, 0.0], [0.0, 0.0]]) + 0.0)
+    assert len(index) == 3 and counts.sum() == 5, "Unexpected groups!"
+    assert inverse[0] == inverse[2] and inverse[3] == inverse[4], "Equal rows should share a group!"
+    print("✓ Identical rows are grouped")
+
+    matrices = np.array([
+        [[1.0, 1.0], [0.0, 2.0]],
+        [[2.0, 1.0], [0.0, 1.0]],  # Same spectrum, eigenvalues in the other order
+        [[1.0, 1.0], [0.0, 2.0]],  # Same matrix as the first
+        [[0.0, -1.0], [1.0, 0.0]],  # Spectrum +-i
+    ])
+    eigenvalues, eigenvectors = np.linalg.eig(matrices)
+    features = build_feature_vectors(eigenvalues, None, 'eigenvalues', use_imaginary=True)
+    assert not np.array_equal(features[0], features[1]), "Eigenvalue order should reach the features!"
+
+    _, inverse, counts = deduplicate(features)
+    assert inverse[0] == inverse[2] and counts[inverse[0]] == 2, "Identical features should be grouped!"
+    assert len({inverse[0], inverse[1], inverse[3]}) == 3, "Different features should stay apart!"
+
+    _, inverse, _ = deduplicate(build_feature_vectors(eigenvalues, eigenvectors, 'eigenvectors', use_imaginary=True))
+    assert inverse[0] == inverse[2] and inverse[0] != inverse[1], "Eigenvector input should group identical matrices only!"
+    print("✓ Points are grouped by their eigenvalue or eigenvector features")
+
+
+def test_dedup_endpoint():
+    """Test that duplicates share coordinates and report their multiplicity."""
+    print("Testing deduplicated reduction...")
+    from app import app
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 300,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': 0, 'max': 1, 'step': 1} for i in range(size) for j in range(size)},
+        'constraints': [],
+        'sampler': 'rejection',
+        'seed': 8,
+        'details': 'lazy'
+    }
+    client = app.test_client()
+
+    result = client.post('/generate', json=payload).get_json()
+    assert result['unique_points'] < 150, "Binary matrices should share many spectra!"
+    coords = np.array(result['coordinates'])
+    multiplicity = np.array(result['multiplicity'])
+    assert len(np.unique(coords, axis=0)) == result['unique_points'], "Each unique point should have one position!"
+    assert multiplicity.min() >= 1 and (multiplicity > 1).any(), "Multiplicities missing!"
+    print(f"✓ {len(coords)} points reduced as {result['unique_points']} unique feature vectors")
+
+    plain = client.post('/generate', json=dict(payload, deduplicate=False)).get_json()
+    assert len(np.unique(np.array(plain['coordinates']), axis=0)) > result['unique_points'], "Disabling dedup had no effect!"
+    print("✓ Deduplication can be disabled")
+
+    cells = {'0,0': {'min': 0, 'max': 1, 'step': 1}, '1,1': {'min': 0, 'max': 1, 'step': 1},
+             '0,1': {'min': 0, 'max': 0, 'step': 1}, '1,0': {'min': 0, 'max': 0, 'step': 1}}
+    small = {'size': 2, 'num_matrices': 4, 'dimensionality': 2, 'cell_ranges': cells, 'constraints': [],
+             'algorithm': 'umap', 'seed': 0, 'store': False}
+    response = client.post('/generate', json=small)
+    assert response.status_code == 200, "Deduplication should not leave UMAP too few points!"
+    assert response.get_json()['unique_points'] == 4, "Every point should be reduced when dedup leaves too few!"
+    response = client.post('/generate', json=dict(small, num_matrices=3))
+    assert response.status_code == 400, "Too few points for UMAP should be refused as a bad request!"
+    print("✓ Requests too small for the backend after deduplication reduce every point")
+
+
+if __name__ == "__main__":
+    test_deduplicate()
+    test_dedup_endpoint()
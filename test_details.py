@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test script to verify lazy retrieval of per-point details.
+"""
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from binary_format import decode_arrays, read_header
+
+
+def test_lazy_details():
+    """Test that lazy results carry only coordinates and details match the inline response."""
+    print("Testing lazy point details...")
+    from app import app
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 120,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -1, 'max': 3, 'step': 1} for i in range(size) for j in range(size)},
+        'constraints': [{'cells': ['0,0', '2,2'], 'type': 'sum_greater', 'value': 1}],
+        'seed': 9
+    }
+    client = app.test_client()
+
+    inline = client.post('/generate', json=dict(payload, eigenvectors=True))
+    lazy = client.post('/generate', json=dict(payload, details='lazy'))
+    inline_data, lazy_data = inline.get_json(), lazy.get_json()
+    assert not {'matrices', 'eigenvalues', 'eigenvectors'} & set(lazy_data), f"Unexpected lazy fields {set(lazy_data)}!"
+    assert lazy_data['result_id'] == inline_data['result_id'], "Equal requests should share a result handle!"
+    assert len(lazy.data) < 0.2 * len(inline.data), "Lazy response is not much smaller!"
+    print(f"✓ Lazy response is {len(lazy.data)} bytes instead of {len(inline.data)}")
+
+    result_id = lazy_data['result_id']
+    picked = client.get(f'/results/{result_id}/details?indices=5,0,119').get_json()
+    assert picked['indices'] == [5, 0, 119], "Indices not echoed!"
+    for k, i in enumerate(picked['indices']):
+        assert picked['matrices'][k] == inline_data['matrices'][i], f"Matrix {i} differs!"
+        assert picked['eigenvalues'][k] == inline_data['eigenvalues'][i], f"Eigenvalues of {i} differ!"
+        assert picked['eigenvectors'][k] == inline_data['eigenvectors'][i], f"Eigenvectors of {i} differ!"
+    print("✓ Details of selected points match the inline response")
+
+    page = client.post(f'/results/{result_id}/details', json={'start': 100, 'stop': 200}).get_json()
+    assert page['indices'] == list(range(100, 120)) and page['count'] == 120, "Page range not clipped to the result!"
+    print("✓ Page ranges are served and clipped")
+
+    binary = client.post(f'/results/{result_id}/details', json={'indices': [3], 'format': 'binary'})
+    assert json.dumps(read_header(binary.data)[0]['metadata']) == '{"count": 120}', "Metadata missing from header!"
+    assert decode_arrays(binary.data)['matrices'].tolist() == [inline_data['matrices'][3]], "Binary details differ!"
+    print("✓ Details are available in the binary format")
+
+    assert client.get(f'/results/{result_id}/details?indices=120').status_code == 400, "Out of range index accepted!"
+    assert client.get('/results/unknown/details?indices=0').status_code == 404, "Unknown result should return 404!"
+    print("✓ Invalid selections and unknown results are reported")
+
+
+def test_eigenvalue_only_results():
+    """Test that eigenvectors are computed only when requested, and per point on demand otherwise."""
+    print("Testing eigenvalue-only results...")
+    import app as application
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 80,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -2, 'max': 2, 'step': 1} for i in range(size) for j in range(size)},
+        'constraints': [],
+        'algorithm': 'pca',
+        'seed': 31,
+        'store': False
+    }
+    client = application.app.test_client()
+
+    plain = client.post('/generate', json=payload).get_json()
+    assert 'eigenvalues' in plain and 'eigenvectors' not in plain, "Eigenvectors should be opt-in!"
+    assert 'eigenvectors' not in application.eigen_cache.get(plain['result_id']), "Eigenvectors were computed anyway!"
+    print("✓ Only eigenvalues are computed by default")
+
+    details = client.get(f"/results/{plain['result_id']}/details?indices=4,40").get_json()
+    full = client.post('/generate', json=dict(payload, eigenvectors=True)).get_json()
+    for k, i in enumerate(details['indices']):
+        assert details['eigenvalues'][k] == full['eigenvalues'][i], f"Eigenvalues of {i} differ!"
+        assert details['eigenvectors'][k] == full['eigenvectors'][i], f"Eigenvectors of {i} differ!"
+    print("✓ Eigenvectors of single points are computed on demand")
+
+    vectors = client.post('/generate', json=dict(payload, input_type='eigenvectors', details='lazy'))
+    assert vectors.status_code == 200, "Eigenvector input should work from eigenvalue-only cache entries!"
+    print("✓ Eigenvector input adds eigenvectors to a cached result")
+
+
+if __name__ == "__main__":
+    test_lazy_details()
+    test_eigenvalue_only_results()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the batched eigen-decomposition.
+"""
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from eigen import eigen_decomposition, eigenvalues_only, eigenvectors_for, build_feature_vectors, complex_to_json
+
+
+def test_eigen_decomposition():
+    """Test batched eig/eigh against the defining equation A v = lambda v."""
+    print("Testing batched eigen-decomposition...")
+
+    rng = np.random.default_rng(3)
+    matrices = rng.integers(-3, 4, size=(500, 4, 4)).astype(float)
+
+    # Small chunks exercise the chunk boundaries
+    values, vectors = eigen_decomposition(matrices, chunk_size=64)
+    assert values.shape == (500, 4) and vectors.shape == (500, 4, 4), "Unexpected output shapes!"
+    assert np.iscomplexobj(values), "Non-symmetric stacks should return complex eigenvalues!"
+
+    residual = matrices @ vectors - vectors * values[:, np.newaxis, :]
+    assert np.abs(residual).max() < 1e-8, "Eigenpairs do not satisfy A v = lambda v!"
+
+    reference = np.array([np.sort_complex(np.linalg.eigvals(m)) for m in matrices])
+    assert np.allclose(np.sort_complex(values), reference), "Eigenvalues differ from per-matrix eigvals!"
+    print("✓ Non-symmetric stack matches per-matrix results")
+
+    symmetric = matrices + matrices.transpose(0, 2, 1)
+    values, vectors = eigen_decomposition(symmetric)
+    assert not np.iscomplexobj(values), "Symmetric stacks should use eigh and return real eigenvalues!"
+    assert np.all(np.diff(values, axis=1) >= 0), "eigh eigenvalues should be sorted ascending!"
+    residual = symmetric @ vectors - vectors * values[:, np.newaxis, :]
+    assert np.abs(residual).max() < 1e-8, "Symmetric eigenpairs do not satisfy A v = lambda v!"
+    print("✓ Symmetric stack uses eigh")
+
+    for stack in (matrices, symmetric):
+        values, vectors = eigen_decomposition(stack)
+        alone = eigenvalues_only(stack, chunk_size=64)
+        assert alone.dtype == values.dtype and np.allclose(alone, values), "Eigenvalues alone differ from the full decomposition!"
+        assert np.allclose(eigenvectors_for(stack[:5], alone[:5]), vectors[:5]), "Eigenvectors on demand differ!"
+    print("✓ Eigenvalues can be computed alone and eigenvectors added later")
+
+
+def test_feature_vectors():
+    """Test feature widths and the JSON encoding of complex eigen data."""
+    print("Testing feature vectors and JSON encoding...")
+
+    # A rotation has eigenvalues +-i, a diagonal matrix has real eigenvalues
+    matrices = np.array([[[0.0, -1.0], [1.0, 0.0]], [[2.0, 0.0], [0.0, 3.0]]])
+    values, vectors = eigen_decomposition(matrices)
+
+    features = build_feature_vectors(values, vectors, 'eigenvalues', use_imaginary=False)
+    assert features.shape == (2, 2), "Eigenvalue features should have size columns!"
+    features = build_feature_vectors(values, vectors, 'eigenvalues', use_imaginary=True)
+    assert features.shape == (2, 4), "Imaginary parts should double the width!"
+    assert np.allclose(sorted(features[0, 2:]), [-1, 1]), "Imaginary plane should follow the real plane!"
+    features = build_feature_vectors(values, vectors, 'eigenvectors', use_imaginary=True)
+    assert features.shape == (2, 8), "Eigenvector features should have 2 * size * size columns!"
+    assert np.allclose(features[:, :4].reshape(2, 2, 2), vectors.real.transpose(0, 2, 1)), "Eigenvectors should be flattened one after another!"
+    print("✓ Feature vectors have fixed widths")
+
+    encoded = complex_to_json(values)
+    assert all(isinstance(v, dict) for v in encoded[0]), "Complex eigenvalues should be encoded as dicts!"
+    assert all(isinstance(v, float) for v in encoded[1]), "Real eigenvalues should be encoded as floats!"
+    assert complex_to_json(np.array([1.0, 2.0])) == [1.0, 2.0], "Real arrays should encode as plain lists!"
+    print("✓ Complex data is encoded only at the JSON boundary")
+
+
+if __name__ == "__main__":
+    test_eigen_decomposition()
+    test_feature_vectors()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test script to verify out-of-sample extension of embeddings.
+"""
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from embedding import interpolate_coordinates
+
+
+def test_interpolation():
+    """Test that new points land among the coordinates of their nearest neighbours."""
+    print("Testing nearest-neighbour interpolation...")
+
+    features = np.array([[0.0], [1.0], [10.0], [11.0]])
+    coordinates = np.array([[0.0, 0.0], [1.0, 0.0], [5.0, 5.0], [6.0, 5.0]])
+    placed = interpolate_coordinates(features, coordinates, np.array([[0.5], [10.0]]), neighbours=2)
+    assert np.allclose(placed[0], [0.5, 0.0]), f"Midpoint placed at {placed[0]}!"
+    assert np.allclose(placed[1], [5.0, 5.0]), "Exact match should land on its neighbour!"
+    print("✓ New points are placed between their neighbours")
+
+
+def test_extend_result():
+    """Test that extending a result keeps existing coordinates and adds the new points."""
+    print("Testing incremental extension...")
+    from app import app
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 150,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -2, 'max': 2, 'step': 1} for i in range(size) for j in range(size)},
+        'constraints': [{'cells': ['0,0', '1,1', '2,2'], 'type': 'sum_less', 'value': 3}],
+        'seed': 4
+    }
+    client = app.test_client()
+
+    first = client.post('/generate', json=payload).get_json()
+    extended = client.post('/generate', json={'extend_from': first['embedding_id'], 'num_matrices': 40, 'seed': 5}).get_json()
+    assert 'error' not in extended, extended.get('error')
+    assert len(extended['coordinates']) == 190 and len(extended['matrices']) == 190, "Extension lost points!"
+    assert extended['coordinates'][:150] == first['coordinates'], "Existing points moved!"
+    assert extended['matrices'][:150] == first['matrices'], "Existing matrices changed!"
+    assert extended['result_id'] != first['result_id'], "Extension should be a new result!"
+    print("✓ New matrices join the plot without moving existing points")
+
+    chained = client.post('/generate', json={'extend_from': extended['embedding_id'], 'num_matrices': 10, 'details': 'lazy'}).get_json()
+    assert len(chained['coordinates']) == 200 and 'matrices' not in chained, "Chained extension failed!"
+    details = client.get(f"/results/{chained['result_id']}/details?indices=199").get_json()
+    assert len(details['matrices']) == 1, "Details of extended points unavailable!"
+    print("✓ Extensions can be chained and served lazily")
+
+    missing = client.post('/generate', json={'extend_from': 'unknown', 'num_matrices': 10})
+    assert missing.status_code == 400, "Unknown embeddings should be rejected!"
+
+
+if __name__ == "__main__":
+    test_interpolation()
+    test_extend_result()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test script to verify exhaustive enumeration of feasible matrices.
+"""
+import itertools
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from constraints import compile_constraints
+from counting import count_feasible_matrices
+from enumeration import FeasibleSpace, should_enumerate
+from sampling import build_cell_grids
+
+
+def test_enumeration():
+    """Test that enumeration yields every feasible matrix exactly once."""
+    print("Testing exhaustive enumeration...")
+
+    size = 2
+    cell_ranges = {f"{i},{j}": {'min': 0, 'max': 2, 'step': 0.5} for i in range(size) for j in range(size)}
+    cell_ranges["1,0"] = {'min': 1, 'max': 3, 'step': 1}
+    constraints = [
+        {'cells': ['0,0', '0,1'], 'type': 'sum_less', 'value': 2},
+        {'cells': ['0,1', '1,1'], 'type': 'sum_greater', 'value': 1.5},
+    ]
+
+    grids = build_cell_grids(size, cell_ranges)
+    everything = np.array(list(itertools.product(*grids))).reshape(-1, size, size)
+    feasible = everything[compile_constraints(constraints, size).evaluate(everything)]
+
+    space = FeasibleSpace(size, cell_ranges, constraints)
+    assert len(space) == len(feasible), f"Enumerated {len(space)} matrices but expected {len(feasible)}!"
+
+    enumerated = np.concatenate(list(space.iterate(chunk_size=7)))
+    assert len(enumerated) == len(feasible), "Chunked iteration lost matrices!"
+    assert len({m.tobytes() for m in enumerated}) == len(feasible), "Enumeration produced duplicates!"
+    assert {m.tobytes() for m in enumerated} == {m.tobytes() for m in feasible}, "Enumeration differs from brute force!"
+    print(f"✓ All {len(feasible)} feasible matrices enumerated exactly once")
+
+    sample = space.sample(20, np.random.default_rng(0))
+    assert len({m.tobytes() for m in sample}) == 20, "Sampling without replacement produced duplicates!"
+    assert compile_constraints(constraints, size).evaluate(sample).all(), "Sample contains infeasible matrices!"
+    print("✓ Uniform sample without replacement is duplicate-free")
+
+    counted = count_feasible_matrices(size, cell_ranges, constraints)
+    assert should_enumerate(counted, 40), "Small spaces should be enumerated!"
+    assert not should_enumerate(counted, 20), "Spaces much larger than the request should be sampled!"
+    print("✓ Enumeration is chosen only for small spaces")
+
+
+if __name__ == "__main__":
+    test_enumeration()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the background job API.
+"""
+import json
+import pickle
+import subprocess
+import tempfile
+import threading
+import time
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from jobs import JobManager, QueueFull
+
+
+def wait_for(job, timeout=60):
+    """Poll a job until it leaves the queued and running states"""
+    deadline = time.time() + timeout
+    while job.status in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.01)
+    return job.status
+
+
+def test_job_manager():
+    """Test progress reporting, the queue limit and cancellation."""
+    print("Testing job manager...")
+
+    release = threading.Event()
+
+    def runner(payload, progress):
+        for done in range(payload['steps'] + 1):
+            progress('sampling', done, payload['steps'])
+            if payload.get('block'):
+                release.wait(5)
+        return {'steps': payload['steps']}
+
+    manager = JobManager(runner, workers=1, queue_depth=1)
+    job = manager.submit({'steps': 4})
+    assert wait_for(job) == 'done', f"Job ended as {job.status}!"
+    assert job.result == {'steps': 4} and job.to_dict()['percent'] == 100, "Unexpected job outcome!"
+    print("✓ Jobs run to completion and report 100%")
+
+    blocking = manager.submit({'steps': 3, 'block': True})
+    while blocking.status != 'running':
+        time.sleep(0.01)
+    waiting = manager.submit({'steps': 1})
+    try:
+        manager.submit({'steps': 1})
+        assert False, "Queue depth limit was not enforced!"
+    except QueueFull:
+        print("✓ Submissions beyond the queue depth are refused")
+
+    manager.cancel(waiting.id)
+    assert waiting.status == 'cancelled', "Queued job should be cancelled immediately!"
+    manager.cancel(blocking.id)
+    release.set()
+    assert wait_for(blocking) == 'cancelled', "Running job should stop at its next progress report!"
+    assert blocking.stage == 'sampling' and blocking.done < 3, "Cancelled job kept running!"
+    print("✓ Queued and running jobs can be cancelled")
+
+    assert manager.get('missing') is None, "Unknown ids should not resolve!"
+
+
+def test_shared_jobs():
+    """Test polling, collecting and cancelling a job from a second manager and a second process."""
+    print("Testing jobs shared between processes...")
+
+    release = threading.Event()
+
+    def runner(payload, progress):
+        for done in range(payload['steps'] + 1):
+            progress('sampling', done, payload['steps'])
+            if payload.get('block'):
+                release.wait(0.05)
+        if payload.get('invalid'):
+            raise ValueError('Invalid request')
+        if payload.get('arrays'):
+            return {'steps': payload['steps'], 'coordinates': np.full((3, 2), 0.5), 'multiplicity': np.arange(3)}
+        return {'steps': payload['steps']}
+
+    class Planted:
+        def __reduce__(self):
+            return (os.mkdir, (os.path.join(directory, 'planted'),))
+
+    with tempfile.TemporaryDirectory() as directory:
+        owner = JobManager(runner, workers=1, directory=directory, client_errors=(ValueError,))
+        # A second server process sees only the shared directory
+        other = JobManager(None, directory=directory)
+
+        job = owner.submit({'steps': 4})
+        deadline = time.time() + 60
+        while other.get(job.id).status in ('queued', 'running') and time.time() < deadline:
+            time.sleep(0.01)
+        assert other.get(job.id, with_result=True).result == {'steps': 4}, "Result should be readable elsewhere!"
+        script = ("import json, sys; from jobs import JobManager; "
+                  "job = JobManager(None, directory=sys.argv[1]).get(sys.argv[2], with_result=True); "
+                  "print(json.dumps(dict(job.to_dict(), result=job.result)))")
+        output = subprocess.run([sys.executable, '-c', script, directory, job.id], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+        polled = json.loads(output)
+        assert polled['status'] == 'done' and polled['result'] == {'steps': 4}, "Another process should collect the job!"
+        print("✓ Jobs are polled and collected from another manager and another process")
+
+        arrays = owner.submit({'steps': 1, 'arrays': True})
+        wait_for(arrays)
+        result = other.get(arrays.id, with_result=True).result
+        assert np.array_equal(result['coordinates'], np.full((3, 2), 0.5)) and result['steps'] == 1, "Arrays should be shared!"
+        assert result['multiplicity'].dtype.kind == 'i', "Integer arrays should stay integers!"
+        # A pickle planted in the shared directory is refused instead of being run
+        with open(os.path.join(directory, f'{job.id}.json')) as f:
+            state = dict(json.load(f), id='planted')
+        with open(os.path.join(directory, 'planted.json'), 'w') as f:
+            json.dump(state, f)
+        with open(os.path.join(directory, 'planted.result'), 'wb') as f:
+            pickle.dump(Planted(), f)
+        assert other.get('planted', with_result=True) is None, "A pickled result should not load!"
+        assert not os.path.exists(os.path.join(directory, 'planted')), "Loading a result should never run code!"
+        print("✓ Results with arrays are shared in the binary format, and pickles are refused")
+
+        blocking = owner.submit({'steps': 200, 'block': True})
+        while blocking.status != 'running':
+            time.sleep(0.01)
+        assert other.cancel(blocking.id).to_dict()['cancel_requested'], "Cancellation should be recorded!"
+        assert wait_for(blocking) == 'cancelled' and blocking.done < 200, "Owner should stop a job cancelled elsewhere!"
+        failed = owner.submit({'steps': 1, 'invalid': True})
+        wait_for(failed)
+        shared = other.get(failed.id)
+        assert shared.status == 'failed' and shared.client_error, "Request errors should be told apart elsewhere!"
+        assert other.get('missing') is None, "Unknown ids should not resolve!"
+        print("✓ Jobs are cancelled from another manager, and failures are shared")
+
+
+def test_job_endpoints():
+    """Test submitting, polling and collecting a job over HTTP."""
+    print("Testing job endpoints...")
+    from app import app
+
+    size = 2
+    payload = {
+        'size': size,
+        'num_matrices': 20,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': 0, 'max': 3, 'step': 1} for i in range(size) for j in range(size)},
+        'constraints': [],
+        'seed': 1
+    }
+    client = app.test_client()
+
+    response = client.post('/jobs', json=payload)
+    assert response.status_code == 202, f"Unexpected status {response.status_code}!"
+    job_id = response.get_json()['job_id']
+
+    deadline = time.time() + 120
+    status = client.get(f'/jobs/{job_id}').get_json()
+    while status['status'] in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.05)
+        status = client.get(f'/jobs/{job_id}').get_json()
+    assert status['status'] == 'done', f"Job ended as {status['status']}: {status['error']}"
+
+    result = client.get(f'/jobs/{job_id}/result').get_json()
+    assert len(result['coordinates']) == 20 and len(result['matrices']) == 20, "Incomplete job result!"
+    print("✓ Job results match the synchronous response format")
+
+    bad = client.post('/jobs', json=dict(payload, sampler='unknown')).get_json()
+    while client.get(f"/jobs/{bad['job_id']}").get_json()['status'] in ('queued', 'running'):
+        time.sleep(0.01)
+    assert client.get(f"/jobs/{bad['job_id']}/result").status_code == 400, "Invalid requests should fail with 400!"
+    assert client.get('/jobs/missing').status_code == 404, "Unknown jobs should return 404!"
+    print("✓ Failed and unknown jobs are reported")
+
+
+if __name__ == "__main__":
+    test_job_manager()
+    test_shared_jobs()
+    test_job_endpoints()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test script to verify stage timings and the Prometheus metrics endpoint.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from metrics import Metrics, Timings
+
+
+def test_metrics_registry():
+    """Test that timings are summarized and rendered as Prometheus histograms and counters."""
+    print("Testing metrics registry...")
+
+    timings = Timings()
+    timings.add('sampling', 0.2)
+    timings.add('sampling', 0.3)
+    timings.count('matrices', 50)
+    timings.count('candidates', 200)
+    summary = timings.to_dict()
+    assert summary['stages']['sampling'] == 0.5, "Stage time should accumulate!"
+    assert summary['acceptance_rate'] == 0.25, "Acceptance rate should be matrices over candidates!"
+    print("✓ Timings accumulate stages and derive the acceptance rate")
+
+    registry = Metrics()
+    registry.record_analysis(timings)
+    registry.record_request('/generate', 'POST', 200, 0.7, 5000)
+    text = registry.render({'jobs': ('gauge', 'Jobs', {'status="done"': 1})})
+    assert 'cmv_stage_seconds_bucket{stage="sampling",le="0.5"} 1' in text, "Stage histogram bucket missing!"
+    assert 'cmv_stage_seconds_bucket{stage="sampling",le="0.25"} 0' in text, "Observation counted in a lower bucket!"
+    assert 'cmv_candidates_total 200' in text, "Candidate counter missing!"
+    assert 'cmv_http_requests_total{endpoint="/generate",method="POST",status="200"} 1' in text, "Request counter missing!"
+    assert 'cmv_http_response_bytes_count{endpoint="/generate"} 1' in text, "Response size missing!"
+    assert 'cmv_jobs{status="done"} 1' in text, "Extra gauges missing!"
+    print("✓ Registry renders histograms, counters and gauges")
+
+
+def test_metrics_endpoint():
+    """Test the timings block of /generate and the /metrics endpoint."""
+    print("Testing timings and metrics endpoint...")
+    from app import app
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 200,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -3, 'max': 3, 'step': 0.5} for i in range(size) for j in range(size)},
+        'constraints': [{'cells': ['0,0', '1,1'], 'type': 'sum_greater', 'value': 1}],
+        'algorithm': 'pca',
+        'sampler': 'rejection',
+        'seed': 5,
+        'cache': False,
+        'store': False,
+        'timings': True
+    }
+    client = app.test_client()
+
+    response = client.post('/generate', json=payload)
+    timings = response.get_json()['timings']
+    for stage in ('counting', 'sampling', 'constraints', 'eigen', 'features', 'dedup', 'reduction'):
+        assert stage in timings['stages'], f"Stage {stage} missing from timings!"
+    assert timings['matrices'] == 200 and 0 < timings['acceptance_rate'] < 1, "Unexpected matrix counts!"
+    assert 'serialization;dur=' in response.headers['Server-Timing'], "Serialization time missing from Server-Timing!"
+    assert 'timings' not in client.post('/generate', json=dict(payload, timings=False)).get_json(), "Timings should be opt-in!"
+    print(f"✓ Timings returned: {timings['matrices_per_second']} matrices per second")
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain', "Metrics should be plain text!"
+    text = response.get_data(as_text=True)
+    assert 'cmv_stage_seconds_count{stage="serialization"}' in text, "Serialization stage not recorded!"
+    assert 'cmv_http_requests_total{endpoint="/generate",method="POST",status="200"}' in text, "Requests not counted!"
+    assert 'cmv_cache_entries{cache="eigen"}' in text, "Cache gauges missing!"
+    print("✓ Metrics endpoint exposes stages, requests and caches")
+
+
+if __name__ == "__main__":
+    test_metrics_registry()
+    test_metrics_endpoint()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the dimensionality-reduction backends and their selection.
+"""
+import numpy as np
+import subprocess
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from reducers import fit_reducer, select_reducer, estimate_seconds, supports, axis_labels
+
+
+def test_reducer_selection():
+    """Test that automatic selection respects the latency budget and component limits."""
+    print("Testing reducer selection...")
+
+    assert select_reducer(500, 2, latency_budget=60) == 'tsne', "Small data should use t-SNE!"
+    assert estimate_seconds('tsne', 10**6) > 60, "t-SNE on a million points should not look cheap!"
+    assert select_reducer(10**6, 2, latency_budget=60) != 'tsne', "Huge data should not use t-SNE!"
+    assert select_reducer(10**6, 2, latency_budget=1) == 'randomized_pca', "Tight budgets should fall back to PCA!"
+    assert not supports('tsne', 20000, 5), "Exact t-SNE should not be used for 20k points!"
+    assert select_reducer(20000, 5, latency_budget=1) == 'randomized_pca', "High dimensionality should avoid t-SNE!"
+    assert not supports('umap', 3, 2) and supports('umap', 4, 2), "UMAP needs more points than components plus one!"
+    print("✓ Backends are chosen by size, dimensionality and budget")
+
+
+def test_pca_backends():
+    """Test the PCA backends, including more components than features."""
+    print("Testing PCA backends...")
+
+    features = np.random.default_rng(0).normal(size=(200, 3))
+    for name in ('pca', 'randomized_pca'):
+        coords, model = fit_reducer(name, features, 2)
+        assert coords.shape == (200, 2), f"Unexpected {name} shape!"
+        assert np.allclose(model.transform(features), coords), f"{name} model does not reproduce its embedding!"
+
+    coords, model = fit_reducer('pca', features, 5)
+    assert coords.shape == (200, 5) and np.allclose(coords[:, 3:], 0), "Extra components should be flat!"
+    assert model.transform(features[:4]).shape == (4, 5), "Padded model should project to all components!"
+    print("✓ PCA embeddings can project new points")
+
+    try:
+        fit_reducer('unknown', features, 2)
+        assert False, "Unknown backends should be rejected!"
+    except ValueError:
+        print("✓ Unknown backends are rejected")
+
+
+def test_algorithm_endpoint():
+    """Test that the backend in use is reported and PCA results can be extended."""
+    print("Testing algorithm selection in requests...")
+    from app import app
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 100,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': 0, 'max': 4, 'step': 1} for i in range(size) for j in range(size)},
+        'constraints': [],
+        'seed': 2,
+        'details': 'lazy'
+    }
+    client = app.test_client()
+
+    auto = client.post('/generate', json=dict(payload, algorithm='auto', latency_budget=0.001)).get_json()
+    assert auto['algorithm'] == 'randomized_pca', f"Expected PCA under a tiny budget, got {auto['algorithm']}!"
+    extended = client.post('/generate', json={'extend_from': auto['embedding_id'], 'num_matrices': 10}).get_json()
+    assert len(extended['coordinates']) == 110, "PCA result could not be extended!"
+    print("✓ Automatic selection is reported and PCA projects new points")
+
+    response = client.post('/generate', json=dict(payload, algorithm='isomap'))
+    assert response.status_code == 400, "Unknown algorithms should be rejected!"
+
+
+def test_spectrum_backend():
+    """Test coordinates read directly off sorted spectra."""
+    print("Testing spectrum coordinates...")
+
+    coords, _ = fit_reducer('spectrum', np.array([[1.0, 3.0, 2.0], [0.0, -1.0, 5.0]]), 2)
+    assert np.array_equal(coords, [[3, 2], [5, 0]]), "Real spectra should give the largest eigenvalues!"
+    spectra = np.array([[1 + 2j, 3, 1 - 2j], [-1, 0, 0]])
+    coords, model = fit_reducer('spectrum', np.concatenate([spectra.real, spectra.imag], axis=1), 4, use_imaginary=True)
+    assert np.array_equal(coords, [[3, 0, 1, 2], [0, 0, 0, 0]]), "Complex spectra should give leading real and imaginary parts!"
+    assert axis_labels('spectrum', 3, use_imaginary=True) == ['Re(λ1)', 'Im(λ1)', 'Re(λ2)'], "Unexpected axis labels!"
+    print("✓ Spectra are sorted into coordinates")
+
+    from app import app
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 500,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -2, 'max': 2, 'step': 0.5} for i in range(size) for j in range(size)},
+        'constraints': [],
+        'algorithm': 'none',
+        'use_imaginary': True,
+        'seed': 6
+    }
+    client = app.test_client()
+
+    result = client.post('/generate', json=payload).get_json()
+    assert result['algorithm'] == 'spectrum' and result['axes'] == ['Re(λ1)', 'Im(λ1)'], "Spectrum mode not reported!"
+    leading = [max(np.linalg.eigvals(np.array(m)), key=lambda v: (v.real, v.imag)) for m in result['matrices']]
+    assert np.allclose(result['coordinates'], [[v.real, v.imag] for v in leading]), "Coordinates should be the leading eigenvalues!"
+    extended = client.post('/generate', json={'extend_from': result['embedding_id'], 'num_matrices': 20, 'seed': 1}).get_json()
+    leading = [max(np.linalg.eigvals(np.array(m)), key=lambda v: (v.real, v.imag)) for m in extended['matrices'][500:]]
+    assert np.allclose(extended['coordinates'][500:], [[v.real, v.imag] for v in leading]), "Extensions should use exact spectra!"
+    print("✓ Spectrum mode plots and extends the leading eigenvalues")
+
+    response = client.post('/generate', json=dict(payload, input_type='eigenvectors'))
+    assert response.status_code == 400, "Spectrum mode needs eigenvalue input!"
+
+
+def test_tsne_components():
+    """Test t-SNE with more components than features."""
+    print("Testing t-SNE with more components than features...")
+
+    features = np.random.default_rng(0).normal(size=(60, 3))
+    coords, _ = fit_reducer('tsne', features, 4, random_state=0)
+    assert coords.shape == (60, 4) and np.isfinite(coords).all(), "4D t-SNE of 3 features should succeed!"
+    print("✓ 4D t-SNE of real eigenvalues of 3x3 matrices")
+
+
+def test_deferred_imports():
+    """Test that importing the app leaves the reducer libraries unloaded until first use."""
+    print("Testing deferred reducer imports...")
+
+    check = ("import sys, app; heavy = [m for m in ('sklearn', 'umap', 'numba') if m in sys.modules]; "
+             "assert not heavy, f'Imported at startup: {heavy}'")
+    result = subprocess.run([sys.executable, '-c', check], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr.strip().splitlines()[-1]
+    print("✓ Reducer libraries are not imported at startup")
+
+    features = np.random.default_rng(0).normal(size=(40, 4))
+    coords, _ = fit_reducer('pca', features, 2)
+    assert coords.shape == (40, 2) and 'sklearn' in sys.modules, "PCA should import scikit-learn on first use!"
+    print("✓ Reducer libraries are imported on first use")
+
+
+if __name__ == "__main__":
+    test_reducer_selection()
+    test_pca_backends()
+    test_algorithm_endpoint()
+    test_spectrum_backend()
+    test_tsne_components()
+    test_deferred_imports()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the vectorized matrix sampler.
+"""
+import itertools
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from constraints import compile_constraints
+from sampling import MatrixSampler, ConstrainedSampler, build_cell_grids
+
+
+def test_matrix_sampler():
+    """Test that sampled matrices stay on the per-cell value grids."""
+    print("Testing vectorized matrix sampler...")
+
+    size = 3
+    cell_ranges = {f"{i},{j}": {'min': i, 'max': i + 2, 'step': 0.5} for i in range(size) for j in range(size)}
+    cell_ranges["2,2"] = {'min': 4, 'max': 1, 'step': 1}  # Empty range falls back to the min value
+
+    grids = build_cell_grids(size, cell_ranges)
+    assert len(grids) == size * size, "One grid per cell expected!"
+    assert np.allclose(grids[0], [0, 0.5, 1, 1.5, 2]), "Unexpected grid for cell 0,0!"
+    assert np.allclose(grids[-1], [4]), "Empty range should fall back to the min value!"
+
+    sampler = MatrixSampler(size, cell_ranges, seed=123)
+    matrices = sampler.sample(5000)
+    assert matrices.shape == (5000, size, size), "Unexpected batch shape!"
+
+    for i in range(size):
+        for j in range(size):
+            values = np.unique(matrices[:, i, j])
+            assert set(values) <= set(grids[i * size + j]), f"Cell {i},{j} left its grid!"
+    # With 5000 draws every value of a 5-point grid should appear
+    assert len(np.unique(matrices[:, 0, 0])) == 5, "Sampler does not cover the whole grid!"
+    print("✓ Sampled values stay on their grids")
+
+    # The same seed must reproduce the same block
+    again = MatrixSampler(size, cell_ranges, seed=123).sample(5000)
+    assert np.array_equal(matrices, again), "Seeded sampler is not reproducible!"
+    print("✓ Seeded sampling is reproducible")
+
+
+def test_constrained_sampler():
+    """Test that direct sampling only yields feasible matrices, uniformly."""
+    print("Testing constraint-aware direct sampler...")
+
+    size = 2
+    cell_ranges = {f"{i},{j}": {'min': 0, 'max': 2, 'step': 0.5} for i in range(size) for j in range(size)}
+    constraints = [
+        {'cells': ['0,0', '0,1'], 'type': 'sum_equal', 'value': 2},
+        {'cells': ['0,1', '1,1'], 'type': 'sum_greater', 'value': 2.5},
+    ]
+    compiled = compile_constraints(constraints, size)
+
+    grids = build_cell_grids(size, cell_ranges)
+    everything = np.array(list(itertools.product(*grids))).reshape(-1, size, size)
+    feasible = everything[compiled.evaluate(everything)]
+
+    sampler = ConstrainedSampler(size, cell_ranges, constraints, seed=5)
+    matrices = sampler.sample(20000)
+    assert compiled.evaluate(matrices).all(), "Direct sampler produced an infeasible matrix!"
+    print("✓ Every sampled matrix satisfies the constraints")
+
+    # Each feasible matrix should be drawn with roughly equal frequency
+    keys = [m.tobytes() for m in feasible]
+    counts = {key: 0 for key in keys}
+    for m in matrices:
+        counts[m.tobytes()] += 1
+    expected = len(matrices) / len(feasible)
+    assert min(counts.values()) > 0.8 * expected and max(counts.values()) < 1.2 * expected, "Direct sampler is not uniform!"
+    print(f"✓ {len(feasible)} feasible matrices drawn uniformly (expected {expected:.0f} each)")
+
+    impossible = [{'cells': ['0,0'], 'type': 'sum_greater', 'value': 5}]
+    try:
+        ConstrainedSampler(size, cell_ranges, impossible)
+        assert False, "Infeasible constraints should be rejected!"
+    except ValueError:
+        print("✓ Infeasible constraints are reported")
+
+
+def test_auto_sampler_falls_back_to_direct():
+    """Test that 'auto' samples directly when rejection cannot reach the count."""
+    print("Testing auto sampler on a sparse space...")
+    from app import generate_valid_matrices, feasible_space, MAX_ATTEMPTS
+    from benchmark import preset_ranges, preset_constraints
+
+    size = 4
+    cell_ranges = preset_ranges('threeLayerShield', size)
+    constraints = preset_constraints('threeLayerShield', size)
+    space = feasible_space(size, cell_ranges, constraints)
+    assert space['exact'] and 200 / space['acceptance_rate'] > MAX_ATTEMPTS, "Rejection should be infeasible here!"
+
+    matrices, _ = generate_valid_matrices(size, cell_ranges, constraints, 200, 'auto', 9, space)
+    assert len(matrices) == 200, "Auto sampler should reach the requested count!"
+    assert compile_constraints(constraints, size).evaluate(matrices).all(), "Auto sampler produced an infeasible matrix!"
+    print(f"✓ 200 matrices drawn at acceptance rate {space['acceptance_rate']:.2g}")
+
+
+if __name__ == "__main__":
+    test_matrix_sampler()
+    test_constrained_sampler()
+    test_auto_sampler_falls_back_to_direct()
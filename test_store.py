@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the persistent result store.
+"""
+import shutil
+import tempfile
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from store import ResultStore
+
+
+def test_result_store():
+    """Test saving, memory-mapped loading, listing, trimming and deleting runs."""
+    print("Testing result store...")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultStore(directory, max_runs=2)
+        values = np.array([[1 + 1j, 2], [3, 4 - 2j]])
+        store.save('aa' * 8, {'points': 2}, {'eigenvalues': values, 'coordinates': np.zeros((2, 2))})
+
+        loaded = store.load('aa' * 8)
+        assert isinstance(loaded['eigenvalues'], np.memmap), "Arrays should be memory-mapped!"
+        assert np.array_equal(loaded['eigenvalues'], values), "Complex data changed on disk!"
+        assert store.manifest('aa' * 8)['arrays']['eigenvalues']['shape'] == [2, 2], "Manifest lacks array shapes!"
+        print("✓ Runs are written and memory-mapped back")
+
+        store.save('bb' * 8, {'points': 1}, {'coordinates': np.zeros((1, 2))})
+        store.save('cc' * 8, {'points': 1}, {'coordinates': np.zeros((1, 2))})
+        assert [m['run_id'] for m in store.list()] == ['cc' * 8, 'bb' * 8], "Oldest run should be trimmed!"
+        assert store.delete('bb' * 8) and not store.delete('bb' * 8), "Delete should report missing runs!"
+        print("✓ Runs are listed newest first, trimmed and deleted")
+
+        try:
+            store.load('../etc')
+            assert False, "Path-like run ids should be rejected!"
+        except KeyError:
+            print("✓ Invalid run ids are rejected")
+
+
+def test_run_endpoints():
+    """Test listing, reopening, extending and deleting a stored run."""
+    print("Testing run endpoints...")
+    import app as application
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 60,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -3, 'max': 3, 'step': 0.5} for i in range(size) for j in range(size)},
+        'constraints': [],
+        'seed': 21
+    }
+    client = application.app.test_client()
+    # Runs go to a scratch store, so the test never deletes or trims runs kept in results/
+    kept_store = application.result_store
+    application.result_store = ResultStore(tempfile.mkdtemp(prefix='cmv-test-results-'))
+    try:
+        check_run_endpoints(application, client, payload)
+    finally:
+        shutil.rmtree(application.result_store.directory, ignore_errors=True)
+        application.result_store = kept_store
+
+
+def check_run_endpoints(application, client, payload):
+    """Store, reopen, extend and delete a run through the endpoints"""
+    original = client.post('/generate', json=payload).get_json()
+    run_id = original['embedding_id']
+    assert run_id in [run['run_id'] for run in client.get('/runs').get_json()['runs']], "Run was not stored!"
+
+    # Results keep serving details and extensions from the store once their matrices leave the cache
+    lazy = client.post('/generate', json=dict(payload, details='lazy')).get_json()
+    application.eigen_cache.clear()
+    details = client.get(f"/results/{lazy['result_id']}/details?indices=3").get_json()
+    assert details['matrices'][0] == original['matrices'][3], "Details should fall back to the stored run!"
+    application.eigen_cache.clear()
+    extended = client.post('/generate', json={'extend_from': lazy['embedding_id'], 'num_matrices': 5, 'details': 'lazy'})
+    assert extended.status_code == 200, "Cached embeddings should extend with matrices from the store!"
+    client.delete(f"/runs/{extended.get_json()['embedding_id']}")
+    print("✓ Evicted results are served from the store by result id")
+
+    # Drop cached data so everything is served from disk
+    application.eigen_cache.clear()
+    application.embeddings.entries.clear()
+    reopened = client.get(f'/runs/{run_id}?details=lazy').get_json()
+    assert reopened['coordinates'] == original['coordinates'], "Reopened coordinates differ!"
+    details = client.get(f"/results/{reopened['result_id']}/details?indices=7").get_json()
+    assert details['matrices'][0] == original['matrices'][7], "Details from disk differ!"
+    print("✓ Stored runs reopen with details read from disk")
+
+    extended = client.post('/generate', json={'extend_from': reopened['embedding_id'], 'num_matrices': 5}).get_json()
+    assert len(extended['coordinates']) == 65, "Reopened run could not be extended!"
+    print("✓ Reopened runs can be extended")
+
+    # Another server process holds no fitted embedding, only the stored run
+    application.embeddings.entries.clear()
+    application.eigen_cache.clear()
+    extended = client.post('/generate', json={'extend_from': run_id, 'num_matrices': 5, 'details': 'lazy'}).get_json()
+    assert len(extended['coordinates']) == 65, "Stored runs should be extendable without their fitted embedding!"
+    assert extended['coordinates'][:60] == original['coordinates'], "Existing points should keep their coordinates!"
+    client.delete(f"/runs/{extended['embedding_id']}")
+    print("✓ Runs made elsewhere are extended from the store")
+
+    assert client.delete(f'/runs/{run_id}').status_code == 200, "Delete failed!"
+    assert client.get(f'/runs/{run_id}').status_code == 404, "Deleted run still served!"
+    client.delete(f"/runs/{extended['embedding_id']}")
+    print("✓ Runs can be deleted")
+
+
+if __name__ == "__main__":
+    test_result_store()
+    test_run_endpoints()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script to verify streaming of matrices and spectra during an analysis.
+"""
+import json
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from parallel import sample_in_chunks
+
+
+def test_sampling_callback():
+    """Test that batches reported while sampling add up to the returned matrices."""
+    print("Testing accepted matrix callbacks...")
+
+    size = 3
+    cell_ranges = {f"{i},{j}": {'min': -3, 'max': 3, 'step': 0.5} for i in range(size) for j in range(size)}
+    constraints = [{'cells': ['0,0', '1,1'], 'type': 'sum_greater', 'value': 4}]
+    batches = []
+    # An optimistic prior acceptance rate makes the first round fall short, so several rounds are needed
+    matrices, _ = sample_in_chunks(size, cell_ranges, constraints, 5000, 'rejection', 4, 0.5, 10**6,
+                                   on_matrices=batches.append)
+    assert len(batches) > 1, "Matrices should be reported in several batches!"
+    assert np.array_equal(np.concatenate(batches), matrices), "Reported batches differ from the result!"
+    print(f"✓ {len(matrices)} matrices reported in {len(batches)} batches")
+
+
+def test_stream_endpoint():
+    """Test that the pipeline's eigenvalues are streamed before the final coordinates."""
+    print("Testing streaming endpoint...")
+    import app as app_module
+    app = app_module.app
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 3000,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -3, 'max': 3, 'step': 0.5} for i in range(size) for j in range(size)},
+        'constraints': [],
+        'algorithm': 'pca',
+        'transpose_matrix': True,
+        'seed': 13,
+        'cache': False
+    }
+    client = app.test_client()
+
+    def stream(data):
+        response = client.post('/stream', json=data)
+        assert response.mimetype == 'application/x-ndjson', "Stream should be NDJSON!"
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    # Every matrix is decomposed once, by the pipeline's eigen stage
+    decompositions = []
+    eigen_in_chunks = app_module.eigen_in_chunks
+    try:
+        app_module.eigen_in_chunks = lambda matrices, *args: decompositions.append(len(matrices)) or eigen_in_chunks(matrices, *args)
+        events = stream(payload)
+        assert decompositions == [3000], f"Streaming should not decompose matrices again: {decompositions}"
+        # The run above cached its eigen data, so a cached run streams it as it is
+        cached = stream(dict(payload, cache=True))
+        assert decompositions == [3000], "Cached spectra should be streamed without decomposing again!"
+    finally:
+        app_module.eigen_in_chunks = eigen_in_chunks
+    kinds = [event['event'] for event in events]
+    assert kinds[0] == 'job' and kinds[-1] == 'result', f"Unexpected event order: {kinds}"
+    assert kinds.index('eigenvalues') < kinds.index('result'), "Eigenvalues should arrive before the result!"
+
+    chunks = [event for event in events if event['event'] == 'eigenvalues']
+    assert [chunk['offset'] for chunk in chunks] == list(np.cumsum([0] + [len(c['eigenvalues']) for c in chunks[:-1]])), "Offsets are not contiguous!"
+    assert all('matrices' not in chunk and chunk['total'] == 3000 for chunk in chunks), "Only eigenvalues should be streamed!"
+    streamed = [values for chunk in chunks for values in chunk['eigenvalues']]
+
+    result = events[-1]
+    assert 'matrices' not in result, "Streamed results should default to lazy details!"
+    plain = client.post('/generate', json=payload).get_json()
+    assert streamed == plain['eigenvalues'], "Streamed eigenvalues differ from the result's eigenvalues!"
+    assert result['coordinates'] == plain['coordinates'], "Streamed coordinates differ!"
+    assert [values for event in cached if event['event'] == 'eigenvalues' for values in event['eigenvalues']] == streamed, "Cached stream differs!"
+    print(f"✓ {len(streamed)} spectra streamed in {len(chunks)} chunks before the coordinates, decomposed once")
+
+    preview = app_module.STREAM_PREVIEW_EIGENVALUES
+    try:
+        app_module.STREAM_PREVIEW_EIGENVALUES = 300
+        chunks = [event for event in stream(payload) if event['event'] == 'eigenvalues']
+    finally:
+        app_module.STREAM_PREVIEW_EIGENVALUES = preview
+    assert sum(len(chunk['eigenvalues']) for chunk in chunks) == 300 // size, "Large results should stream a capped preview!"
+    print(f"✓ Preview capped at {300 // size} of 3000 spectra")
+
+    response = client.post('/stream', json=dict(payload, algorithm='isomap'))
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert events[-1]['event'] == 'error' and events[-1]['status'] == 400, "Invalid requests should end with an error!"
+    print("✓ Failed analyses end the stream with an error")
+
+
+if __name__ == "__main__":
+    test_sampling_callback()
+    test_stream_endpoint()
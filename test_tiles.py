@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test script to verify density tiles of large results.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from tiles import TilePyramid, TILE_POINT_LIMIT
+
+
+def test_tile_pyramid():
+    """Test that tiles partition the points and aggregate dense tiles into bins."""
+    print("Testing tile pyramid...")
+
+    rng = np.random.default_rng(0)
+    coordinates = rng.normal(size=(20000, 2))
+    radius = rng.random(20000)
+    pyramid = TilePyramid(coordinates, radius)
+
+    top = pyramid.tile(0, [0, 0])
+    assert top['aggregated'] and top['count'] == 20000, "The level 0 tile should hold every point in bins!"
+    assert top['counts'].sum() == 20000 and len(top['counts']) <= 64 * 64, "Bins should hold every point once!"
+    # The first point of a bin is its first along the sorted first axis
+    order = np.argsort(coordinates[:, 0], kind='stable')
+    bins = np.minimum((coordinates - pyramid.low) / (pyramid.extent / 64), 63).astype(int)
+    flat = bins[order, 0] * 64 + bins[order, 1]
+    first = {}
+    for position in range(len(order) - 1, -1, -1):
+        first[flat[position]] = order[position]
+    assert list(top['indices']) == [first[key] for key in sorted(first)], "Bins should point at their first point!"
+    assert np.isclose((top['spectral_radius'] * top['counts']).sum(), radius.sum()), "Bin means should keep the total!"
+    print(f"✓ Level 0: {len(top['counts'])} bins for 20000 points")
+
+    level = 3
+    counts = [pyramid.tile(level, [x, y])['count'] for x in range(2 ** level) for y in range(2 ** level)]
+    assert sum(counts) == 20000, "Tiles of a level should partition the points!"
+    print(f"✓ Level {level} tiles partition the points")
+
+    deep = pyramid.tile(6, [32, 32])
+    assert not deep['aggregated'] and deep['count'] <= TILE_POINT_LIMIT, "Sparse tiles should send their points!"
+    assert np.allclose(coordinates[deep['indices']], deep['coordinates']), "Point indices should match coordinates!"
+    assert np.allclose(radius[deep['indices']], deep['spectral_radius']), "Point values should match!"
+    print(f"✓ Zoomed-in tile sends its {deep['count']} points")
+
+    cube = TilePyramid(rng.normal(size=(5000, 3)), rng.random(5000)).tile(0, [0, 0, 0])
+    assert cube['counts'].sum() == 5000 and cube['coordinates'].shape[1] == 3, "3D tiles should bin in 3D!"
+    try:
+        pyramid.tile(1, [2, 0])
+        assert False, "Tile outside the level should be refused!"
+    except ValueError:
+        pass
+    print("✓ 3D tiles and out-of-range tiles handled")
+
+
+def test_tiles_endpoints():
+    """Test the 'plot' modes of /generate and the tile endpoints."""
+    print("Testing tile endpoints...")
+    from app import app
+
+    size = 3
+    payload = {
+        'size': size,
+        'num_matrices': 3000,
+        'dimensionality': 2,
+        'cell_ranges': {f"{i},{j}": {'min': -3, 'max': 3, 'step': 0.5} for i in range(size) for j in range(size)},
+        'constraints': [],
+        'algorithm': 'pca',
+        'seed': 11,
+        'details': 'lazy',
+        'plot': 'tiles',
+        'store': False
+    }
+    client = app.test_client()
+
+    result = client.post('/generate', json=payload).get_json()
+    assert 'coordinates' not in result and result['tiles']['points'] == 3000, "Tiles should replace the coordinates!"
+    assert 'coordinates' in client.post('/generate', json=dict(payload, plot='auto')).get_json(), "Small results plot points!"
+    assert client.post('/generate', json=dict(payload, plot='heatmap')).status_code == 400, "Unknown plot mode should fail!"
+    print(f"✓ Result sent as tiles over {result['tiles']['low']} to {result['tiles']['high']}")
+
+    base = f"/embeddings/{result['embedding_id']}/tiles"
+    assert client.get(base).get_json()['bins'] == 64, "Summary should give the bins per tile!"
+    tile = client.get(f'{base}/0/0/0').get_json()
+    assert tile['aggregated'] and sum(tile['counts']) == 3000, "Level 0 tile should aggregate every point!"
+    details = client.get(f"/results/{result['result_id']}/details?indices={tile['indices'][0]}").get_json()
+    assert details['indices'] == [tile['indices'][0]] and len(details['matrices']) == 1, "Bin points should have details!"
+    assert client.get(f'{base}/1/0/5').status_code == 400, "Tile outside the level should fail!"
+    assert client.get('/embeddings/unknown/tiles/0/0/0').status_code == 404, "Unknown embedding should fail!"
+    print(f"✓ Tile endpoint returns {len(tile['counts'])} bins, with details of their points on demand")
+
+
+if __name__ == "__main__":
+    test_tile_pyramid()
+    test_tiles_endpoints()
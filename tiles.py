@@ -0,0 +1,114 @@
+"""
+Density tiles of reduced coordinates, so large results are plotted by screen area rather than point count
+
+The bounding box of the coordinates is split into 2^level tiles along every
+axis at each zoom level, and every tile into a fixed grid of bins. A tile
+holding few points is sent as those points; otherwise each non-empty bin is
+sent as one marker at the centroid of its points, with the number of points
+and their mean spectral radius. A client draws the tiles covering its view
+at the level matching its zoom, so it never holds more markers than a few
+tiles' bins, and fetches the details of a point when it is clicked.
+"""
+import numpy as np
+
+# Bins along each axis of a tile; 3D tiles are coarser since their bins grow with the cube
+TILE_BINS = {2: 64, 3: 24}
+# Deepest zoom level; tiles stop splitting once they are sent as points anyway
+MAX_TILE_LEVEL = 16
+# Tiles with at most this many points send the points themselves instead of bins
+TILE_POINT_LIMIT = 2000
+# With plot 'auto', results with more points than this are sent as tiles instead of coordinates
+AUTO_TILES_POINTS = 50000
+PLOT_MODES = ('points', 'tiles', 'auto')
+
+
+def spectral_radius(eigenvalues):
+    """Largest eigenvalue modulus of each matrix"""
+    return np.abs(eigenvalues).max(axis=1)
+
+
+def use_tiles(plot_mode, points, dimensionality):
+    """Whether a result is sent as tiles under the requested plot mode; 'auto' falls back to points when it cannot be tiled"""
+    if dimensionality not in TILE_BINS:
+        return False
+    return plot_mode == 'tiles' or (plot_mode == 'auto' and points > AUTO_TILES_POINTS)
+
+
+class TilePyramid:
+    """Tiles of one embedding's coordinates at every zoom level, aggregated on request
+
+    Points are kept sorted along the first axis, so a tile's points are
+    found with a binary search and a mask over that slice.
+    """
+
+    def __init__(self, coordinates, radius):
+        coordinates = np.asarray(coordinates, dtype=float)
+        self.dimensionality = coordinates.shape[1]
+        if self.dimensionality not in TILE_BINS:
+            raise ValueError(f'Tiles need 2D or 3D coordinates, not {self.dimensionality}D')
+        self.bins = TILE_BINS[self.dimensionality]
+        self.low = coordinates.min(axis=0) if len(coordinates) else np.zeros(self.dimensionality)
+        high = coordinates.max(axis=0) if len(coordinates) else np.ones(self.dimensionality)
+        # A flat axis still gets a positive extent, so every point falls in a tile
+        self.extent = np.maximum(high - self.low, 1e-9)
+        self.order = np.argsort(coordinates[:, 0], kind='stable')
+        self.coordinates = coordinates[self.order]
+        self.radius = np.asarray(radius, dtype=float)[self.order]
+
+    def summary(self):
+        """Bounds and grid sizes a client needs to choose its tiles, as sent in the 'tiles' response field"""
+        return {
+            'dimensionality': self.dimensionality,
+            'points': len(self.coordinates),
+            'low': self.low.tolist(),
+            'high': (self.low + self.extent).tolist(),
+            'bins': self.bins,
+            'max_level': MAX_TILE_LEVEL,
+            'point_limit': TILE_POINT_LIMIT
+        }
+
+    def tile(self, level, index):
+        """Points or bin aggregates of one tile
+
+        Returns a dict with 'coordinates', 'counts', 'indices' (the point,
+        or the first point of the bin, for fetching details) and
+        'spectral_radius' (the point's, or the bin's mean), plus 'aggregated'
+        telling bins from points. Raises ValueError for tiles outside the pyramid.
+        """
+        tiles = 2 ** level
+        index = np.asarray(index, dtype=int)
+        if not 0 <= level <= MAX_TILE_LEVEL:
+            raise ValueError(f'Tile level must be between 0 and {MAX_TILE_LEVEL}')
+        if len(index) != self.dimensionality or np.any(index < 0) or np.any(index >= tiles):
+            raise ValueError(f'Tile indices must be {self.dimensionality} integers between 0 and {tiles - 1}')
+
+        edge = self.extent / tiles
+        tile_low = self.low + index * edge
+        # Candidates along the sorted first axis, widened against rounding, then the exact tile of each
+        margin = edge[0] * 1e-6
+        start = np.searchsorted(self.coordinates[:, 0], tile_low[0] - margin, side='left')
+        stop = np.searchsorted(self.coordinates[:, 0], tile_low[0] + edge[0] + margin, side='right')
+        coords = self.coordinates[start:stop]
+        cells = np.clip(((coords - self.low) / edge).astype(int), 0, tiles - 1)
+        inside = np.flatnonzero(np.all(cells == index, axis=1))
+        coords = coords[inside]
+        points = start + inside
+        info = {'level': level, 'tile': index.tolist(), 'low': tile_low.tolist(), 'high': (tile_low + edge).tolist(),
+                'count': len(points)}
+
+        if len(points) <= TILE_POINT_LIMIT:
+            return dict(info, aggregated=False, coordinates=coords, counts=np.ones(len(points), dtype=int),
+                        indices=self.order[points], spectral_radius=self.radius[points])
+
+        bins = np.clip(((coords - tile_low) / (edge / self.bins)).astype(int), 0, self.bins - 1)
+        flat = np.ravel_multi_index(bins.T, (self.bins,) * self.dimensionality)
+        grid = self.bins ** self.dimensionality
+        counts = np.bincount(flat, minlength=grid)
+        filled = np.flatnonzero(counts)
+        centroids = np.column_stack([np.bincount(flat, weights=coords[:, axis], minlength=grid)[filled]
+                                     for axis in range(self.dimensionality)]) / counts[filled, None]
+        radius = np.bincount(flat, weights=self.radius[points], minlength=grid)[filled] / counts[filled]
+        # Each bin's first point in the tile's order; unique bins come out ascending, matching filled
+        _, first = np.unique(flat, return_index=True)
+        return dict(info, aggregated=True, coordinates=centroids, counts=counts[filled], indices=self.order[points[first]],
+                    spectral_radius=radius)